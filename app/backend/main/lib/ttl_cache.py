@@ -0,0 +1,70 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import hashlib
+import logging
+import time
+from typing import Hashable, Optional
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    expires_at: float
+
+
+@dataclass
+class TtlLruCache:
+    """
+    シリアライズ済みのレスポンスを保持するLRU + TTLのキャッシュ。
+    イベントループ上からのみ触る前提のためロックは持たない。
+    """
+
+    maxsize: int = 1024
+    ttl: float = 30.0
+    entries: OrderedDict = field(default_factory=OrderedDict, repr=False)
+    hits: int = 0
+    misses: int = 0
+
+    logger = logging.getLogger(__name__)
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        entry = self.entries.get(key)
+        if entry is None or entry.expires_at < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Hashable, body: bytes) -> CachedResponse:
+        entry = CachedResponse(
+            body=body,
+            etag=self.etag_of(body),
+            expires_at=time.monotonic() + self.ttl,
+        )
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        self.entries.clear()
+
+    @staticmethod
+    def etag_of(body: bytes) -> str:
+        return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+    @staticmethod
+    def matches(if_none_match: Optional[str], etag: str) -> bool:
+        """If-None-Matchヘッダ(複数指定・弱いETag・*を含む)がetagに一致するか"""
+        if not if_none_match:
+            return False
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in [
+            tag.removeprefix("W/") for tag in candidates
+        ]
@@ -1,6 +1,12 @@
 from fastapi import FastAPI
 
+from backend.main.router import documents, files, metrics
+
 app = FastAPI()
+app.middleware("http")(metrics.measure_request)
+app.include_router(documents.router)
+app.include_router(files.router)
+app.include_router(metrics.router)
 
 
 @app.get("/")
@@ -0,0 +1,155 @@
+import asyncio
+import base64
+from dataclasses import asdict
+from datetime import datetime
+from functools import lru_cache
+import json
+from typing import Annotated, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+
+from backend.main.lib.ttl_cache import CachedResponse, TtlLruCache
+from db.main.lib.catalog import DocumentCatalog
+from db.main.model.edinet.edinet_enums import DocType
+
+catalog_path = "edinet-document/catalog.sqlite3"
+
+router = APIRouter(prefix="/documents", tags=["documents"])
+response_cache = TtlLruCache(maxsize=1024, ttl=30.0)
+
+YYYYMMDD = r"^\d{8}$"
+
+
+@lru_cache
+def get_catalog() -> DocumentCatalog:
+    return DocumentCatalog(path=catalog_path)
+
+
+def encode_cursor(item: dict) -> str:
+    raw = json.dumps([item["submitDateTime"], item["docID"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        submit_date_time, doc_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return str(submit_date_time), str(doc_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def check_date(name: str, value: Optional[str]):
+    """YYYYMMDDの形でも存在しない日付(20240230など)は受け付けない"""
+    if value is None:
+        return
+    try:
+        datetime.strptime(value, "%Y%m%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"invalid date: {name}")
+
+
+def cached_response(request: Request, entry: CachedResponse) -> Response:
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": f"private, max-age={int(response_cache.ttl)}",
+    }
+    if TtlLruCache.matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+async def respond(request: Request, build) -> Response:
+    """同じクエリはシリアライズ済みの応答をメモリから返し、なければbuildで作ってキャッシュする"""
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    entry = response_cache.get(key)
+    if entry is None:
+        # SQLiteへの問い合わせはイベントループを塞がないようスレッドで行う
+        payload = await asyncio.to_thread(build)
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        entry = response_cache.put(key, body)
+    return cached_response(request, entry)
+
+
+@router.get("")
+async def search_documents(
+    request: Request,
+    catalog: Annotated[DocumentCatalog, Depends(get_catalog)],
+    edinet_code: Optional[str] = None,
+    sec_code: Annotated[Optional[str], Query(pattern=r"^\d{4,5}$")] = None,
+    doc_type_code: Optional[str] = None,
+    ordinance_code: Optional[str] = None,
+    submitted_from: Annotated[Optional[str], Query(pattern=YYYYMMDD)] = None,
+    submitted_to: Annotated[Optional[str], Query(pattern=YYYYMMDD)] = None,
+    period_from: Annotated[Optional[str], Query(pattern=YYYYMMDD)] = None,
+    period_to: Annotated[Optional[str], Query(pattern=YYYYMMDD)] = None,
+    has: Annotated[Optional[list[DocType]], Query()] = None,
+    cursor: Optional[str] = None,
+    limit: Annotated[int, Query(ge=1, le=500)] = 100,
+):
+    """
+    取り込み済みの書類を提出日時の新しい順に検索する。
+    次のページは応答のnext_cursorをcursorに渡して取得する(キーセットページング)。
+    """
+    after = decode_cursor(cursor) if cursor else None
+    # 提出日の範囲はsubmitted_fromの0時からsubmitted_toの翌日0時未満
+    check_date("submitted_from", submitted_from)
+    check_date("submitted_to", submitted_to)
+
+    def build():
+        # 次のページの有無を知るため1件多く取得する
+        items = catalog.search(
+            edinet_code=edinet_code,
+            sec_code=sec_code,
+            doc_type_code=doc_type_code,
+            ordinance_code=ordinance_code,
+            submitted_from=submitted_from,
+            submitted_to=submitted_to,
+            period_from=period_from,
+            period_to=period_to,
+            has=has,
+            after=after,
+            limit=limit + 1,
+        )
+        page = items[:limit]
+        return {
+            "results": page,
+            "count": len(page),
+            "next_cursor": encode_cursor(page[-1]) if len(items) > limit else None,
+        }
+
+    return await respond(request, build)
+
+
+@router.get("/search")
+async def search_documents_text(
+    request: Request,
+    catalog: Annotated[DocumentCatalog, Depends(get_catalog)],
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    field: Optional[Literal["filerName", "docDescription"]] = None,
+    limit: Annotated[int, Query(ge=1, le=500)] = 100,
+):
+    """
+    企業名・書類名の全文検索。空白区切りの語をすべて含む書類を関連度の高い順に返す。
+    一致が多すぎる場合は新しい方から一定件数だけを順位付けし、completeをfalseにする。
+    """
+
+    def build():
+        items, complete = catalog.search_text(q, field=field, limit=limit)
+        return {"results": items, "count": len(items), "complete": complete}
+
+    return await respond(request, build)
+
+
+@router.get("/{doc_id}")
+async def get_document(
+    request: Request,
+    doc_id: str,
+    catalog: Annotated[DocumentCatalog, Depends(get_catalog)],
+):
+    def build():
+        item = catalog.get(doc_id)
+        if item is None:
+            raise HTTPException(status_code=404, detail=f"{doc_id} is not found")
+        return asdict(item)
+
+    return await respond(request, build)
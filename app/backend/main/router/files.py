@@ -0,0 +1,177 @@
+import asyncio
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+import logging
+import os
+from typing import Annotated, Optional
+
+import boto3
+from botocore.exceptions import ClientError
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+
+from backend.main.lib.ttl_cache import TtlLruCache
+from backend.main.router.documents import get_catalog
+from db.main.lib.catalog import DocumentCatalog
+from db.main.model.edinet.document_item import FileInfo
+from db.main.model.edinet.edinet_enums import DocType
+
+router = APIRouter(prefix="/documents", tags=["files"])
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+# S3のget_objectにそのまま渡せる条件付きリクエストのヘッダ
+S3_CONDITIONS = {
+    "range": "Range",
+    "if-range": "IfMatch",
+    "if-none-match": "IfNoneMatch",
+    "if-modified-since": "IfModifiedSince",
+}
+S3_HEADERS = {
+    "ContentLength": "content-length",
+    "ContentRange": "content-range",
+    "ETag": "etag",
+    "LastModified": "last-modified",
+}
+
+
+@lru_cache
+def get_s3_client(region_name: str):
+    return boto3.client("s3", region_name=region_name)
+
+
+def parse_cloudpath(cloudpath: str) -> tuple[str, str, str]:
+    """s3://{bucket}.s3.{region}.amazonaws.com/{key} -> (bucket, region, key)"""
+    host, key = cloudpath.removeprefix("s3://").split("/", 1)
+    bucket, region = host.removesuffix(".amazonaws.com").split(".s3.", 1)
+    return bucket, region, key
+
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        return TtlLruCache.matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def local_file_response(request: Request, path: str, filename: str) -> Response:
+    """
+    ローカルのzipを返す。Range/If-RangeはFileResponseが処理し、ファイルは一定サイズずつ読み出す
+    (サーバがhttp.response.pathsendに対応していればsendfileで送られる)。
+    """
+    stat_result = os.stat(path)
+    response = FileResponse(
+        path,
+        media_type="application/zip",
+        filename=filename,
+        stat_result=stat_result,
+    )
+    response.chunk_size = CHUNK_SIZE
+    if is_not_modified(request, response.headers["etag"], stat_result.st_mtime):
+        return Response(
+            status_code=304,
+            headers={
+                "etag": response.headers["etag"],
+                "last-modified": response.headers["last-modified"],
+            },
+        )
+    return response
+
+
+async def s3_file_response(request: Request, cloudpath: str, filename: str):
+    """S3のzipを一定サイズずつ中継する。Rangeと条件付きリクエストはS3に委ねる"""
+    bucket, region, key = parse_cloudpath(cloudpath)
+    params = {"Bucket": bucket, "Key": key}
+    for header, param in S3_CONDITIONS.items():
+        value = request.headers.get(header)
+        if value is None:
+            continue
+        if param == "IfModifiedSince":
+            try:
+                value = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                continue
+        elif param == "IfMatch" and (
+            "range" not in request.headers or not value.strip().startswith('"')
+        ):
+            continue  # Rangeがない・日付形式のIf-Rangeは無視して全体を返す
+        params[param] = value
+
+    try:
+        obj = await asyncio.to_thread(get_s3_client(region).get_object, **params)
+    except ClientError as e:
+        status = e.response["ResponseMetadata"]["HTTPStatusCode"]
+        if status == 304:
+            return Response(status_code=304)
+        if status == 412:
+            # If-Rangeが一致しなければ全体を返す
+            params.pop("Range", None)
+            params.pop("IfMatch", None)
+            obj = await asyncio.to_thread(get_s3_client(region).get_object, **params)
+        elif status == 416:
+            raise HTTPException(status_code=416, detail="range not satisfiable")
+        elif status == 404:
+            raise HTTPException(status_code=404, detail=f"{cloudpath} is not found")
+        else:
+            raise
+
+    headers = {
+        "accept-ranges": "bytes",
+        "content-disposition": f'attachment; filename="{filename}"',
+    }
+    for name, header in S3_HEADERS.items():
+        if obj.get(name) is None:
+            continue
+        value = obj[name]
+        headers[header] = (
+            value.strftime("%a, %d %b %Y %H:%M:%S GMT")
+            if name == "LastModified"
+            else str(value)
+        )
+
+    def chunks():
+        # StreamingResponseが同期イテレータをスレッドプールで回す
+        try:
+            yield from obj["Body"].iter_chunks(CHUNK_SIZE)
+        finally:
+            obj["Body"].close()
+
+    return StreamingResponse(
+        chunks(),
+        status_code=206 if obj.get("ContentRange") else 200,
+        media_type="application/zip",
+        headers=headers,
+    )
+
+
+@router.get("/{doc_id}/files/{doc_type}")
+async def get_document_file(
+    request: Request,
+    doc_id: str,
+    doc_type: DocType,
+    catalog: Annotated[DocumentCatalog, Depends(get_catalog)],
+):
+    """
+    取り込み済みの書類のzipを返す。手元(work_dir)にあればローカルから、なければS3から中継する。
+    """
+    item = await asyncio.to_thread(catalog.get, doc_id)
+    info: Optional[FileInfo] = item.get_info(doc_type) if item else None
+    if info is None:
+        raise HTTPException(
+            status_code=404, detail=f"{doc_id} doesn't have {doc_type.name}"
+        )
+
+    filename = f"{doc_id}_{doc_type.name}.zip"
+    if info.filepath and os.path.isfile(info.filepath):
+        return local_file_response(request, info.filepath, filename)
+    if info.cloudpath:
+        logger.info(f"[FALLBACK] {info.filepath} is not found. stream from S3.")
+        return await s3_file_response(request, info.cloudpath, filename)
+    raise HTTPException(status_code=404, detail=f"{info.filepath} is not found")
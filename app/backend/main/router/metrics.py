@@ -0,0 +1,64 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+
+from common.main.lib.metrics import METRICS, render
+
+router = APIRouter(tags=["metrics"])
+logger = logging.getLogger(__name__)
+
+# 取り込み(db.main.main)が実行ごとに書き出す最新のメトリクス
+last_run_path = "edinet-document/metrics/latest.json"
+
+METRICS.describe("http_request_seconds", "Time spent serving API requests.")
+METRICS.describe("last_run_finished_timestamp_seconds", "When the last run finished.")
+METRICS.describe("last_run_elapsed_seconds", "Wall time of the last run.")
+
+
+def read_last_run() -> Optional[dict]:
+    try:
+        with open(last_run_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        logger.error(f"[SKIP] failed to read {last_run_path}: {e}")
+        return None
+
+
+async def measure_request(request: Request, call_next):
+    """APIの処理時間をルート(パスのテンプレート)ごとに記録するミドルウェア"""
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    METRICS.observe(
+        "http_request_seconds",
+        time.perf_counter() - started,
+        route=getattr(route, "path", "unmatched"),
+        method=request.method,
+        status=response.status_code,
+    )
+    return response
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus形式のメトリクス。バックエンド自身のものに、最新の取り込みの実行分を合わせて返す。
+    """
+    snapshots = []
+    last_run = await asyncio.to_thread(read_last_run)
+    if last_run:
+        METRICS.set("last_run_finished_timestamp_seconds", last_run["finished_at"])
+        if last_run["elapsed_seconds"] is not None:
+            METRICS.set("last_run_elapsed_seconds", last_run["elapsed_seconds"])
+        snapshots.append(last_run["metrics"])
+    return PlainTextResponse(
+        render(METRICS.snapshot(), *snapshots),
+        media_type="text/plain; version=0.0.4",
+    )
@@ -0,0 +1,85 @@
+import atexit
+from collections import Counter
+from dataclasses import dataclass, field
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import math
+from queue import SimpleQueue
+import threading
+import time
+from typing import Optional
+
+from common.main.lib.metrics import METRICS
+
+
+def use_queue_logging() -> Optional[QueueListener]:
+    """
+    ルートロガーのハンドラを別スレッドで動かす。
+    ログを出す側はキューに積むだけになり、端末やファイルへの書き込みでイベントループが止まらない。
+    キューに残ったログはプロセスの終了時に書き出す。
+    """
+    root = logging.getLogger()
+    if any(isinstance(handler, QueueHandler) for handler in root.handlers):
+        return None
+
+    queue = SimpleQueue()
+    listener = QueueListener(queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [QueueHandler(queue)]
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+@dataclass
+class SkipCounter:
+    """
+    除外した件数を理由ごとに数える。行ごとにログを出す代わりに、report()でまとめて1行出す。
+    個々の除外はDEBUGレベルのときだけ出す。
+    """
+
+    logger: logging.Logger
+    counts: Counter = field(default_factory=Counter)
+
+    def skip(self, reason: str, key: Optional[str] = None):
+        self.counts[reason] += 1
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"[SKIP] {key} {reason}")
+
+    def report(self, prefix: str = ""):
+        for reason, count in self.counts.items():
+            METRICS.inc("skipped_total", count, reason=reason)
+        if self.counts:
+            summary = " ".join(
+                f"{reason}={count}" for reason, count in self.counts.items()
+            )
+            self.logger.info(f"[SKIP] {prefix}{summary}")
+
+
+@dataclass
+class SampledLog:
+    """
+    同じ種類のログをinterval秒に1回だけ出す(ファイルごとの完了ログなど)。
+    間引いた件数は次に出す行に付ける。
+    """
+
+    logger: logging.Logger
+    interval: float = 5.0
+    level: int = logging.INFO
+
+    emitted_at: float = field(default=-math.inf, init=False)
+    suppressed: int = field(default=0, init=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    def __call__(self, message: str):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        now = time.monotonic()
+        with self.lock:
+            if now - self.emitted_at < self.interval:
+                self.suppressed += 1
+                return
+            suppressed, self.suppressed = self.suppressed, 0
+            self.emitted_at = now
+        if suppressed:
+            message = f"{message} (+{suppressed} similar)"
+        self.logger.log(self.level, message)
@@ -0,0 +1,269 @@
+from bisect import bisect_left
+from dataclasses import dataclass, field
+import json
+import math
+import os
+import threading
+import time
+from typing import Optional
+
+# 処理時間のヒストグラムの境界(秒)。API呼び出し1回〜日次の取り込み全体までを収める
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+    1800.0,
+)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def to_labels(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+@dataclass
+class Histogram:
+    buckets: tuple[float, ...] = LATENCY_BUCKETS
+    counts: list[int] = field(default_factory=list)
+    sum: float = 0.0
+    count: int = 0
+
+    def __post_init__(self):
+        if not self.counts:
+            self.counts = [0] * (len(self.buckets) + 1)  # 末尾は+Inf
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """バケット内を線形補間した分位点の推定値"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i >= len(self.buckets):
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+@dataclass
+class MetricsRegistry:
+    """
+    プロセス内のメトリクス(カウンタ・ゲージ・ヒストグラム)。
+    ストラテジはスレッドからも呼ばれるため、更新はロックの中で行う。
+    snapshot()はJSONにできる辞書を返し、render()でPrometheusのテキスト形式にする。
+    """
+
+    namespace: str = "irir"
+
+    counters: dict[str, dict[Labels, float]] = field(default_factory=dict, init=False)
+    gauges: dict[str, dict[Labels, float]] = field(default_factory=dict, init=False)
+    histograms: dict[str, dict[Labels, Histogram]] = field(
+        default_factory=dict, init=False
+    )
+    descriptions: dict[str, str] = field(default_factory=dict, init=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    def describe(self, name: str, description: str):
+        self.descriptions[name] = description
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = to_labels(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self.lock:
+            self.gauges.setdefault(name, {})[to_labels(labels)] = value
+
+    def add(self, name: str, value: float, **labels):
+        """ゲージを増減する(実行中の件数など)"""
+        key = to_labels(labels)
+        with self.lock:
+            series = self.gauges.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = to_labels(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def snapshot(self) -> dict:
+        """{name: {"type", "help", "samples"}} 形式の写し"""
+        with self.lock:
+            families = {}
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+                for name, series in metrics.items():
+                    families[f"{self.namespace}_{name}"] = {
+                        "type": kind,
+                        "help": self.descriptions.get(name, name),
+                        "samples": [
+                            {"labels": dict(key), "value": value}
+                            for key, value in series.items()
+                        ],
+                    }
+            for name, series in self.histograms.items():
+                families[f"{self.namespace}_{name}"] = {
+                    "type": "histogram",
+                    "help": self.descriptions.get(name, name),
+                    "buckets": list(LATENCY_BUCKETS),
+                    "samples": [
+                        {
+                            "labels": dict(key),
+                            "counts": list(histogram.counts),
+                            "sum": histogram.sum,
+                            "count": histogram.count,
+                        }
+                        for key, histogram in series.items()
+                    ],
+                }
+        return families
+
+    def summary(self, started_at: Optional[float] = None) -> dict:
+        """
+        実行の終わりに保存するJSON。snapshotに加えて、
+        どこで時間を使ったかを見るためにメソッドごとの合計時間・p50・p99を合計時間の降順で並べる。
+        """
+        snapshot = self.snapshot()
+        timings = []
+        for sample in snapshot.get(f"{self.namespace}_method_seconds", {}).get(
+            "samples", []
+        ):
+            histogram = Histogram(
+                counts=sample["counts"], sum=sample["sum"], count=sample["count"]
+            )
+            timings.append(
+                sample["labels"]
+                | {
+                    "calls": histogram.count,
+                    "total_seconds": round(histogram.sum, 3),
+                    "p50_seconds": histogram.quantile(0.5),
+                    "p99_seconds": histogram.quantile(0.99),
+                }
+            )
+        timings.sort(key=lambda timing: timing["total_seconds"], reverse=True)
+
+        finished_at = time.time()
+        return {
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "elapsed_seconds": (
+                round(finished_at - started_at, 3) if started_at else None
+            ),
+            "timings": timings,
+            "metrics": snapshot,
+        }
+
+    def write_summary(self, path: str, started_at: Optional[float] = None) -> dict:
+        summary = self.summary(started_at=started_at)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return summary
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = (f'{key}="{escape(str(value))}"' for key, value in sorted(labels.items()))
+    return "{" + ",".join(pairs) + "}"
+
+
+def render(*snapshots: dict) -> str:
+    """snapshot(複数可)をPrometheusのテキスト形式(0.0.4)にする。同名のメトリクスは系列をまとめる"""
+    families: dict[str, dict] = {}
+    for snapshot in snapshots:
+        for name, family in snapshot.items():
+            if name in families:
+                families[name] = families[name] | {
+                    "samples": families[name]["samples"] + family["samples"]
+                }
+            else:
+                families[name] = family
+
+    lines = []
+    for name, family in families.items():
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        if family["type"] != "histogram":
+            for sample in family["samples"]:
+                lines.append(
+                    f"{name}{format_labels(sample['labels'])} {format_value(sample['value'])}"
+                )
+            continue
+        bounds = [*family["buckets"], math.inf]
+        for sample in family["samples"]:
+            cumulative = 0
+            for bound, count in zip(bounds, sample["counts"]):
+                cumulative += count
+                labels = sample["labels"] | {"le": format_value(bound)}
+                lines.append(f"{name}_bucket{format_labels(labels)} {cumulative}")
+            labels = format_labels(sample["labels"])
+            lines.append(f"{name}_sum{labels} {format_value(sample['sum'])}")
+            lines.append(f"{name}_count{labels} {sample['count']}")
+    return "\n".join(lines) + "\n"
+
+
+# プロセス全体で共有する
+METRICS = MetricsRegistry()
+METRICS.describe("method_seconds", "Time spent in strategy methods.")
+METRICS.describe("method_in_flight", "Strategy method calls in progress.")
+METRICS.describe("method_errors_total", "Strategy method calls that raised.")
+METRICS.describe("download_bytes_total", "Bytes downloaded from EDINET.")
+METRICS.describe("download_resumed_total", "Downloads resumed with a Range request.")
+METRICS.describe(
+    "download_resumed_bytes_total", "Bytes not downloaded again thanks to resuming."
+)
+METRICS.describe("download_dropped_total", "Files skipped by the download policy.")
+METRICS.describe("upload_bytes_total", "Bytes uploaded to S3.")
+METRICS.describe("pipeline_items_total", "Items handled by each pipeline stage.")
+METRICS.describe("pipeline_queue_depth", "Items waiting for each pipeline stage.")
+METRICS.describe("retries_total", "Retries scheduled by the retry policy.")
+METRICS.describe("skipped_total", "Documents skipped, by reason.")
+METRICS.describe("circuit_open_total", "Calls rejected by an open circuit breaker.")
+METRICS.describe(
+    "ingested_index_lookups_total",
+    "Documents looked up in the ingested-key bloom filter, by result.",
+)
+METRICS.describe("work_units_total", "Distributed work units handled, by outcome.")
@@ -0,0 +1,178 @@
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+import logging
+import time
+from typing import Optional
+
+
+@dataclass
+class RateLimitTicket:
+    """slot()で払い出す1リクエスト分の記録。応答ヘッダを受け取った時点でobserve()する"""
+
+    started_at: float
+    status: Optional[int] = None
+    latency: Optional[float] = None
+    retry_after: Optional[float] = None
+
+    def observe(self, status: int, retry_after: Optional[float] = None):
+        self.status = status
+        self.latency = time.monotonic() - self.started_at
+        self.retry_after = retry_after
+
+
+@dataclass
+class AdaptiveRateLimiter:
+    """
+    トークンバケットと同時実行数の上限を組み合わせたレートリミッタ。
+    応答を見てAIMDで流量を調整する。
+    - 429/5xx・通信エラー・レイテンシの悪化: rateと同時実行数を乗算で減らす
+    - 健全な応答: rateと同時実行数を加算で戻す
+    """
+
+    rate: float = 3.0  # 1秒あたりのリクエスト数(初期値)
+    min_rate: float = 0.5
+    max_rate: float = 10.0
+    max_in_flight: int = 8
+    additive_increase: float = 1.0  # 1秒分の健全な応答ごとに増やすrate
+    multiplicative_decrease: float = 0.5
+    latency_factor: float = 3.0  # ベースラインの何倍のレイテンシで混雑とみなすか
+    cooldown: float = 1.0  # 同じ混雑で何度も減速しないための最小間隔(秒)
+
+    logger = logging.getLogger(__name__)
+
+    _tokens: float = field(default=1.0, init=False)
+    _refilled_at: float = field(default_factory=time.monotonic, init=False)
+    _paused_until: float = field(default=0.0, init=False)
+    _decreased_at: float = field(default=0.0, init=False)
+    _latency_baseline: Optional[float] = field(default=None, init=False)
+    _in_flight: int = field(default=0, init=False)
+    _in_flight_limit: float = field(default=0.0, init=False)
+    _condition: asyncio.Condition = field(default_factory=asyncio.Condition, init=False)
+    _token_lock: asyncio.Lock = field(default_factory=asyncio.Lock, init=False)
+
+    def __post_init__(self):
+        self._in_flight_limit = float(self.max_in_flight)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def in_flight_limit(self) -> int:
+        return int(self._in_flight_limit)
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        同時実行枠とトークンを確保してからリクエストを実行させる。
+        ブロックを抜けた時点の結果(例外を含む)をAIMDの入力として記録する。
+        """
+        await self.acquire()
+        ticket = RateLimitTicket(started_at=time.monotonic())
+        try:
+            yield ticket
+        except Exception as e:
+            status = ticket.status or getattr(e, "status", None)
+            self.record(status=status, latency=self._latency_of(ticket))
+            raise
+        else:
+            self.record(
+                status=ticket.status or 200,
+                latency=self._latency_of(ticket),
+                retry_after=ticket.retry_after,
+            )
+        finally:
+            await self.release()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self._in_flight < int(self._in_flight_limit)
+            )
+            self._in_flight += 1
+        try:
+            await self._take_token()
+        except BaseException:
+            await self.release()
+            raise
+
+    async def release(self):
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def record(
+        self,
+        status: Optional[int],
+        latency: float,
+        retry_after: Optional[float] = None,
+    ):
+        """応答結果を受け取りrateを調整する。statusがNoneなら通信エラーとみなす"""
+        throttled = status is None or status == 429 or status >= 500
+        congested = (
+            self._latency_baseline is not None
+            and latency > self._latency_baseline * self.latency_factor
+        )
+
+        if throttled or congested:
+            self._decrease(status=status, latency=latency, retry_after=retry_after)
+            return
+
+        # ベースラインは健全な応答のみで更新する(EWMA)
+        if self._latency_baseline is None:
+            self._latency_baseline = latency
+        else:
+            self._latency_baseline = 0.9 * self._latency_baseline + 0.1 * latency
+        self._increase()
+
+    def _increase(self):
+        self.rate = min(self.max_rate, self.rate + self.additive_increase / self.rate)
+        self._in_flight_limit = min(
+            float(self.max_in_flight),
+            self._in_flight_limit + 1.0 / self._in_flight_limit,
+        )
+
+    def _decrease(
+        self, status: Optional[int], latency: float, retry_after: Optional[float]
+    ):
+        now = time.monotonic()
+        if retry_after:
+            self._paused_until = max(self._paused_until, now + retry_after)
+        if now - self._decreased_at < self.cooldown:
+            return
+
+        self._decreased_at = now
+        self.rate = max(self.min_rate, self.rate * self.multiplicative_decrease)
+        self._in_flight_limit = max(
+            1.0, self._in_flight_limit * self.multiplicative_decrease
+        )
+        self._tokens = min(self._tokens, 0.0)
+        self.logger.warning(
+            f"[THROTTLE] status={status} latency={latency:.2f}s -> "
+            f"rate={self.rate:.2f}/s in_flight_limit={self.in_flight_limit}"
+        )
+
+    async def _take_token(self):
+        async with self._token_lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                burst = max(1.0, self.rate)
+                self._tokens = min(
+                    burst, self._tokens + (now - self._refilled_at) * self.rate
+                )
+                self._refilled_at = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+    @staticmethod
+    def _latency_of(ticket: RateLimitTicket) -> float:
+        if ticket.latency is not None:
+            return ticket.latency
+        return time.monotonic() - ticket.started_at
@@ -0,0 +1,324 @@
+import asyncio
+from dataclasses import dataclass, field
+from functools import wraps
+import inspect
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+import aiohttp
+from botocore.exceptions import (
+    ClientError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    HTTPClientError,
+)
+from tenacity import (
+    RetryCallState,
+    retry,
+    stop_after_attempt,
+)
+
+from common.main.lib.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# 混雑・一時的な障害を表すHTTPステータスとAWSのエラーコード
+TRANSIENT_STATUSES = frozenset({429, 500, 502, 503, 504})
+THROTTLING_CODES = frozenset(
+    {
+        "Throttling",
+        "ThrottlingException",
+        "ThrottledException",
+        "TooManyRequestsException",
+        "ProvisionedThroughputExceededException",
+        "RequestLimitExceeded",
+        "RequestThrottled",
+        "SlowDown",
+    }
+)
+TRANSIENT_CODES = THROTTLING_CODES | {
+    "InternalError",
+    "InternalServerError",
+    "InternalFailure",
+    "ServiceUnavailable",
+    "TransactionInProgressException",
+}
+
+
+class CircuitOpenError(Exception):
+    """サーキットブレーカーが開いている間、リクエストを送らずに失敗させる"""
+
+
+def status_of(error: BaseException) -> Optional[int]:
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status
+    if isinstance(error, ClientError):
+        return error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return None
+
+
+def is_transient(error: BaseException) -> bool:
+    """時間を置けば成功する見込みのある失敗か"""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code")
+        return code in TRANSIENT_CODES or (status_of(error) or 0) >= 500
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in TRANSIENT_STATUSES
+    return isinstance(
+        error,
+        (
+            aiohttp.ClientConnectionError,
+            aiohttp.ClientPayloadError,
+            HTTPClientError,
+            TimeoutError,
+            asyncio.TimeoutError,
+        ),
+    )
+
+
+def is_unsent(error: BaseException) -> bool:
+    """
+    リクエストが処理されていないことが確実な失敗か(非冪等な操作はこの場合だけ再試行する)。
+    接続できなかった・スロットリングで拒否された、のいずれか。
+    """
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in THROTTLING_CODES
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429
+    return isinstance(
+        error,
+        (aiohttp.ClientConnectorError, EndpointConnectionError, ConnectTimeoutError),
+    )
+
+
+def retry_after_of(error: BaseException) -> Optional[float]:
+    """Retry-Afterヘッダ(秒数指定のみ対応)を読み取る"""
+    headers = getattr(error, "headers", None)
+    if isinstance(error, ClientError):
+        headers = error.response.get("ResponseMetadata", {}).get("HTTPHeaders")
+    value = (headers or {}).get("Retry-After") or (headers or {}).get("retry-after")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+@dataclass
+class DecorrelatedJitter:
+    """
+    Decorrelated Jitterによる待ち時間。前回の待ち時間の3倍までの範囲からランダムに選ぶため、
+    同時に失敗した大量のリクエストが同じタイミングで再試行しない。
+    """
+
+    base: float = 0.5
+    cap: float = 30.0
+    previous: float = field(default=0.0, init=False)
+
+    def next(self) -> float:
+        self.previous = min(
+            self.cap, random.uniform(self.base, max(self.base, self.previous * 3))
+        )
+        return self.previous
+
+
+@dataclass
+class RetryBudget:
+    """
+    再試行に使えるトークンの残量。再試行のたびにretry_costを消費し、成功のたびにrefillだけ戻す。
+    障害時に再試行が増幅して相手をさらに混雑させないよう、全呼び出しで共有する。
+    """
+
+    capacity: float
+    retry_cost: float = 5.0
+    refill: float = 1.0
+    tokens: float = field(default=0.0, init=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    def __post_init__(self):
+        self.tokens = self.capacity
+
+    def acquire(self) -> bool:
+        with self.lock:
+            if self.tokens < self.retry_cost:
+                return False
+            self.tokens -= self.retry_cost
+            return True
+
+    def release(self):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + self.refill)
+
+
+@dataclass
+class CircuitBreaker:
+    """
+    エンドポイントごとのサーキットブレーカー。
+    一時的な失敗がfailure_threshold回続くと開き、recovery_time秒の間は即座にCircuitOpenErrorで失敗させる。
+    その後は1件だけ試し(半開)、成功すれば閉じ、失敗すれば再び開く。
+    試した1件の結果が返らないまま(キャンセル等)recovery_time秒経った場合は、次の1件を試す。
+    """
+
+    name: str
+    failure_threshold: int = 5
+    recovery_time: float = 30.0
+
+    failures: int = field(default=0, init=False)
+    opened_at: Optional[float] = field(default=None, init=False)
+    probing_since: Optional[float] = field(default=None, init=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.recovery_time:
+            return "open"
+        return "half_open"
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return
+            now = time.monotonic()
+            if state == "half_open" and (
+                self.probing_since is None
+                or now - self.probing_since >= self.recovery_time
+            ):
+                self.probing_since = now
+                return
+        METRICS.inc("circuit_open_total", endpoint=self.name)
+        raise CircuitOpenError(f"circuit for {self.name} is open.")
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info(f"[CIRCUIT] {self.name} closed.")
+            self.failures = 0
+            self.opened_at = None
+            self.probing_since = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            probing = self.probing_since is not None
+            if probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None or probing:
+                    logger.warning(
+                        f"[CIRCUIT] {self.name} opened after {self.failures} failures."
+                    )
+                self.opened_at = time.monotonic()
+                self.probing_since = None
+
+
+# 外部エンドポイントごとに1つずつ共有する
+BREAKERS = {
+    name: CircuitBreaker(name=name)
+    for name in ("edinet", "s3", "dynamodb", "secretsmanager", "sqs")
+}
+BUDGETS = {True: RetryBudget(capacity=500.0), False: RetryBudget(capacity=50.0)}
+ATTEMPTS = {True: 5, False: 3}
+
+
+def retry_policy(
+    endpoint: Optional[str] = None,
+    idempotent: bool = True,
+    attempts: Optional[int] = None,
+    base: float = 0.5,
+    cap: float = 30.0,
+):
+    """
+    ストラテジ共通の再試行ポリシー。
+    - 一時的な失敗だけを再試行する(非冪等な操作はリクエストが処理されていないことが確実な場合だけ)
+    - 待ち時間はDecorrelated Jitterで散らし、Retry-Afterがあればそれより早く再試行しない
+    - 冪等/非冪等で別々の再試行予算を共有し、使い切ったら再試行せずに失敗させる
+    - endpointを指定すると、そのエンドポイントのサーキットブレーカーを通す
+    """
+    breaker = BREAKERS[endpoint] if endpoint else None
+    budget = BUDGETS[idempotent]
+    should_retry = is_transient if idempotent else is_unsent
+    max_attempts = attempts or ATTEMPTS[idempotent]
+
+    def retryable(retry_state: RetryCallState) -> bool:
+        error = retry_state.outcome.exception()
+        if error is None or not should_retry(error):
+            return False
+        # 最後の試行の後は再試行しないため、予算を消費しない
+        if retry_state.attempt_number >= max_attempts:
+            return False
+        return budget.acquire()
+
+    def wait(retry_state: RetryCallState) -> float:
+        jitter = retry_state.__dict__.setdefault(
+            "jitter", DecorrelatedJitter(base=base, cap=cap)
+        )
+        delay = jitter.next()
+        error = retry_state.outcome.exception()
+        retry_after = retry_after_of(error) if error else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, cap * 4))
+        METRICS.inc(
+            "retries_total",
+            function=retry_state.fn.__qualname__,
+            endpoint=endpoint or "",
+        )
+        logger.info(
+            f"[RETRY] {retry_state.fn.__qualname__} attempt={retry_state.attempt_number} "
+            f"wait={delay:.2f}s error={error!r}"
+        )
+        return delay
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def guarded(*args, **kwargs):
+                if breaker:
+                    breaker.allow()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    record(e)
+                    raise
+                succeed()
+                return result
+
+        else:
+
+            @wraps(func)
+            def guarded(*args, **kwargs):
+                if breaker:
+                    breaker.allow()
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    record(e)
+                    raise
+                succeed()
+                return result
+
+        return retry(
+            stop=stop_after_attempt(max_attempts),
+            wait=wait,
+            retry=retryable,
+            reraise=True,
+        )(guarded)
+
+    def record(error: BaseException):
+        # 相手の不調を表す失敗だけを数える(404などの呼び出し側の誤りでは開かない)
+        if breaker and is_transient(error):
+            breaker.record_failure()
+        elif breaker:
+            breaker.record_success()
+
+    def succeed():
+        budget.release()
+        if breaker:
+            breaker.record_success()
+
+    return decorator
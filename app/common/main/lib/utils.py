@@ -1,6 +1,12 @@
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 import inspect
 import logging
 from functools import wraps
+import time
+from zoneinfo import ZoneInfo
+
+from common.main.lib.metrics import METRICS
 
 # ログ設定
 logging.basicConfig(
@@ -16,6 +22,40 @@ class Utils:
         true_values = {"true", "True", "on", "yes", "1", True, 1}
         return target in true_values
 
+    @staticmethod
+    def today() -> str:
+        """日本時間の今日の日付(YYYY-MM-DD)"""
+        return datetime.now(ZoneInfo("Asia/Tokyo")).date().isoformat()
+
+    @staticmethod
+    def date_range(start: str, end: str) -> list[str]:
+        """start〜end(両端を含む, YYYY-MM-DD)の日付を昇順で返す"""
+        start_date = date.fromisoformat(start)
+        end_date = date.fromisoformat(end)
+        if start_date > end_date:
+            raise ValueError(f"start({start}) must not be after end({end}).")
+        days = (end_date - start_date).days
+        return [(start_date + timedelta(days=i)).isoformat() for i in range(days + 1)]
+
+    @staticmethod
+    @contextmanager
+    def measure(class_name: str, method_name: str):
+        """
+        メソッドの処理時間・実行中の件数・失敗数をメトリクスに記録する。
+        デコレータの内側でtenacityが再試行する場合、処理時間は再試行の待ち時間を含む。
+        """
+        labels = {"strategy": class_name, "method": method_name}
+        METRICS.add("method_in_flight", 1, **labels)
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            METRICS.inc("method_errors_total", **labels)
+            raise
+        finally:
+            METRICS.add("method_in_flight", -1, **labels)
+            METRICS.observe("method_seconds", time.perf_counter() - started, **labels)
+
     # --- Async trace decorator ---
     @staticmethod
     def async_log_exception(func):
@@ -37,7 +77,8 @@ class Utils:
             Utils.logger.info(f"Async Method '{class_name}.{method_name}' called.")
 
             try:
-                result = await func(*args, **kwargs)
+                with Utils.measure(class_name, method_name):
+                    result = await func(*args, **kwargs)
                 Utils.logger.info(
                     f"Async Method '{class_name}.{method_name}' completed successfully."
                 )
@@ -72,7 +113,8 @@ class Utils:
                 Utils.logger.info(f"Method '{class_name}.{method_name}' called.")
 
                 try:
-                    result = func(*args, **kwargs)
+                    with Utils.measure(class_name, method_name):
+                        result = func(*args, **kwargs)
                     Utils.logger.info(
                         f"Method '{class_name}.{method_name}' completed successfully."
                     )
@@ -104,7 +146,8 @@ class Utils:
             method_name = func.__name__
 
             try:
-                result = await func(*args, **kwargs)
+                with Utils.measure(class_name, method_name):
+                    result = await func(*args, **kwargs)
                 return result
             except Exception as e:
                 Utils.logger.error(
@@ -134,7 +177,8 @@ class Utils:
                 method_name = func.__name__
 
                 try:
-                    result = func(*args, **kwargs)
+                    with Utils.measure(class_name, method_name):
+                        result = func(*args, **kwargs)
                     return result
                 except Exception as e:
                     Utils.logger.error(
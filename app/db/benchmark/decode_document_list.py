@@ -0,0 +1,96 @@
+"""
+書類一覧(documents.json)のデコード性能を比較するベンチマーク。
+
+同梱の document_list_response_type2.json を --days 日分に複製したペイロードを用意し、
+- 1行ずつ Results(**row) を作る従来の方法 (dataclassのResults)
+- DocumentListDecoder.decode(payload) (__slots__のCompactResults。DocumentListResponseType2が使う)
+のデコード時間と、デコード後に保持されるメモリ量を計測する。
+
+PYTHONPATH=./app uv run app/db/benchmark/decode_document_list.py --days 1250
+"""
+
+import argparse
+import gc
+import json
+import os
+import time
+import tracemalloc
+
+from db.main.model.edinet.compact_document_item import DocumentListDecoder
+from db.main.model.edinet.document_item import Results
+
+RESOURCE = os.path.join(
+    os.path.dirname(__file__),
+    "../../common/main/resources/document_list_response_type2.json",
+)
+
+
+def build_payload(days: int) -> bytes:
+    """同梱のレスポンスをdays日分に複製する(docIDは日ごとに一意にする)"""
+    with open(RESOURCE, encoding="utf-8") as f:
+        payload = json.load(f)
+
+    rows = payload["results"]
+    payload["results"] = [
+        row | {"docID": f"{row['docID']}{day:05d}"}
+        for day in range(days)
+        for row in rows
+    ]
+    payload["metadata"]["resultset"]["count"] = len(payload["results"])
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def decode_dataclass(raw: bytes):
+    return [Results(**row) for row in json.loads(raw)["results"]]
+
+
+def decode_compact(raw: bytes):
+    return DocumentListDecoder.decode(raw)
+
+
+def measure(decode, raw: bytes, repeat: int) -> tuple[float, int]:
+    """(最速のデコード時間[秒], デコード結果が保持するメモリ[byte])"""
+    elapsed = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        results = decode(raw)
+        elapsed.append(time.perf_counter() - start)
+        del results
+
+    gc.collect()
+    tracemalloc.start()
+    results = decode(raw)
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return min(elapsed), retained
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=250, help="複製する日数")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    raw = build_payload(args.days)
+    rows = len(json.loads(raw)["results"])
+    print(f"rows={rows} payload={len(raw) / 1024 / 1024:.1f}MiB")
+
+    baseline = measure(decode_dataclass, raw, args.repeat)
+    compact = measure(decode_compact, raw, args.repeat)
+    for name, (elapsed, retained) in (("dataclass", baseline), ("compact", compact)):
+        print(
+            f"{name:>10}: decode={elapsed * 1000:8.1f}ms "
+            f"retained={retained / 1024 / 1024:7.1f}MiB "
+            f"({retained / rows:6.0f}B/row)"
+        )
+    print(
+        f"{'ratio':>10}: decode x{baseline[0] / compact[0]:.1f} "
+        f"memory x{baseline[1] / compact[1]:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
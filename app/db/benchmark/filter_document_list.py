@@ -0,0 +1,71 @@
+"""
+書類一覧のフィルタ(filter_valid_result_items)の性能を比較するベンチマーク。
+
+同梱の document_list_response_type2.json を --days 日分に複製したペイロードを用意し、
+- DocumentListResponseType2.filter_valid_result_items() (行ごとのCompactResultsを判定し、残した行をResultsに戻す)
+- DocumentListColumns の valid_mask() / filter_valid_result_items() (列ごとの配列)
+のフィルタ時間と、残った行数が一致することを確かめる。
+デコードの時間は含めない(decode_document_list.py を参照)。
+
+PYTHONPATH=./app uv run app/db/benchmark/filter_document_list.py --days 600
+"""
+
+import argparse
+import json
+import logging
+import time
+
+from db.benchmark.decode_document_list import build_payload
+from db.main.model.edinet.document_list_columns import DocumentListColumns
+from db.main.model.edinet.document_list_response_type2 import DocumentListResponseType2
+
+
+def best_of(repeat: int, prepare, run) -> tuple[float, object]:
+    """(最速の実行時間[秒], 最後の結果)。prepareの時間は含めない"""
+    elapsed, result = [], None
+    for _ in range(repeat):
+        target = prepare()
+        start = time.perf_counter()
+        result = run(target)
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed), result
+
+
+def filter_rows(response: DocumentListResponseType2) -> list:
+    response.filter_valid_result_items()
+    return response.results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=600, help="複製する日数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # 除外理由ごとの件数のログは計測に含めない
+    logging.disable(logging.INFO)
+
+    payload = json.loads(build_payload(args.days))
+    rows = len(payload["results"])
+    print(f"rows={rows}")
+
+    rowwise, kept = best_of(
+        args.repeat,
+        lambda: DocumentListResponseType2(**json.loads(json.dumps(payload))),
+        filter_rows,
+    )
+    columns = DocumentListColumns.from_payload(payload)
+    mask, valid = best_of(args.repeat, lambda: columns, DocumentListColumns.valid_mask)
+    columnar, filtered = best_of(
+        args.repeat, lambda: columns, DocumentListColumns.filter_valid_result_items
+    )
+
+    assert len(kept) == int(valid.sum()) == len(filtered)
+    print(f"{'rowwise':>10}: filter={rowwise * 1000:8.1f}ms kept={len(kept)}")
+    print(f"{'mask':>10}: filter={mask * 1000:8.1f}ms kept={int(valid.sum())}")
+    print(f"{'columnar':>10}: filter={columnar * 1000:8.1f}ms kept={len(filtered)}")
+    print(f"{'ratio':>10}: x{rowwise / columnar:.1f}")
+
+
+if __name__ == "__main__":
+    main()
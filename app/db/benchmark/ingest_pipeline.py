@@ -0,0 +1,362 @@
+"""
+取り込み全体(書類一覧の取得→ダウンロード→S3アップロード→DynamoDB登録→ファクト抽出)のベンチマーク。
+
+EDINET APIの代わりに、documents.jsonと指定サイズの合成zipを指定の遅延で返すサーバを別プロセスで立て、
+S3/DynamoDBはメモリ上のスタブ(遅延を指定可能)に差し替えて db.main.main.run() を実行する。
+本物のEDINET/AWSには一切アクセスしないため、並列度などの設定の比較や性能の劣化の検出に使える。
+
+- スループット(書類/秒, MiB/秒)
+- 書類ごとのレイテンシ(最初の書類取得リクエスト→DynamoDBへの登録)のp50/p99
+- 最大RSS
+を表示する。--jsonを指定すると結果をファイルにも保存する。
+
+PYTHONPATH=./app uv run app/db/benchmark/ingest_pipeline.py --documents 500 --size-kib 256
+"""
+
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+import hashlib
+import io
+import json
+import logging
+import math
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+import zipfile
+
+from aiohttp import ClientSession, web
+from botocore.exceptions import ClientError
+
+from common.main.lib.rate_limiter import AdaptiveRateLimiter
+from db.main import main as ingestion
+from db.main.lib.edinet_client import EdinetClient
+from db.main.model.edinet.document_list_response_type2 import DocumentListResponseType2
+
+RESOURCE = os.path.join(
+    os.path.dirname(__file__),
+    "../../common/main/resources/document_list_response_type2.json",
+)
+YYYYMMDD = "2023-08-28"
+
+
+def load_template() -> dict:
+    with open(RESOURCE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def count_valid(payload: dict) -> int:
+    """取り込み対象(filter_valid_result_itemsを通る)書類の件数"""
+    response = DocumentListResponseType2(**json.loads(json.dumps(payload)))
+    response.filter_valid_result_items()
+    return len(response.results)
+
+
+def build_zip(size: int) -> bytes:
+    """size byteの乱数(圧縮が効かない)を無圧縮で格納したzip"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        archive.writestr("benchmark.bin", os.urandom(size))
+    return buffer.getvalue()
+
+
+# --- EDINET API のスタブ(別プロセス) ---
+
+
+def serve_edinet(port: int, copies: int, size: int, latency: float, ready):
+    """
+    同梱の書類一覧をcopies倍に複製(docIDは複製ごとに一意)したdocuments.jsonと、合成zipを返す。
+    /_statsは書類ごとの最初の取得リクエストの時刻を返す(レイテンシの計測用)。
+    """
+    template = load_template()
+    rows = template["results"]
+    template["results"] = [
+        row | {"docID": f"{row['docID']}{copy:05d}", "seqNumber": i + 1}
+        for copy in range(copies)
+        for i, row in enumerate(rows)
+    ]
+    template["metadata"]["resultset"]["count"] = len(template["results"])
+    body = build_zip(size)
+    first_requested: dict[str, float] = {}
+
+    async def document_list(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        parameter = {"date": request.query["date"], "type": request.query["type"]}
+        payload = template | {
+            "metadata": template["metadata"] | {"parameter": parameter}
+        }
+        if request.query.get("type") == "1":
+            payload.pop("results")
+        return web.json_response(payload)
+
+    async def document(request: web.Request) -> web.Response:
+        first_requested.setdefault(request.match_info["doc_id"], time.time())
+        await asyncio.sleep(latency)
+        return web.Response(body=body, content_type="application/octet-stream")
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(first_requested)
+
+    async def serve():
+        app = web.Application()
+        app.router.add_get("/api/v2/documents.json", document_list)
+        app.router.add_get("/api/v2/documents/{doc_id}", document)
+        app.router.add_get("/_stats", stats)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+# --- S3 / DynamoDB のスタブ ---
+
+
+@dataclass
+class LocalS3:
+    """put_objectだけを持つS3のスタブ。本体は読み捨て、サイズとETagだけを保持する"""
+
+    latency: float = 0.0
+    objects: dict[tuple[str, str], int] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def Bucket(self, name: str):
+        return SimpleNamespace(name=name, meta=SimpleNamespace(client=self))
+
+    def put_object(self, Bucket: str, Key: str, Body) -> dict:
+        time.sleep(self.latency)
+        digest = hashlib.md5()
+        size = 0
+        for chunk in iter(lambda: Body.read(1024 * 1024), b""):
+            digest.update(chunk)
+            size += len(chunk)
+        with self.lock:
+            self.objects[(Bucket, Key)] = size
+        return {"ETag": f'"{digest.hexdigest()}"'}
+
+
+@dataclass
+class LocalDynamoDb:
+    """
+    ストラテジが使うDynamoDBのAPI(Table.get_item/put_item, batch_get_item, batch_write_item)のスタブ。
+    登録した時刻を書類ごとに記録する。
+    """
+
+    latency: float = 0.0
+    items: dict[tuple[str, str, str], dict] = field(default_factory=dict)
+    written_at: dict[str, float] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    KEYS = ("docID", "submitDateTime")
+
+    def key_of(self, table: str, item: dict) -> tuple[str, str, str]:
+        return (table, *(item[key] for key in self.KEYS))
+
+    def put(self, table: str, item: dict):
+        with self.lock:
+            self.items[self.key_of(table, item)] = item
+            self.written_at.setdefault(item["docID"], time.time())
+
+    def Table(self, name: str):
+        def get_item(Key: dict, **kwargs) -> dict:
+            time.sleep(self.latency)
+            item = self.items.get(self.key_of(name, Key))
+            return {"Item": item} if item else {}
+
+        def put_item(Item: dict, ConditionExpression: str | None = None) -> dict:
+            time.sleep(self.latency)
+            if ConditionExpression and self.key_of(name, Item) in self.items:
+                raise ClientError(
+                    {"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem"
+                )
+            self.put(name, Item)
+            return {}
+
+        return SimpleNamespace(get_item=get_item, put_item=put_item)
+
+    def batch_get_item(self, RequestItems: dict) -> dict:
+        time.sleep(self.latency)
+        responses = {
+            table: [
+                {key: item[key] for key in self.KEYS}
+                for item in (
+                    self.items.get(self.key_of(table, key)) for key in request["Keys"]
+                )
+                if item
+            ]
+            for table, request in RequestItems.items()
+        }
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    def batch_write_item(self, RequestItems: dict) -> dict:
+        time.sleep(self.latency)
+        for table, requests in RequestItems.items():
+            for request in requests:
+                self.put(table, request["PutRequest"]["Item"])
+        return {"UnprocessedItems": {}}
+
+
+@dataclass
+class LocalAwsSession:
+    """boto3.Sessionの代わりにストラテジへ渡す"""
+
+    s3: LocalS3
+    dynamodb: LocalDynamoDb
+
+    def resource(self, service_name: str, **kwargs):
+        return {"s3": self.s3, "dynamodb": self.dynamodb}[service_name]
+
+
+# --- 計測 ---
+
+
+def percentile(values: list[float], q: float) -> float:
+    """最近傍法による分位点"""
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def peak_rss_mib(who: int) -> float:
+    """最大RSS[MiB]。ru_maxrssはLinuxではKiB、macOSではbyte単位"""
+    maxrss = resource.getrusage(who).ru_maxrss
+    return maxrss / 1024 / 1024 if sys.platform == "darwin" else maxrss / 1024
+
+
+async def benchmark(args: argparse.Namespace) -> dict:
+    base_url = f"http://127.0.0.1:{args.port}"
+    session = LocalAwsSession(
+        s3=LocalS3(latency=args.s3_latency_ms / 1000),
+        dynamodb=LocalDynamoDb(latency=args.dynamodb_latency_ms / 1000),
+    )
+    client = EdinetClient(api_key="benchmark", base_url=f"{base_url}/api/v2")
+    rate_limiter = AdaptiveRateLimiter(
+        rate=args.rate, max_rate=args.rate, max_in_flight=args.max_in_flight
+    )
+    pipeline_options = {
+        "download_workers": args.download_workers,
+        "upload_workers": args.upload_workers,
+        "index_workers": args.index_workers,
+        "report_interval": None,
+    }
+
+    started = time.perf_counter()
+    db_items = await ingestion.run(
+        yyyymmdd=YYYYMMDD,
+        session=session,
+        client=client,
+        limit=args.documents,
+        rate_limiter=rate_limiter,
+        pipeline_options=pipeline_options,
+    )
+    elapsed = time.perf_counter() - started
+
+    async with ClientSession() as http:
+        async with http.get(f"{base_url}/_stats") as response:
+            first_requested = await response.json()
+    latencies = [
+        written_at - first_requested[doc_id]
+        for doc_id, written_at in session.dynamodb.written_at.items()
+        if doc_id in first_requested
+    ]
+    uploaded = sum(session.s3.objects.values())
+
+    return {
+        "documents": len(db_items),
+        "indexed": len(session.dynamodb.written_at),
+        "files": len(session.s3.objects),
+        "elapsed_seconds": round(elapsed, 3),
+        "documents_per_second": round(len(db_items) / elapsed, 2),
+        "mib_per_second": round(uploaded / elapsed / 1024 / 1024, 2),
+        "latency_p50_seconds": round(percentile(latencies, 0.5), 3),
+        "latency_p99_seconds": round(percentile(latencies, 0.99), 3),
+        # 子プロセス(ファクト抽出のワーカー)の分は終了したものだけが含まれる
+        "peak_rss_mib": {
+            "self": round(peak_rss_mib(resource.RUSAGE_SELF), 1),
+            "children": round(peak_rss_mib(resource.RUSAGE_CHILDREN), 1),
+        },
+        "requests": dict(client.stats),
+        "settings": vars(args),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=200, help="取り込む書類の数")
+    parser.add_argument("--size-kib", type=int, default=256, help="合成zipのサイズ")
+    parser.add_argument(
+        "--latency-ms", type=float, default=20.0, help="EDINETスタブの応答遅延"
+    )
+    parser.add_argument("--s3-latency-ms", type=float, default=5.0)
+    parser.add_argument("--dynamodb-latency-ms", type=float, default=5.0)
+    parser.add_argument("--download-workers", type=int, default=8)
+    parser.add_argument("--upload-workers", type=int, default=4)
+    parser.add_argument("--index-workers", type=int, default=2)
+    parser.add_argument(
+        "--rate", type=float, default=200.0, help="EDINETへの1秒あたりのリクエスト数"
+    )
+    parser.add_argument("--max-in-flight", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--json", help="結果を保存するファイル")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    # ログの出力自体が計測を歪めないよう、既定では警告以上だけにする
+    logging.getLogger().setLevel(args.log_level)
+
+    per_copy = count_valid(load_template())
+    copies = math.ceil(args.documents / per_copy)
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=serve_edinet,
+        args=(args.port, copies, args.size_kib * 1024, args.latency_ms / 1000, ready),
+        daemon=True,
+    )
+    server.start()
+    ready.wait(timeout=30)
+
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            # db.main.mainのwork_dirなどは相対パスのため、一時ディレクトリで実行する
+            os.chdir(work_dir)
+            result = asyncio.run(benchmark(args))
+    finally:
+        os.chdir(cwd)
+        server.terminate()
+        server.join()
+
+    print(
+        f"documents={result['documents']} indexed={result['indexed']} "
+        f"files={result['files']} elapsed={result['elapsed_seconds']:.2f}s"
+    )
+    print(
+        f"throughput: {result['documents_per_second']:.1f} docs/s "
+        f"{result['mib_per_second']:.1f} MiB/s"
+    )
+    print(
+        f"latency per document: p50={result['latency_p50_seconds']:.3f}s "
+        f"p99={result['latency_p99_seconds']:.3f}s"
+    )
+    print(
+        f"peak RSS: {result['peak_rss_mib']['self']:.1f}MiB "
+        f"(children {result['peak_rss_mib']['children']:.1f}MiB)"
+    )
+    print(f"requests: {result['requests']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+from dataclasses import asdict, dataclass, field, fields
+from datetime import datetime, timedelta
+from decimal import Decimal
+import glob
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Iterable, Optional
+
+from db.main.lib.text_index import (
+    TEXT_FIELDS,
+    max_score,
+    score,
+    short_words,
+    to_document,
+    to_match_query,
+)
+from db.main.model.edinet.document_item import DbItem, FileInfo, Results
+from db.main.model.edinet.edinet_enums import DocType
+
+RESULT_FIELDS = [f.name for f in fields(Results)]
+
+# 提出日時はYYYYMMDDThhmm(日付だけの場合はYYYYMMDD)にそろえて保存し、文字列のまま範囲で比較する
+DATETIME_TABLE = str.maketrans({"-": None, ":": None, " ": "T"})
+SCHEMA_VERSION = 1
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS documents (
+    {", ".join(f"{name} TEXT" for name in RESULT_FIELDS if name != "docID")},
+    docID TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS files (
+    docID TEXT NOT NULL,
+    docType TEXT NOT NULL,
+    filepath TEXT,
+    cloudpath TEXT,
+    PRIMARY KEY (docID, docType)
+);
+CREATE INDEX IF NOT EXISTS idx_documents_submit ON documents (submitDateTime, docID);
+CREATE INDEX IF NOT EXISTS idx_documents_edinet ON documents (edinetCode, submitDateTime, docID);
+CREATE INDEX IF NOT EXISTS idx_documents_sec ON documents (secCode, docTypeCode, submitDateTime, docID);
+CREATE INDEX IF NOT EXISTS idx_documents_doctype ON documents (docTypeCode, submitDateTime, docID);
+CREATE INDEX IF NOT EXISTS idx_documents_ordinance ON documents (ordinanceCode, docTypeCode, submitDateTime);
+CREATE INDEX IF NOT EXISTS idx_documents_period ON documents (periodEnd, periodStart);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5 (
+    {", ".join(TEXT_FIELDS)}, tokenize = "unicode61 remove_diacritics 0", prefix = "1"
+);
+"""
+
+
+@dataclass
+class DocumentCatalog:
+    """
+    取り込んだ書類のローカルカタログ(SQLite)。
+    DynamoDBはdocID/submitDateTimeでしか引けないため、edinetCode・secCode・書類種別・
+    府令・期間などで検索できるよう索引付きで手元にも保持する。
+    """
+
+    path: str
+    connection: sqlite3.Connection = field(init=False, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    logger = logging.getLogger(__name__)
+
+    def __post_init__(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # パイプラインのワーカースレッドから書き込むため、スレッド間で共有してlockで守る
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        has_text_index = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'documents_fts'"
+        ).fetchone()
+        self.connection.executescript(SCHEMA)
+        if not has_text_index:
+            # 全文検索の索引がなかった頃のカタログは、既存の書類から索引を作る
+            self.rebuild_text_index()
+        self.migrate()
+
+    def migrate(self):
+        """古い形式で保存された値を今の形式にそろえる(カタログごとに1回だけ)"""
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        with self.lock, self.connection:
+            # 提出日時がない書類に埋めた取得日(YYYY-MM-DD)などをYYYYMMDD形式にする
+            updated = self.connection.execute(
+                "UPDATE documents SET submitDateTime = "
+                "replace(replace(replace(submitDateTime, '-', ''), ':', ''), ' ', 'T') "
+                "WHERE submitDateTime GLOB '*[-: ]*'"
+            ).rowcount
+            self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        if updated:
+            self.logger.info(
+                f"[MIGRATE] normalize submitDateTime of {updated} documents"
+            )
+
+    @staticmethod
+    def canonical_datetime(value: Optional[str]) -> Optional[str]:
+        return value.translate(DATETIME_TABLE) if value else value
+
+    def close(self):
+        self.connection.close()
+
+    def upsert(self, items: Iterable[DbItem | Results]):
+        """書類(とファイル情報)を1トランザクションでまとめて登録・更新する"""
+        documents = []
+        texts = []
+        files = []
+        for item in items:
+            document = {name: getattr(item, name) for name in RESULT_FIELDS}
+            document["submitDateTime"] = self.canonical_datetime(item.submitDateTime)
+            documents.append(tuple(document.values()))
+            texts.append(
+                (
+                    *(to_document(getattr(item, name)) for name in TEXT_FIELDS),
+                    item.docID,
+                )
+            )
+            if isinstance(item, DbItem):
+                files.extend(
+                    (item.docID, doc_type.name, info.filepath, info.cloudpath)
+                    for doc_type, info in item.get_infoitems()
+                )
+
+        placeholders = ", ".join("?" for _ in RESULT_FIELDS)
+        updates = ", ".join(f"{name} = excluded.{name}" for name in RESULT_FIELDS)
+        with self.lock, self.connection:
+            # 全文検索の索引はrowidで書類と対応付けるため、rowidが変わらないようUPSERTする
+            self.connection.executemany(
+                f"INSERT INTO documents ({', '.join(RESULT_FIELDS)}) "
+                f"VALUES ({placeholders}) ON CONFLICT (docID) DO UPDATE SET {updates}",
+                documents,
+            )
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO documents_fts (rowid, {', '.join(TEXT_FIELDS)}) "
+                f"SELECT rowid, {', '.join('?' for _ in TEXT_FIELDS)} "
+                "FROM documents WHERE docID = ?",
+                texts,
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO files (docID, docType, filepath, cloudpath) "
+                "VALUES (?, ?, ?, ?)",
+                files,
+            )
+        return len(documents)
+
+    def count(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM documents").fetchone()[
+                0
+            ]
+
+    def keys(self) -> list[tuple[str, str]]:
+        """登録済みの書類の(docID, submitDateTime)"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT docID, submitDateTime FROM documents"
+            ).fetchall()
+        return [(row["docID"], row["submitDateTime"]) for row in rows]
+
+    def get(self, doc_id: str) -> Optional[DbItem]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT * FROM documents WHERE docID = ?", (doc_id,)
+            ).fetchone()
+            files = self.connection.execute(
+                "SELECT docType, filepath, cloudpath FROM files WHERE docID = ?",
+                (doc_id,),
+            ).fetchall()
+        if row is None:
+            return None
+
+        item = DbItem(**self.to_item(row))
+        for file in files:
+            item.set_info(
+                DocType[file["docType"]],
+                FileInfo(filepath=file["filepath"], cloudpath=file["cloudpath"]),
+            )
+        return item
+
+    def search(
+        self,
+        edinet_code: Optional[str] = None,
+        sec_code: Optional[str] = None,
+        doc_type_code: Optional[str] = None,
+        ordinance_code: Optional[str] = None,
+        submitted_from: Optional[str] = None,  # YYYYMMDD
+        submitted_to: Optional[str] = None,  # YYYYMMDD
+        period_from: Optional[str] = None,  # YYYYMMDD
+        period_to: Optional[str] = None,  # YYYYMMDD
+        has: Optional[list[DocType]] = None,
+        after: Optional[tuple[str, str]] = None,  # (submitDateTime, docID)
+        limit: int = 100,
+    ) -> list[dict]:
+        """
+        条件に合う書類を提出日時の新しい順に返す。
+        after に前ページ末尾の(submitDateTime, docID)を渡すとその続きを返す(キーセットページング)。
+        """
+        conditions = []
+        params: list = []
+
+        def where(condition: str, *values):
+            conditions.append(condition)
+            params.extend(values)
+
+        if edinet_code:
+            where("edinetCode = ?", edinet_code)
+        if sec_code:
+            # 4桁の証券コードはEDINETの5桁表記に揃える
+            where("secCode = ?", sec_code + "0" if len(sec_code) == 4 else sec_code)
+        if doc_type_code:
+            where("docTypeCode = ?", doc_type_code)
+        if ordinance_code:
+            where("ordinanceCode = ?", ordinance_code)
+        if submitted_from:
+            where("submitDateTime >= ?", submitted_from)
+        if submitted_to:
+            # 時刻のある書類も含めるため、翌日の0時未満で比較する
+            next_day = datetime.strptime(submitted_to, "%Y%m%d") + timedelta(days=1)
+            where("submitDateTime < ?", next_day.strftime("%Y%m%d"))
+        if period_from:
+            where("periodEnd >= ?", period_from)
+        if period_to:
+            where("periodStart <= ?", period_to)
+        for doc_type in has or []:
+            where(
+                "EXISTS (SELECT 1 FROM files f WHERE f.docID = documents.docID "
+                "AND f.docType = ?)",
+                doc_type.name,
+            )
+        if after:
+            where("(submitDateTime, docID) < (?, ?)", *after)
+
+        sql = "SELECT * FROM documents"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY submitDateTime DESC, docID DESC LIMIT ?"
+        params.append(limit)
+
+        with self.lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        return [self.to_item(row) for row in rows]
+
+    def search_text(
+        self,
+        query: str,
+        field: Optional[str] = None,
+        limit: int = 100,
+        window: int = 300,
+        max_candidates: int = 10_000,
+    ) -> tuple[list[dict], bool]:
+        """
+        企業名・書類名を文字n-gramで全文検索し、関連度の高い順に返す。
+        fieldにfilerName/docDescriptionを指定するとその項目だけを対象にする。
+        一致した書類を新しい順にwindow件から読み始め、上位limit件のスコアが
+        取りうる最高点に届くか一致を読み切るまで、読む件数を広げながら順位付けする。
+        ただし読むのはmax_candidates件まで。
+        (結果, 一致したすべての書類を順位付けしたか)を返す。
+        """
+        expression = to_match_query(query, field=field)
+        characters = short_words(query)
+        if expression is None and not characters:
+            return [], True
+
+        conditions, params = [], []
+        if expression is not None:
+            conditions.append("documents_fts MATCH ?")
+            params.append(expression)
+        # n文字未満の語は、索引の項目(正規化済み)に含まれるかで絞り込む
+        columns = [field] if field else TEXT_FIELDS
+        for character in characters:
+            conditions.append(
+                "(" + " OR ".join(f"instr({name}, ?) > 0" for name in columns) + ")"
+            )
+            params.extend(character for _ in columns)
+
+        # 索引はrowid順に並んでいるため、新しい順に区切って読める。
+        # 順位付けには必要な項目だけを読み、全項目は上位limit件についてだけ読む
+        sql = (
+            f"SELECT documents.rowid, submitDateTime, {', '.join(TEXT_FIELDS)} FROM ("
+            f"SELECT rowid FROM documents_fts WHERE {' AND '.join(conditions)} "
+            "AND rowid < ? ORDER BY rowid DESC LIMIT ?"
+            ") AS hits JOIN documents ON documents.rowid = hits.rowid"
+        )
+        best = max_score(query)
+        ranked: list[tuple[float, str, int]] = []
+        scanned, before, size = 0, 2**63 - 1, max(window, limit)
+        with self.lock:
+            while True:
+                size = min(size, max_candidates - scanned)
+                candidates = self.connection.execute(
+                    sql, (*params, before, size)
+                ).fetchall()
+                scanned += len(candidates)
+                ranked = sorted(
+                    ranked
+                    + [
+                        (
+                            score(query, dict(row)),
+                            row["submitDateTime"] or "",
+                            row["rowid"],
+                        )
+                        for row in candidates
+                    ],
+                    reverse=True,
+                )[:limit]
+
+                complete = len(candidates) < size
+                # 古い書類は同点なら新しい書類に勝てないため、上位がすべて最高点なら打ち切れる
+                saturated = len(ranked) == limit and ranked[-1][0] >= best
+                if complete or saturated or scanned >= max_candidates:
+                    break
+                before = min(row["rowid"] for row in candidates)
+                size *= 4
+
+            if not ranked:
+                return [], True
+            rows = self.connection.execute(
+                f"SELECT rowid AS rowid_, * FROM documents WHERE rowid IN "
+                f"({', '.join('?' for _ in ranked)})",
+                [rowid for _, _, rowid in ranked],
+            ).fetchall()
+
+        scores = {rowid: value for value, _, rowid in ranked}
+        items = {row["rowid_"]: row for row in rows}
+        return [
+            {k: v for k, v in self.to_item(items[rowid]).items() if k != "rowid_"}
+            | {"score": scores[rowid]}
+            for _, _, rowid in ranked
+        ], complete or saturated
+
+    def rebuild_text_index(self):
+        """全文検索の索引を書類テーブルから作り直し、ポスティングリストを1つのセグメントにまとめる"""
+        with self.lock, self.connection:
+            rows = self.connection.execute(
+                f"SELECT rowid, {', '.join(TEXT_FIELDS)} FROM documents"
+            ).fetchall()
+            self.connection.execute("DELETE FROM documents_fts")
+            self.connection.executemany(
+                f"INSERT INTO documents_fts (rowid, {', '.join(TEXT_FIELDS)}) "
+                f"VALUES (?, {', '.join('?' for _ in TEXT_FIELDS)})",
+                [(row[0], *(to_document(value) for value in row[1:])) for row in rows],
+            )
+            self.connection.execute(
+                "INSERT INTO documents_fts (documents_fts) VALUES ('optimize')"
+            )
+        self.logger.info(f"[DONE] rebuild text index: {len(rows)} documents")
+
+    @staticmethod
+    def to_item(row: sqlite3.Row) -> dict:
+        item = dict(row)
+        if item.get("seqNumber") is not None:
+            item["seqNumber"] = int(item["seqNumber"])
+        return item
+
+    def rebuild_from_work_dir(self, work_dir: str, cache_dir: Optional[str] = None):
+        """
+        work_dir({edinetCode}/{submitDateTime}/{docID}/{TYPE}.zip)からカタログを作り直す。
+        cache_dirに書類一覧のキャッシュがあれば、そこから書類のメタデータを補う。
+        """
+        items: dict[str, DbItem] = {}
+        for path in glob.glob(f"{work_dir}/*/*/*/*.zip"):
+            edinet_code, submit_date_time, doc_id, filename = path.split(os.sep)[-4:]
+            doc_type = os.path.splitext(filename)[0]
+            if doc_type not in DocType.__members__:
+                continue
+
+            if doc_id not in items:
+                items[doc_id] = DbItem(
+                    docID=doc_id,
+                    edinetCode=edinet_code,
+                    submitDateTime=submit_date_time,
+                )
+            items[doc_id].set_info(DocType[doc_type], FileInfo(filepath=path))
+
+        # 書類一覧のキャッシュがあれば、書類のメタデータで置き換える
+        for result in self.cached_results(cache_dir, items) if cache_dir else []:
+            item = DbItem(**asdict(result))
+            for doc_type, info in items[result.docID].get_infoitems():
+                item.set_info(doc_type, info)
+            items[result.docID] = item
+
+        count = self.upsert(items.values())
+        self.logger.info(f"[DONE] rebuild catalog from {work_dir}: {count} documents")
+        return count
+
+    def cached_results(self, cache_dir: str, doc_ids: Iterable[str]) -> list[Results]:
+        """
+        書類一覧のキャッシュ(全日付分)をまとめて列指向で読み、フィルタしたうえで
+        doc_idsの書類だけをResultsにする(対象外の行のオブジェクトは作らない)。
+        """
+        import numpy as np
+
+        from db.main.model.edinet.document_list_columns import DocumentListColumns
+
+        tables = []
+        for path in sorted(glob.glob(f"{cache_dir}/type2/*.json")):
+            with open(path, "rb") as f:
+                tables.append(DocumentListColumns.from_payload(f.read()))
+        documents = DocumentListColumns.concat(tables)
+        if not len(documents):
+            return []
+        documents = documents.filter_valid_result_items()
+
+        # 同じdocIDが複数日に現れる場合は後の日付の行を使う
+        rows = {
+            doc_id: i for i, doc_id in enumerate(documents.columns["docID"].tolist())
+        }
+        positions = [rows[doc_id] for doc_id in doc_ids if doc_id in rows]
+        return documents.take(np.array(positions, dtype=np.int64)).to_results()
+
+    def rebuild_from_dynamodb_export(self, export_dir: str):
+        """
+        DynamoDBのS3エクスポート(DYNAMODB_JSON形式, *.json.gz)からカタログを作り直す。
+        """
+        from boto3.dynamodb.types import TypeDeserializer
+
+        deserializer = TypeDeserializer()
+        result_fields = set(RESULT_FIELDS)
+        count = 0
+        for path in glob.glob(f"{export_dir}/**/*.json*", recursive=True):
+            opener = gzip.open if path.endswith(".gz") else open
+            items = []
+            with opener(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    image = json.loads(line).get("Item", {})
+                    record = {
+                        name: deserializer.deserialize(value)
+                        for name, value in image.items()
+                    }
+                    if isinstance(record.get("seqNumber"), Decimal):
+                        record["seqNumber"] = int(record["seqNumber"])
+                    item = DbItem(
+                        **{k: v for k, v in record.items() if k in result_fields}
+                    )
+                    for doc_type, attribute in DbItem.INFO_ATTRIBUTES.items():
+                        if record.get(attribute):
+                            item.set_info(doc_type, FileInfo(**record[attribute]))
+                    items.append(item)
+            count += self.upsert(items)
+
+        self.logger.info(f"[DONE] rebuild catalog from {export_dir}: {count} documents")
+        return count
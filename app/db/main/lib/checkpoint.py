@@ -0,0 +1,88 @@
+from dataclasses import dataclass, field
+import json
+import logging
+import os
+from typing import Iterable
+
+
+@dataclass
+class BackfillCheckpoint:
+    """
+    バックフィルの進捗を記録するチェックポイント。
+    完了した日付と取り込み済みのdocIDをJSONで保持し、中断したバッチを再開できるようにする。
+    失敗した書類があった日付は完了にせず、再開時に(取り込み済みを除いて)取り込み直す。
+    """
+
+    path: str
+    completed_dates: set[str] = field(default_factory=set)
+    seen_doc_ids: set[str] = field(default_factory=set)
+    failed_doc_ids: dict[str, list[str]] = field(default_factory=dict)  # 日付ごと
+
+    logger = logging.getLogger(__name__)
+
+    @classmethod
+    def load(cls, path: str) -> "BackfillCheckpoint":
+        """チェックポイントを読み込む。存在しない場合は空の状態を返す"""
+        if not os.path.exists(path):
+            return cls(path=path)
+
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+
+        checkpoint = cls(
+            path=path,
+            completed_dates=set(state.get("completed_dates", [])),
+            seen_doc_ids=set(state.get("seen_doc_ids", [])),
+            failed_doc_ids=state.get("failed_doc_ids", {}),
+        )
+        cls.logger.info(
+            f"[RESUME] {len(checkpoint.completed_dates)} days already completed."
+        )
+        for yyyymmdd, doc_ids in sorted(checkpoint.failed_doc_ids.items()):
+            cls.logger.info(f"[RESUME] {yyyymmdd}: retry {len(doc_ids)} failed docs.")
+        return checkpoint
+
+    def is_completed(self, yyyymmdd: str) -> bool:
+        return yyyymmdd in self.completed_dates
+
+    def mark_completed(
+        self, yyyymmdd: str, doc_ids: list[str], failed_doc_ids: Iterable[str] = ()
+    ):
+        """
+        日付の完了を記録して永続化する。
+        failed_doc_idsがあれば日付は完了にせず、失敗した書類を記録して次回の実行で取り込み直す。
+        """
+        self.seen_doc_ids.update(doc_ids)
+        failed = sorted(set(failed_doc_ids) - self.seen_doc_ids)
+        if failed:
+            self.failed_doc_ids[yyyymmdd] = failed
+            self.logger.warning(
+                f"[INCOMPLETE] {yyyymmdd}: {len(failed)} docs failed, retry on resume."
+            )
+        else:
+            self.failed_doc_ids.pop(yyyymmdd, None)
+            self.completed_dates.add(yyyymmdd)
+        self.save()
+
+    def mark_ingested(self, doc_ids: list[str]):
+        """日付を完了扱いにせず、取り込んだdocIDだけを記録する(監視モード用)"""
+        self.seen_doc_ids.update(doc_ids)
+        self.save()
+
+    def save(self):
+        """書き込み途中でクラッシュしても壊れないよう、一時ファイル経由で置き換える"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        state = {
+            "completed_dates": sorted(self.completed_dates),
+            "seen_doc_ids": sorted(self.seen_doc_ids),
+            "failed_doc_ids": self.failed_doc_ids,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,47 @@
+from dataclasses import dataclass
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+
+@dataclass
+class ApiKeyCache:
+    """
+    Secrets Managerから取得したAPIキーをローカルにttl秒だけ保存する。
+    起動のたびにSecrets Managerへ問い合わせる(boto3のクライアント作成を含む)のを省く。
+    ファイルは所有者だけが読み書きできる権限(0600)で作る。
+    """
+
+    path: str
+    ttl: float = 6 * 3600.0
+
+    logger = logging.getLogger(__name__)
+
+    def get(self, secret_name: str) -> Optional[str]:
+        """有効期限内のキーがあれば返す"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entry = json.load(f).get(secret_name)
+        except (OSError, ValueError):
+            return None
+        if not entry or entry.get("expires_at", 0) <= time.time():
+            return None
+        self.logger.info(f"[HIT] api key cache {secret_name}")
+        return entry.get("value")
+
+    def put(self, secret_name: str, value: str):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+        entries[secret_name] = {"value": value, "expires_at": time.time() + self.ttl}
+
+        os.makedirs(os.path.dirname(self.path) or ".", mode=0o700, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,183 @@
+import asyncio
+from dataclasses import dataclass, field
+import itertools
+import logging
+import math
+import time
+from typing import Awaitable, Callable, Iterable, Optional, TypeVar
+
+from common.main.lib.metrics import METRICS
+from db.main.model.edinet.document_item import DbItem
+from db.main.model.edinet.edinet_enums import DocType
+
+T = TypeVar("T")
+
+
+@dataclass
+class DownloadPolicy:
+    """
+    (書類, 種類)ごとのダウンロードの順序と、時間が足りないときに諦める種類。
+    - 優先度は小さいほど先。既定ではXBRL/CSVを先に、PDF、添付・英文の順に取得する
+    - 監視対象の企業(watched_edinet_codes)の書類は種類によらず最優先にし、諦めることもない
+    - 開始からdeadline秒を過ぎたら、droppable_typesの未取得分は取得せずに諦める
+    """
+
+    type_priorities: dict[DocType, int] = field(
+        default_factory=lambda: {
+            DocType.XBRL: 0,
+            DocType.CSV: 0,
+            DocType.PDF: 1,
+            DocType.ATTACH: 2,
+            DocType.ENGLISH: 2,
+        }
+    )
+    watched_edinet_codes: frozenset[str] = frozenset()
+    deadline: Optional[float] = None
+    droppable_types: frozenset[DocType] = frozenset({DocType.ATTACH, DocType.ENGLISH})
+
+    def is_watched(self, db_item: DbItem) -> bool:
+        return db_item.edinetCode in self.watched_edinet_codes
+
+    def priority_of(self, db_item: DbItem, doc_type: DocType) -> tuple[int, int]:
+        lowest = max(self.type_priorities.values(), default=0) + 1
+        return (
+            0 if self.is_watched(db_item) else 1,
+            self.type_priorities.get(doc_type, lowest),
+        )
+
+    def should_drop(self, db_item: DbItem, doc_type: DocType, elapsed: float) -> bool:
+        return (
+            self.deadline is not None
+            and elapsed >= self.deadline
+            and doc_type in self.droppable_types
+            and not self.is_watched(db_item)
+        )
+
+
+@dataclass(order=True)
+class FileTask:
+    """1ファイル分のダウンロード。priority, seqの順に並べる(同じ優先度なら登録順)"""
+
+    priority: tuple[float, float]
+    seq: int
+    db_item: DbItem = field(compare=False)
+    doc_type: DocType = field(compare=False)
+    filepath: str = field(compare=False)
+
+
+@dataclass
+class DownloadScheduler:
+    """
+    書類ごとではなく(書類, 種類)ごとにダウンロードを並べ、ワーカーが優先度の高いものから取り出す。
+    遅い書類が1つあっても、その書類の残りの種類を待たずに他の書類のファイルを取得できる。
+    書類の全ファイルが終わった時点でon_doneを呼ぶ(1ファイルでも失敗した書類はok=False)。
+    書類は一日分をまとめてではなく、処理中の書類がwindow件を超えないように順に登録する。
+    優先度はこの範囲の書類の間で効き、書類は登録した順に後段へ流れていく。
+    """
+
+    policy: DownloadPolicy = field(default_factory=DownloadPolicy)
+    window: int = 32  # 同時に登録しておく書類の数
+
+    queue: asyncio.PriorityQueue = field(default_factory=asyncio.PriorityQueue)
+    remaining: dict[str, int] = field(default_factory=dict, init=False)
+    failed: set[str] = field(default_factory=set, init=False)
+    started_at: float = field(default_factory=time.monotonic, init=False)
+    counter: itertools.count = field(default_factory=itertools.count, init=False)
+    slots: asyncio.Semaphore = field(init=False)
+
+    logger = logging.getLogger(__name__)
+
+    # ワーカーに終わりを伝えるタスクの優先度(どのファイルよりも後に取り出される)
+    STOP = (math.inf, math.inf)
+
+    def __post_init__(self):
+        self.slots = asyncio.Semaphore(self.window)
+
+    def add(self, db_item: DbItem, files: list[tuple[DocType, str]]):
+        """書類のファイル(種類, 保存先)をまとめて登録する"""
+        self.remaining[db_item.docID] = self.remaining.get(db_item.docID, 0) + len(
+            files
+        )
+        for doc_type, filepath in files:
+            self.queue.put_nowait(
+                FileTask(
+                    priority=self.policy.priority_of(db_item, doc_type),
+                    seq=next(self.counter),
+                    db_item=db_item,
+                    doc_type=doc_type,
+                    filepath=filepath,
+                )
+            )
+
+    async def run(
+        self,
+        documents: Iterable[T],
+        plan: Callable[[T], tuple[DbItem, list[tuple[DocType, str]]]],
+        fetch: Callable[[FileTask], Awaitable[None]],
+        on_done: Callable[[DbItem, bool], Awaitable[None]],
+        workers: int,
+    ):
+        """
+        documentsをplanで(書類, 取得するファイル)にしながら登録し、workers並列で取得する。
+        取得するファイルがない書類はすぐにon_doneに渡す。全ての書類が終わったら戻る。
+        """
+        tasks = [asyncio.create_task(self.work(fetch, on_done)) for _ in range(workers)]
+        try:
+            for document in documents:
+                await self.slots.acquire()
+                db_item, files = plan(document)
+                if files and db_item.docID in self.remaining:
+                    # 同じ書類がすでに登録済みなら、その書類の枠を使う
+                    self.slots.release()
+                    self.add(db_item, files)
+                elif files:
+                    self.add(db_item, files)
+                else:
+                    self.slots.release()
+                    await on_done(db_item, True)
+
+            for _ in tasks:
+                self.queue.put_nowait(
+                    FileTask(
+                        priority=self.STOP,
+                        seq=next(self.counter),
+                        db_item=None,
+                        doc_type=None,
+                        filepath=None,
+                    )
+                )
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def work(
+        self,
+        fetch: Callable[[FileTask], Awaitable[None]],
+        on_done: Callable[[DbItem, bool], Awaitable[None]],
+    ):
+        while True:
+            task: FileTask = await self.queue.get()
+            if task.priority == self.STOP:
+                return
+
+            doc_id = task.db_item.docID
+            elapsed = time.monotonic() - self.started_at
+            if self.policy.should_drop(task.db_item, task.doc_type, elapsed):
+                METRICS.inc("download_dropped_total", type=task.doc_type.name)
+            else:
+                try:
+                    await fetch(task)
+                except Exception as e:
+                    # 同じ書類の他のファイルは取得を続け、書類としては失敗扱いにする
+                    self.failed.add(doc_id)
+                    self.logger.error(
+                        f"[FAIL] download {doc_id} {task.doc_type.name}: {e}"
+                    )
+
+            self.remaining[doc_id] -= 1
+            if self.remaining[doc_id] == 0:
+                del self.remaining[doc_id]
+                await on_done(task.db_item, doc_id not in self.failed)
+                # 後段が詰まっている間は次の書類を登録しない
+                self.slots.release()
@@ -0,0 +1,107 @@
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+import json
+import logging
+from typing import AsyncIterator, Optional
+
+import aiohttp
+
+
+@dataclass
+class EdinetClient:
+    """
+    EDINET APIへの全リクエストが共有するHTTPクライアント。
+    書類一覧APIと書類取得APIは同じホストのため、1つのコネクションプールを使い回して
+    TLSハンドシェイクとDNS解決を日付・書類ごとに繰り返さないようにする。
+
+    async with EdinetClient(api_key=...) as client:
+        payload = await client.get_document_list("2023-08-28", type="2")
+    """
+
+    api_key: str
+    base_url: str = "https://api.edinet-fsa.go.jp/api/v2"
+    limit: int = 32  # プール全体の同時接続数
+    limit_per_host: int = 16
+    keepalive_timeout: float = 30.0  # 使い終わった接続を保持する秒数
+    ttl_dns_cache: int = 300
+    connect_timeout: float = 10.0
+    read_timeout: float = 60.0  # 受信が途切れてから諦めるまでの秒数(書類本体は長くかかるため全体の上限は設けない)
+
+    session: Optional[aiohttp.ClientSession] = field(default=None, init=False)
+    # 接続の新規作成数と再利用数。再利用が多いほどハンドシェイクを省けている
+    stats: Counter = field(default_factory=Counter, init=False)
+
+    logger = logging.getLogger(__name__)
+
+    async def __aenter__(self) -> "EdinetClient":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        if self.session is not None and not self.session.closed:
+            return
+
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(self.count("connection_created"))
+        trace.on_connection_reuseconn.append(self.count("connection_reused"))
+        trace.on_request_start.append(self.count("request"))
+
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.ttl_dns_cache,
+                enable_cleanup_closed=True,
+            ),
+            timeout=aiohttp.ClientTimeout(
+                total=None,
+                connect=self.connect_timeout,
+                sock_read=self.read_timeout,
+            ),
+            trace_configs=[trace],
+            raise_for_status=False,
+        )
+
+    async def close(self):
+        if self.session is None:
+            return
+        await self.session.close()
+        self.session = None
+        self.logger.info(f"[DONE] edinet client {dict(self.stats)}")
+
+    def count(self, name: str):
+        async def on_event(session, context, params):
+            self.stats[name] += 1
+
+        return on_event
+
+    async def get_document_list(self, yyyymmdd: str, type: str) -> dict:
+        """書類一覧API(documents.json)のレスポンスを返す"""
+        await self.open()
+        params = {"date": yyyymmdd, "type": type, "Subscription-Key": self.api_key}
+        async with self.session.get(
+            f"{self.base_url}/documents.json", params=params
+        ) as response:
+            response.raise_for_status()
+            return json.loads(await response.read())
+
+    @asynccontextmanager
+    async def get_document(
+        self, doc_id: str, type: str, headers: Optional[dict[str, str]] = None
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """
+        書類取得APIのレスポンスを返す。本体は読み込まずに返すため、呼び出し側で少しずつ読み出す。
+        ステータスの確認も呼び出し側で行う(レート制御にステータスを渡すため)。
+        headersにはRange/If-Rangeなどを渡せる。
+        """
+        await self.open()
+        params = {"type": type, "Subscription-Key": self.api_key}
+        async with self.session.get(
+            f"{self.base_url}/documents/{doc_id}", params=params, headers=headers
+        ) as response:
+            yield response
@@ -0,0 +1,183 @@
+import csv
+from dataclasses import dataclass
+import io
+import logging
+import os
+from typing import Optional
+from xml.etree import ElementTree
+import zipfile
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+FACT_COLUMNS = ("docID", "elementId", "contextId", "unitId", "value")
+# 値以外は同じ文字列が繰り返し現れるため辞書符号化して保存する
+DICTIONARY_COLUMNS = ("docID", "elementId", "contextId", "unitId")
+
+# XBRL_TO_CSV配下のCSVの列名
+CSV_COLUMNS = {
+    "elementId": "要素ID",
+    "contextId": "コンテキストID",
+    "unitId": "ユニットID",
+    "value": "値",
+}
+NIL_VALUES = frozenset({"－", ""})
+
+logger = logging.getLogger(__name__)
+
+
+def empty_facts() -> pa.Table:
+    return pa.table({name: pa.array([], pa.string()) for name in FACT_COLUMNS})
+
+
+def read_csv_facts(path: str) -> dict[str, list]:
+    """CSV.zip(XBRL_TO_CSV/*.csv, UTF-16のタブ区切り)からファクトを読む"""
+    facts = {name: [] for name in CSV_COLUMNS}
+    with zipfile.ZipFile(path) as archive:
+        for name in archive.namelist():
+            if not name.endswith(".csv"):
+                continue
+            text = archive.read(name).decode("utf-16")
+            rows = csv.reader(io.StringIO(text), delimiter="\t")
+            header = next(rows, None)
+            # 期待する列のないCSV(形式の違うもの)は読まない
+            if header is None or not all(
+                label in header for label in CSV_COLUMNS.values()
+            ):
+                continue
+            index = {
+                column: header.index(label) for column, label in CSV_COLUMNS.items()
+            }
+            for row in rows:
+                if len(row) < len(header):
+                    continue
+                for column, i in index.items():
+                    value = row[i]
+                    facts[column].append(None if value in NIL_VALUES else value)
+    return facts
+
+
+def read_xbrl_facts(path: str) -> dict[str, list]:
+    """XBRL.zip(XBRL/PublicDoc/*.xbrl)のインスタンスからファクトを読む"""
+    facts = {name: [] for name in CSV_COLUMNS}
+    with zipfile.ZipFile(path) as archive:
+        for name in archive.namelist():
+            if not (name.startswith("XBRL/PublicDoc/") and name.endswith(".xbrl")):
+                continue
+            prefixes: dict[str, str] = {}
+            with archive.open(name) as f:
+                for event, node in ElementTree.iterparse(f, events=("start-ns", "end")):
+                    if event == "start-ns":
+                        prefix, uri = node
+                        prefixes.setdefault(uri, prefix)
+                        continue
+                    context = node.get("contextRef")
+                    if context is None:
+                        continue
+                    uri, _, local = node.tag[1:].partition("}")
+                    facts["elementId"].append(f"{prefixes.get(uri, uri)}:{local}")
+                    facts["contextId"].append(context)
+                    facts["unitId"].append(node.get("unitRef"))
+                    facts["value"].append(node.text)
+                    node.clear()
+    return facts
+
+
+def extract_document_facts(
+    doc_id: str, csv_path: Optional[str], xbrl_path: Optional[str]
+) -> pa.Table:
+    """
+    1書類分のファクトを取り出す(プロセスプールのワーカーで実行する)。
+    CSVはXBRLから生成されたものなので、CSVがあればCSVを、なければXBRLを読む。
+    """
+    try:
+        if csv_path and os.path.exists(csv_path):
+            facts = read_csv_facts(csv_path)
+        elif xbrl_path and os.path.exists(xbrl_path):
+            facts = read_xbrl_facts(xbrl_path)
+        else:
+            return empty_facts()
+    except (
+        zipfile.BadZipFile,
+        UnicodeDecodeError,
+        ElementTree.ParseError,
+        ValueError,
+    ) as e:
+        logger.error(f"[SKIP] failed to extract facts of {doc_id}: {e}")
+        return empty_facts()
+    except Exception:
+        # 1書類の想定外の失敗で、その日の取り込み全体を失敗させない
+        logger.exception(f"[SKIP] unexpected error while extracting facts of {doc_id}")
+        return empty_facts()
+
+    count = len(facts["value"])
+    return pa.table(
+        {"docID": pa.array([doc_id] * count, pa.string())}
+        | {name: pa.array(values, pa.string()) for name, values in facts.items()}
+    )
+
+
+@dataclass
+class FactsStore:
+    """
+    書類から取り出したファクトを日付ごとのArrow IPCファイルとして保存する。
+    非圧縮のIPCファイルなので、読み出し時はメモリマップして再パースせずに使える。
+    """
+
+    facts_dir: str
+
+    logger = logging.getLogger(__name__)
+
+    def path_of(self, yyyymmdd: str) -> str:
+        return f"{self.facts_dir}/{yyyymmdd}.arrow"
+
+    def exists(self, yyyymmdd: str) -> bool:
+        return os.path.exists(self.path_of(yyyymmdd))
+
+    def open(self, yyyymmdd: str) -> pa.Table:
+        """日付のファクトをメモリマップして返す(列データはコピーされない)"""
+        source = pa.memory_map(self.path_of(yyyymmdd), "r")
+        return pa.ipc.open_file(source).read_all()
+
+    def write(self, yyyymmdd: str, tables: list[pa.Table]) -> int:
+        """
+        日付のファクト(書類ごとの表)を1つのファイルに書き込む。
+        既存のファイルがあれば、同じdocIDの行を置き換えてまとめる(監視モードで同じ日に何度も取り込む場合)。
+        """
+        tables = [self.decode(table) for table in tables] or [empty_facts()]
+        if self.exists(yyyymmdd):
+            # ファクトのない書類だけの場合に型がnullと推定されないよう、型を指定する
+            doc_ids = pa.chunked_array(
+                [table["docID"] for table in tables], type=pa.string()
+            )
+            existing = self.decode(self.open(yyyymmdd))
+            keep = pc.invert(pc.is_in(existing["docID"], value_set=doc_ids))
+            tables.insert(0, existing.filter(keep))
+
+        merged = pa.concat_tables(tables).combine_chunks()
+        encoded = pa.table(
+            {
+                name: (
+                    pc.dictionary_encode(merged[name])
+                    if name in DICTIONARY_COLUMNS
+                    else merged[name]
+                )
+                for name in FACT_COLUMNS
+            }
+        ).combine_chunks()
+
+        path = self.path_of(yyyymmdd)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, encoded.schema) as writer:
+                writer.write_table(encoded)
+        os.replace(tmp_path, path)
+
+        self.logger.info(f"[DONE] write {encoded.num_rows} facts to {path}")
+        return encoded.num_rows
+
+    @staticmethod
+    def decode(table: pa.Table) -> pa.Table:
+        """辞書符号化した列を文字列に戻す(異なる辞書を持つ表を連結するため)"""
+        return pa.table({name: table[name].cast(pa.string()) for name in FACT_COLUMNS})
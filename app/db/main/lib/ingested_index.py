@@ -0,0 +1,179 @@
+from dataclasses import dataclass, field
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+from typing import Iterable, Optional
+
+# ファイルの先頭: マジック, ビット数, ハッシュ関数の数, 登録した件数
+HEADER = struct.Struct(">4sQIQ")
+MAGIC = b"IRBF"
+
+
+@dataclass
+class BloomFilter:
+    """
+    キーの集合を固定長のビット列で表す。
+    「含まれない」という判定は確実で、「含まれる」という判定は誤り(偽陽性)のことがある。
+    ハッシュ値はblake2bの128ビットを2つに分け、ダブルハッシングでhashes個の位置を作る。
+    """
+
+    size: int  # ビット数
+    hashes: int
+    bits: Optional[bytearray] = None
+    count: int = 0
+
+    def __post_init__(self):
+        if self.bits is None:
+            self.bits = bytearray((self.size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float) -> "BloomFilter":
+        """capacity件を登録したときに偽陽性率がerror_rateになる大きさで作る"""
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        hashes = max(1, round(size / capacity * math.log(2)))
+        return cls(size=size, hashes=hashes)
+
+    def positions(self, key: str) -> list[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str) -> bool:
+        """キーを登録する。新しいキーだった(いずれかのビットが変わった)ならTrue"""
+        added = False
+        for position in self.positions(key):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.positions(key)
+        )
+
+    def union(self, other: "BloomFilter"):
+        """同じ大きさのフィルタの内容を取り込む(別のマシンで登録した分をまとめる)"""
+        if (other.size, other.hashes) != (self.size, self.hashes):
+            raise ValueError(
+                f"cannot merge bloom filters of different shapes: "
+                f"({other.size}, {other.hashes}) != ({self.size}, {self.hashes})"
+            )
+        merged = int.from_bytes(self.bits, "big") | int.from_bytes(other.bits, "big")
+        self.bits = bytearray(merged.to_bytes(len(self.bits), "big"))
+        self.count = self.estimate_count(merged.bit_count())
+
+    def estimate_count(self, bits_set: int) -> int:
+        """立っているビット数から登録件数を推定する"""
+        if bits_set >= self.size:
+            return self.count
+        return round(-self.size / self.hashes * math.log(1 - bits_set / self.size))
+
+    def error_rate(self) -> float:
+        """現在の件数での偽陽性率の見積もり"""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+    def to_bytes(self) -> bytes:
+        return HEADER.pack(MAGIC, self.size, self.hashes, self.count) + self.bits
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        magic, size, hashes, count = HEADER.unpack_from(data)
+        bits = bytearray(data[HEADER.size :])
+        if magic != MAGIC or len(bits) != (size + 7) // 8:
+            raise ValueError("not a bloom filter file")
+        return cls(size=size, hashes=hashes, bits=bits, count=count)
+
+
+@dataclass
+class IngestedIndex:
+    """
+    取り込み済みの書類(docID, submitDateTime)の索引。ダウンロードの前に引き、
+    「ない」と判定した書類はDynamoDBに問い合わせずにそのまま取り込む。
+    「あるかもしれない」書類だけをDynamoDBで確かめる。
+    既定の大きさ(500万件で偽陽性率1%)で約6MB。
+    """
+
+    path: str
+    filter: BloomFilter
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    logger = logging.getLogger(__name__)
+
+    CAPACITY = 5_000_000
+    ERROR_RATE = 0.01
+
+    @classmethod
+    def load(
+        cls, path: str, capacity: int = CAPACITY, error_rate: float = ERROR_RATE
+    ) -> "IngestedIndex":
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    return cls(path=path, filter=BloomFilter.from_bytes(f.read()))
+            except (ValueError, struct.error):
+                cls.logger.warning(f"[SKIP] broken ingested index {path}")
+        return cls.create(path, capacity=capacity, error_rate=error_rate)
+
+    @classmethod
+    def create(
+        cls, path: str, capacity: int = CAPACITY, error_rate: float = ERROR_RATE
+    ) -> "IngestedIndex":
+        """空の索引を作る(カタログから作り直す場合など)"""
+        return cls(path=path, filter=BloomFilter.for_capacity(capacity, error_rate))
+
+    @staticmethod
+    def key_of(doc_id: str, submit_date_time: str) -> str:
+        return f"{doc_id}\t{submit_date_time}"
+
+    def might_contain(self, doc_id: str, submit_date_time: str) -> bool:
+        return self.key_of(doc_id, submit_date_time) in self.filter
+
+    def add_all(self, keys: Iterable[tuple[str, str]]) -> int:
+        """(docID, submitDateTime)を登録し、新しく登録した件数を返す"""
+        # パイプラインのワーカースレッドから呼ばれるため、ビットの更新が混ざらないようにする
+        with self.lock:
+            return sum(self.filter.add(self.key_of(*key)) for key in keys)
+
+    def merge(self, data: bytes):
+        """保存されたフィルタ(S3に共有された分など)の内容を取り込む"""
+        with self.lock:
+            self.filter.union(BloomFilter.from_bytes(data))
+
+    def to_bytes(self) -> bytes:
+        with self.lock:
+            return self.filter.to_bytes()
+
+    def save(self, merge: bool = True):
+        """
+        索引を保存する。既定では、同じwork_dirで動く他のプロセス(分散モードのワーカーなど)が
+        保存した分を失わないよう、先に取り込んでから置き換える。
+        merge=Falseなら取り込まずに置き換える(作り直した索引から古いキーを消す場合)。
+        """
+        if merge and os.path.exists(self.path):
+            try:
+                with open(self.path, "rb") as f:
+                    self.merge(f.read())
+            except (ValueError, struct.error):
+                self.logger.warning(f"[SKIP] broken ingested index {self.path}")
+
+        data = self.to_bytes()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+        if self.filter.error_rate() > self.ERROR_RATE:
+            self.logger.warning(
+                f"[INDEX] {self.path} holds {self.filter.count} keys; "
+                f"false positive rate is now {self.filter.error_rate():.2%}"
+            )
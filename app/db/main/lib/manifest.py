@@ -0,0 +1,124 @@
+from dataclasses import asdict, dataclass, field
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+
+@dataclass
+class ManifestEntry:
+    doc_id: str
+    doc_type: str  # DocType.name
+    filepath: str
+    size: int
+    md5: str
+    etag: Optional[str] = None  # S3のETag(単一パートのput_objectならmd5と一致する)
+    cloudpath: Optional[str] = None
+
+
+@dataclass
+class IngestionManifest:
+    """
+    ダウンロード/アップロード済みのファイルを(docID, 書類種別)単位で記録するマニフェスト。
+    追記型のJSON Lines形式で保存し、読み込み時は後の行で上書きする。
+    再実行時に、手元に完全な状態で残っているファイルの再ダウンロード・再アップロードを省く。
+    """
+
+    path: str
+    entries: dict[tuple[str, str], ManifestEntry] = field(default_factory=dict)
+    # ダウンロード・アップロードのワーカースレッドから追記するため、行が混ざらないようにする
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    logger = logging.getLogger(__name__)
+
+    @classmethod
+    def load(cls, path: str) -> "IngestionManifest":
+        manifest = cls(path=path)
+        if not os.path.exists(path):
+            return manifest
+
+        lines = 0
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = ManifestEntry(**json.loads(line))
+                except (ValueError, TypeError):
+                    # 書き込み途中で落ちた末尾行は読み捨てる
+                    cls.logger.warning(f"[SKIP] broken manifest line in {path}")
+                    continue
+                manifest.entries[(entry.doc_id, entry.doc_type)] = entry
+                lines += 1
+
+        # 上書きされた行が溜まってきたら詰め直す
+        if lines > 2 * len(manifest.entries):
+            manifest.compact()
+        return manifest
+
+    def get(self, doc_id: str, doc_type: str) -> Optional[ManifestEntry]:
+        return self.entries.get((doc_id, doc_type))
+
+    def is_downloaded(self, doc_id: str, doc_type: str, filepath: str) -> bool:
+        """記録と同じサイズのファイルが手元に残っているか"""
+        entry = self.get(doc_id, doc_type)
+        if entry is None or entry.filepath != filepath:
+            return False
+        try:
+            return os.path.getsize(filepath) == entry.size
+        except OSError:
+            return False
+
+    def is_uploaded(self, doc_id: str, doc_type: str, filepath: str) -> bool:
+        """手元のファイルと同じ内容がS3に保存済みか"""
+        entry = self.get(doc_id, doc_type)
+        return (
+            self.is_downloaded(doc_id, doc_type, filepath)
+            and entry.etag is not None
+            and entry.etag.strip('"') == entry.md5
+        )
+
+    def record_download(self, doc_id: str, doc_type: str, filepath: str):
+        """ダウンロードしたファイルのサイズとmd5を記録する"""
+        md5 = hashlib.md5()
+        with open(filepath, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                md5.update(chunk)
+
+        self.append(
+            ManifestEntry(
+                doc_id=doc_id,
+                doc_type=doc_type,
+                filepath=filepath,
+                size=os.path.getsize(filepath),
+                md5=md5.hexdigest(),
+            )
+        )
+
+    def record_upload(self, doc_id: str, doc_type: str, etag: str, cloudpath: str):
+        entry = self.get(doc_id, doc_type)
+        if entry is None:
+            return
+        entry.etag = etag
+        entry.cloudpath = cloudpath
+        self.append(entry)
+
+    def append(self, entry: ManifestEntry):
+        line = json.dumps(asdict(entry), ensure_ascii=False) + "\n"
+        with self.lock:
+            self.entries[(entry.doc_id, entry.doc_type)] = entry
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def compact(self):
+        """最新のエントリだけを書き直す"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(asdict(entry), ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
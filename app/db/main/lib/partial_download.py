@@ -0,0 +1,101 @@
+from dataclasses import dataclass
+import os
+import re
+from typing import Optional
+import zipfile
+
+import aiohttp
+
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class CorruptDownloadError(Exception):
+    """ダウンロードしたファイルがzipとして読めない(再試行しても直らない)"""
+
+
+def verify_zip(path: str):
+    """zipの末尾の中央ディレクトリが読めるか確認する(途中で切れたファイルはここで弾かれる)"""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            archive.infolist()
+    except (zipfile.BadZipFile, OSError) as e:
+        raise CorruptDownloadError(f"{path} is not a valid zip: {e}") from e
+
+
+@dataclass
+class PartialDownload:
+    """
+    書類1ファイル分のダウンロード途中の状態。
+    本体は{filepath}.partに書き込み、サイズとzipの中央ディレクトリを確認してから置き換える。
+    途中で失敗した場合、サーバがRangeに対応していれば次の試行で続きから取得する
+    (If-Rangeで、最初の応答から内容が変わっていないことを条件にする)。
+    """
+
+    filepath: str
+    validator: Optional[str] = None  # 最初の応答のETagまたはLast-Modified
+    total: Optional[int] = None  # ファイル全体のサイズ
+    resumable: bool = False  # 最初の応答がAccept-Ranges: bytesだったか
+
+    @property
+    def part_path(self) -> str:
+        return f"{self.filepath}.part"
+
+    def offset(self) -> int:
+        try:
+            return os.path.getsize(self.part_path)
+        except OSError:
+            return 0
+
+    def reset(self):
+        """途中までの内容を捨てて最初から取り直す"""
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+        self.validator = None
+        self.total = None
+        self.resumable = False
+
+    def request_headers(self) -> dict[str, str]:
+        offset = self.offset()
+        if not (self.resumable and offset):
+            return {}
+        headers = {"Range": f"bytes={offset}-"}
+        if self.validator:
+            headers["If-Range"] = self.validator
+        return headers
+
+    def start(self, response: aiohttp.ClientResponse) -> tuple[str, int]:
+        """応答から書き込みの開始位置を決める。(ファイルを開くモード, 開始位置)を返す"""
+        offset = self.offset()
+        if response.status == 206:
+            match = CONTENT_RANGE.fullmatch(response.headers.get("Content-Range", ""))
+            total = int(match[3]) if match and match[3] != "*" else None
+            if match and int(match[1]) == offset and total == self.total:
+                return "ab", offset
+            self.reset()
+            raise aiohttp.ClientPayloadError(
+                f"unexpected Content-Range for {self.filepath}: "
+                f"{response.headers.get('Content-Range')}"
+            )
+
+        # 200は(If-Rangeが一致しなかった場合も含め)全体が返ってくる
+        self.validator = response.headers.get("ETag") or response.headers.get(
+            "Last-Modified"
+        )
+        self.resumable = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+        self.total = response.content_length
+        return "wb", 0
+
+    def complete(self):
+        """全体を受け取ったことを確かめてから、最終的なパスに置き換える"""
+        size = self.offset()
+        if self.total is not None and size != self.total:
+            # 接続が途中で切れた。次の試行で続きから取得する
+            raise aiohttp.ClientPayloadError(
+                f"{self.filepath} is incomplete: {size}/{self.total} bytes"
+            )
+        try:
+            verify_zip(self.part_path)
+        except CorruptDownloadError:
+            self.reset()
+            raise
+        os.replace(self.part_path, self.filepath)
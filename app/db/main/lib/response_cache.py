@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+from datetime import date, datetime
+import json
+import logging
+import os
+import time
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+
+@dataclass
+class DocumentListCache:
+    """
+    書類一覧APIのレスポンスを(日付, type)単位でディスクにキャッシュする。
+    - 取得した時点で十分に古い日付(immutable_after_days日以上前)の一覧は、以後変わらないものとして扱う
+    - それ以外(直近の日付)の一覧は recent_ttl 秒だけ有効とする
+    鮮度はキャッシュファイルの更新時刻で判定する。
+    """
+
+    cache_dir: str
+    recent_ttl: float = 600.0
+    immutable_after_days: int = 30
+
+    logger = logging.getLogger(__name__)
+    TZ = ZoneInfo("Asia/Tokyo")  # EDINETの日付は日本時間
+
+    def path_of(self, yyyymmdd: str, type: str) -> str:
+        return f"{self.cache_dir}/type{type}/{yyyymmdd}.json"
+
+    def get(self, yyyymmdd: str, type: str) -> Optional[dict]:
+        """有効期限内のキャッシュがあれば返す"""
+        path = self.path_of(yyyymmdd, type)
+        if not os.path.exists(path) or not self.is_fresh(yyyymmdd, path):
+            return None
+        self.logger.info(f"[HIT] document list cache {path}")
+        return self.read(path)
+
+    def get_stale(self, yyyymmdd: str, type: str) -> Optional[dict]:
+        """有効期限に関わらずキャッシュを返す(再検証用)"""
+        path = self.path_of(yyyymmdd, type)
+        if not os.path.exists(path):
+            return None
+        return self.read(path)
+
+    def put(self, yyyymmdd: str, type: str, payload: dict):
+        path = self.path_of(yyyymmdd, type)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def touch(self, yyyymmdd: str, type: str):
+        """再検証で変更がなかったキャッシュの有効期限を延ばす"""
+        os.utime(self.path_of(yyyymmdd, type))
+
+    def is_fresh(self, yyyymmdd: str, path: str) -> bool:
+        fetched_at = os.path.getmtime(path)
+        fetched_date = datetime.fromtimestamp(fetched_at, tz=self.TZ).date()
+        if (
+            fetched_date - date.fromisoformat(yyyymmdd)
+        ).days >= self.immutable_after_days:
+            return True
+        return time.time() - fetched_at < self.recent_ttl
+
+    def read(self, path: str) -> Optional[dict]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except ValueError:
+            self.logger.warning(f"[SKIP] broken document list cache {path}")
+            return None
@@ -0,0 +1,89 @@
+import re
+import unicodedata
+from typing import Optional
+
+# 全文検索の対象とする項目と、順位付けでの重み(企業名での一致を重く扱う)
+FIELD_WEIGHTS = {"filerName": 2.0, "docDescription": 1.0}
+TEXT_FIELDS = tuple(FIELD_WEIGHTS)
+
+NGRAM = 2
+WORD = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """全角英数字・半角カナの揺れを吸収する"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def to_ngrams(text: Optional[str], n: int = NGRAM) -> list[str]:
+    """
+    文字n-gramに分割する。形態素解析なしで日本語を部分一致で引けるようにするため。
+    記号・空白で区切られた語ごとに分割し、n文字未満の語はそのまま1トークンとする。
+    """
+    if not text:
+        return []
+    tokens = []
+    for word in WORD.findall(normalize(text)):
+        if len(word) <= n:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i : i + n] for i in range(len(word) - n + 1))
+    return tokens
+
+
+def to_document(text: Optional[str]) -> str:
+    """FTS5に登録する文字列(n-gramを空白区切りにしたもの)"""
+    return " ".join(to_ngrams(text))
+
+
+def to_match_query(query: str, field: Optional[str] = None) -> Optional[str]:
+    """
+    検索語をFTS5のMATCH式に変換する。空白区切りの各語はAND条件。
+    n文字以上の語は連続するn-gramのフレーズ(=部分一致)とする。
+    n文字未満の語はn-gramの2文字目以降に現れると引けないため含めない(short_wordsを参照)。
+    """
+    phrases = [
+        '"' + " ".join(to_ngrams(word)) + '"'
+        for word in WORD.findall(normalize(query))
+        if len(word) >= NGRAM
+    ]
+    if not phrases:
+        return None
+
+    expression = " AND ".join(phrases)
+    if field:
+        expression = f"{{{field}}} : ({expression})"
+    return expression
+
+
+def short_words(query: str) -> list[str]:
+    """
+    n文字未満の検索語。索引の項目(正規化したn-gramの並び)を
+    instr()で部分一致させて絞り込む(1文字の語がどのn-gramの何文字目にあっても引けるように)。
+    """
+    return [word for word in WORD.findall(normalize(query)) if len(word) < NGRAM]
+
+
+def score(query: str, item: dict) -> float:
+    """
+    検索結果の順位付け用のスコア。項目ごとに
+    一致した語の数 + 項目のうち一致した部分の割合(短い項目での一致ほど高い) + 先頭一致
+    を重み付けして足し合わせる。
+    """
+    words = WORD.findall(normalize(query))
+    total = 0.0
+    for name, weight in FIELD_WEIGHTS.items():
+        text = normalize(item.get(name) or "")
+        matched = [word for word in words if word in text]
+        if not matched:
+            continue
+        coverage = sum(len(word) for word in matched) / len(text)
+        prefix = 0.5 if text.startswith(words[0]) else 0.0
+        total += weight * (len(matched) + coverage + prefix)
+    return total
+
+
+def max_score(query: str) -> float:
+    """scoreが取りうる最高点(全項目が検索語と完全に一致した場合)"""
+    words = WORD.findall(normalize(query))
+    return sum(weight * (len(words) + 1.0 + 0.5) for weight in FIELD_WEIGHTS.values())
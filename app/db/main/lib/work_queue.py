@@ -0,0 +1,353 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Iterable
+import uuid
+
+from botocore.exceptions import ClientError
+
+from common.main.lib.retry_policy import DecorrelatedJitter, retry_policy
+
+
+@dataclass
+class WorkUnit:
+    """1ファイル分(書類, 種類)の作業。documentは書類一覧の1行で、ワーカーは一覧を取得し直さない"""
+
+    doc_id: str
+    doc_type: str  # DocType.name
+    document: dict
+
+
+@dataclass
+class Lease:
+    """claim()で払い出した作業。receiptが一致する間だけ延長・完了できる"""
+
+    unit: WorkUnit
+    receipt: str
+    attempts: int = 1  # 何回目の取得か
+
+
+class WorkQueue(ABC):
+    """
+    (書類, 種類)の作業を複数のワーカー(プロセス・ホスト)に配るキュー。
+    - claim()した作業はvisibility_timeout秒の間、他のワーカーからは見えない
+    - ワーカーは処理中にextend()で期限を延ばし(ハートビート)、終わったらcomplete()する
+    - ワーカーが落ちて期限が切れた作業は、他のワーカーが取り直す
+    """
+
+    @abstractmethod
+    def put(self, units: Iterable[WorkUnit]) -> int:
+        """作業を登録し、登録した件数を返す"""
+
+    @abstractmethod
+    def claim(self, max_units: int, visibility_timeout: float) -> list[Lease]:
+        pass
+
+    @abstractmethod
+    def extend(self, lease: Lease, visibility_timeout: float) -> bool:
+        """リースの期限を延ばす。期限切れで他のワーカーに渡っていればFalse"""
+
+    @abstractmethod
+    def complete(self, lease: Lease) -> bool:
+        pass
+
+    @abstractmethod
+    def release(self, lease: Lease, delay: float = 0.0):
+        """失敗した作業をdelay秒後に他のワーカーから見えるように戻す"""
+
+    @abstractmethod
+    def pending(self) -> int:
+        """未完了の作業の件数(処理中を含む)"""
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_id TEXT NOT NULL,
+    doc_type TEXT NOT NULL,
+    document TEXT NOT NULL,
+    visible_at REAL NOT NULL,
+    receipt TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    dead INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (doc_id, doc_type)
+);
+CREATE INDEX IF NOT EXISTS idx_units_visible ON units (dead, visible_at, id);
+"""
+
+
+@dataclass
+class SqliteWorkQueue(WorkQueue):
+    """
+    1台のマシンで動かすためのSQLite上のキュー(複数プロセスから同じファイルを開いてよい)。
+    未完了の(書類, 種類)は重複して登録しないため、同じ日付を投入し直しても作業は増えない。
+    max_attempts回取得しても完了しなかった作業はdeadにして以後配らない。
+    """
+
+    path: str
+    max_attempts: int = 5
+    connection: sqlite3.Connection = field(init=False, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    logger = logging.getLogger(__name__)
+
+    def __post_init__(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 自分で BEGIN IMMEDIATE するため、暗黙のトランザクションは使わない
+        self.connection = sqlite3.connect(
+            self.path, timeout=30.0, isolation_level=None, check_same_thread=False
+        )
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    @contextmanager
+    def transaction(self):
+        """書き込みロックを取ったトランザクション(BEGIN IMMEDIATE)"""
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def put(self, units: Iterable[WorkUnit]) -> int:
+        now = time.time()
+        rows = [
+            (
+                unit.doc_id,
+                unit.doc_type,
+                json.dumps(unit.document, ensure_ascii=False),
+                now,
+            )
+            for unit in units
+        ]
+        with self.transaction():
+            before = self.connection.total_changes
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO units (doc_id, doc_type, document, visible_at) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            return self.connection.total_changes - before
+
+    def claim(self, max_units: int, visibility_timeout: float) -> list[Lease]:
+        now = time.time()
+        # 他のプロセスと同じ作業を取り合わないよう、書き込みロックを取ってから選ぶ
+        with self.transaction():
+            rows = self.connection.execute(
+                "SELECT * FROM units WHERE dead = 0 AND visible_at <= ? "
+                "ORDER BY id LIMIT ?",
+                (now, max_units),
+            ).fetchall()
+            leases = []
+            for row in rows:
+                if row["attempts"] >= self.max_attempts:
+                    self.connection.execute(
+                        "UPDATE units SET dead = 1 WHERE id = ?", (row["id"],)
+                    )
+                    self.logger.error(
+                        f"[DEAD] {row['doc_id']} {row['doc_type']} "
+                        f"failed {row['attempts']} times"
+                    )
+                    continue
+                receipt = uuid.uuid4().hex
+                self.connection.execute(
+                    "UPDATE units SET receipt = ?, visible_at = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (receipt, now + visibility_timeout, row["id"]),
+                )
+                leases.append(
+                    Lease(
+                        unit=WorkUnit(
+                            doc_id=row["doc_id"],
+                            doc_type=row["doc_type"],
+                            document=json.loads(row["document"]),
+                        ),
+                        receipt=receipt,
+                        attempts=row["attempts"] + 1,
+                    )
+                )
+        return leases
+
+    def update(self, sql: str, *values: Any) -> bool:
+        with self.lock:
+            return self.connection.execute(sql, values).rowcount > 0
+
+    def extend(self, lease: Lease, visibility_timeout: float) -> bool:
+        return self.update(
+            "UPDATE units SET visible_at = ? WHERE receipt = ? AND dead = 0",
+            time.time() + visibility_timeout,
+            lease.receipt,
+        )
+
+    def complete(self, lease: Lease) -> bool:
+        return self.update("DELETE FROM units WHERE receipt = ?", lease.receipt)
+
+    def release(self, lease: Lease, delay: float = 0.0):
+        self.update(
+            "UPDATE units SET visible_at = ?, receipt = NULL WHERE receipt = ?",
+            time.time() + delay,
+            lease.receipt,
+        )
+
+    def pending(self) -> int:
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM units WHERE dead = 0"
+            ).fetchone()[0]
+
+
+@dataclass
+class SqsWorkQueue(WorkQueue):
+    """
+    本番用のAmazon SQS(互換のキュー)。clientはboto3のSQSクライアント。
+    可視性タイムアウトとChangeMessageVisibilityでリースを表す。
+    何度も失敗した作業の打ち切りは、キューのリドライブポリシー(デッドレターキュー)で設定する。
+    SQSは重複を除かないため、同じ日付を二度投入すると作業も二度行われる(結果は冪等)。
+    """
+
+    client: Any
+    queue_url: str
+    max_attempts: int = 5  # 送信に失敗した(Failedで返った)メッセージを送り直す回数
+    base_delay: float = 0.05
+    max_delay: float = 5.0
+
+    BATCH_SIZE = 10  # SendMessageBatch/ReceiveMessageの上限
+    MAX_VISIBILITY_TIMEOUT = 12 * 3600
+    # 期限切れで他のワーカーに渡ったメッセージのReceiptHandleを使うと返るエラー
+    LOST_LEASE_CODES = frozenset(
+        {"ReceiptHandleIsInvalid", "MessageNotInflight", "InvalidParameterValue"}
+    )
+
+    def put(self, units: Iterable[WorkUnit]) -> int:
+        units = list(units)
+        for start in range(0, len(units), self.BATCH_SIZE):
+            self.send_batch(units[start : start + self.BATCH_SIZE])
+        return len(units)
+
+    def send_batch(self, units: list[WorkUnit]):
+        """
+        SendMessageBatch(最大10件)で送る。SQSは重複を除かないため、
+        送信済みのメッセージは送り直さず、Failedで返ったメッセージだけを間隔を空けて送り直す。
+        """
+        entries = {
+            str(i): {
+                "Id": str(i),
+                "MessageBody": json.dumps(asdict(unit), ensure_ascii=False),
+            }
+            for i, unit in enumerate(units)
+        }
+        jitter = DecorrelatedJitter(base=self.base_delay, cap=self.max_delay)
+        for _ in range(self.max_attempts):
+            failed = self.send_message_batch(list(entries.values())).get("Failed", [])
+            if not failed:
+                return
+            # 送信側の誤り(大きすぎるメッセージなど)は送り直しても成功しない
+            if any(entry.get("SenderFault") for entry in failed):
+                raise RuntimeError(f"SendMessageBatch rejected messages: {failed}")
+            entries = {entry["Id"]: entries[entry["Id"]] for entry in failed}
+            time.sleep(jitter.next())
+        raise RuntimeError(
+            f"SendMessageBatch left {len(entries)} messages unsent "
+            f"after {self.max_attempts} attempts."
+        )
+
+    @retry_policy("sqs")
+    def send_message_batch(self, entries: list[dict]) -> dict:
+        return self.client.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+
+    @retry_policy("sqs")
+    def claim(self, max_units: int, visibility_timeout: float) -> list[Lease]:
+        response = self.client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_units, self.BATCH_SIZE),
+            VisibilityTimeout=self.timeout_of(visibility_timeout),
+            WaitTimeSeconds=1,
+            MessageSystemAttributeNames=["ApproximateReceiveCount"],
+        )
+        return [
+            Lease(
+                unit=WorkUnit(**json.loads(message["Body"])),
+                receipt=message["ReceiptHandle"],
+                attempts=int(
+                    message.get("Attributes", {}).get("ApproximateReceiveCount", 1)
+                ),
+            )
+            for message in response.get("Messages", [])
+        ]
+
+    def extend(self, lease: Lease, visibility_timeout: float) -> bool:
+        return self.change_visibility(lease, visibility_timeout)
+
+    @retry_policy("sqs")
+    def complete(self, lease: Lease) -> bool:
+        try:
+            self.client.delete_message(
+                QueueUrl=self.queue_url, ReceiptHandle=lease.receipt
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in self.LOST_LEASE_CODES:
+                raise
+            return False
+        return True
+
+    def release(self, lease: Lease, delay: float = 0.0):
+        self.change_visibility(lease, delay)
+
+    @retry_policy("sqs")
+    def pending(self) -> int:
+        attributes = self.client.get_queue_attributes(
+            QueueUrl=self.queue_url,
+            AttributeNames=[
+                "ApproximateNumberOfMessages",
+                "ApproximateNumberOfMessagesNotVisible",
+            ],
+        )["Attributes"]
+        return sum(int(value) for value in attributes.values())
+
+    @retry_policy("sqs")
+    def change_visibility(self, lease: Lease, timeout: float) -> bool:
+        try:
+            self.client.change_message_visibility(
+                QueueUrl=self.queue_url,
+                ReceiptHandle=lease.receipt,
+                VisibilityTimeout=self.timeout_of(timeout),
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in self.LOST_LEASE_CODES:
+                raise
+            return False
+        return True
+
+    def timeout_of(self, seconds: float) -> int:
+        return max(0, min(math.ceil(seconds), self.MAX_VISIBILITY_TIMEOUT))
+
+
+def open_work_queue(spec: str, aws_session=None) -> WorkQueue:
+    """
+    "sqlite:{path}" または "sqs:{queue_url}" からキューを開く。
+    SQSを使う場合はaws_session(boto3.Session)が必要。
+    """
+    scheme, _, target = spec.partition(":")
+    if scheme == "sqlite":
+        return SqliteWorkQueue(path=target)
+    if scheme == "sqs":
+        if aws_session is None:
+            raise ValueError("an AWS session is required for an SQS work queue")
+        return SqsWorkQueue(client=aws_session.client("sqs"), queue_url=target)
+    raise ValueError(f"unknown work queue: {spec}")
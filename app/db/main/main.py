@@ -1,61 +1,847 @@
+from __future__ import annotations
+
+import argparse
 import asyncio
+from dataclasses import dataclass, replace
+from datetime import datetime
+import logging
+import os
+import shutil
+import time
+from typing import TYPE_CHECKING, Optional
+
+from common.main.lib.log_utils import use_queue_logging
+from common.main.lib.metrics import METRICS
+from common.main.lib.utils import Utils
+
+# boto3/aiohttp/pyarrowなどは読み込みに時間がかかるため、サブコマンドの中で必要な分だけimportする
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
 
-from db.main.model.edinet.document_item import DbItem
-from db.main.model.edinet.document_list_response_type2 import DocumentListResponseType2
-from db.main.strategy.strategy import (
-    CreateAwsSession,
-    DownloadDocumentFromEdiNetApi,
-    GetApiKeyFromAws,
-    GetDocumentListFromEdiNetApi,
-    GetItemsFromDocumentListReaponse,
-    InsertItemsToDynamoDb,
-    UploadToAwsS3,
-)
+    from boto3.session import Session
+
+    from common.main.lib.rate_limiter import AdaptiveRateLimiter
+    from db.main.lib.catalog import DocumentCatalog
+    from db.main.lib.download_scheduler import DownloadPolicy
+    from db.main.lib.edinet_client import EdinetClient
+    from db.main.lib.ingested_index import IngestedIndex
+    from db.main.lib.manifest import IngestionManifest
+    from db.main.model.edinet.document_item import DbItem
+    from db.main.model.edinet.document_list_response_type2 import (
+        DocumentListResponseType2,
+    )
 
 
 # with open("app/common/main/resources/document_list_response_type2.json") as f:
 #     resp = json.loads(f.read())
 
 
-async def run():
+@dataclass(frozen=True)
+class Settings:
+    """
+    取り込みの設定。既定値は本番の環境で、起動時の引数で上書きできる。
+    run/backfillなどの各サブコマンドにはsettingsで渡す(省略すると既定値)。
+    """
+
+    profile: Optional[str] = "gb86sub"  # Noneなら既定の認証情報(環境変数・ロールなど)
+    secret_name: str = "EdinetApiKey"
+    key_name: str = (
+        "EDINET_API_KEY"  # 同名の環境変数があればSecrets Managerより優先する
+    )
+    region_name: str = "ap-northeast-1"
+    work_dir: str = "edinet-document"
+    target_table: str = "edinet-document_list-api"
+    api_key_cache: Optional[str] = os.path.join(
+        os.path.expanduser("~"), ".cache", "irir", "api_key.json"
+    )
+    api_key_ttl: float = 6 * 3600.0
+    refresh_api_key: bool = False
+    # 取り込み済みの索引をS3にも保存し、他のマシンと共有する
+    share_ingested_index: bool = False
+    # 分散モードの作業キュー("sqlite:{path}" または "sqs:{queue_url}")。Noneならwork_dirのSQLite
+    work_queue: Optional[str] = None
+    # (書類, 種類)ごとのダウンロードで最優先にする企業と、添付・英文を諦めるまでの秒数
+    watched_edinet_codes: frozenset[str] = frozenset()
+    download_deadline: Optional[float] = None
+
+    @property
+    def checkpoint_path(self) -> str:
+        return f"{self.work_dir}/backfill_checkpoint.json"
+
+    @property
+    def manifest_path(self) -> str:
+        return f"{self.work_dir}/manifest.jsonl"
+
+    @property
+    def cache_dir(self) -> str:
+        return f"{self.work_dir}/cache/documents"
+
+    @property
+    def catalog_path(self) -> str:
+        return f"{self.work_dir}/catalog.sqlite3"
+
+    @property
+    def ingested_index_path(self) -> str:
+        return f"{self.work_dir}/ingested.bloom"
+
+    @property
+    def work_queue_spec(self) -> str:
+        return self.work_queue or f"sqlite:{self.work_dir}/work_queue.sqlite3"
+
+    @property
+    def facts_dir(self) -> str:
+        return f"{self.work_dir}/facts"
 
-    profile = "gb86sub"
-    secret_name = "EdinetApiKey"
-    key_name = "EDINET_API_KEY"
-    region_name = "ap-northeast-1"
-    yyyymmdd = "2023-08-28"
-    work_dir = "edinet-document"
-    target_table = "edinet-document_list-api"
+    @property
+    def metrics_dir(self) -> str:
+        return f"{self.work_dir}/metrics"
 
-    session = CreateAwsSession(profile_name=profile).execute()
 
-    apikey = GetApiKeyFromAws(
+logger = logging.getLogger(__name__)
+
+
+def create_session(settings: Settings) -> Session:
+    from db.main.strategy.strategy import CreateAwsSession
+
+    return CreateAwsSession(profile_name=settings.profile).execute()
+
+
+def get_api_key(settings: Settings, session: Session) -> str:
+    """
+    EDINETのAPIキーを返す。環境変数→ローカルのキャッシュ→Secrets Managerの順に探す。
+    キャッシュが有効な間はSecrets Managerのクライアントを作らない。
+    """
+    from db.main.lib.credential_cache import ApiKeyCache
+    from db.main.strategy.strategy import GetApiKeyFromAws
+
+    apikey = os.environ.get(settings.key_name)
+    if apikey:
+        return apikey
+
+    return GetApiKeyFromAws(
         aws_session=session,
-        secret_name=secret_name,
-        key_name=key_name,
-        region_name=region_name,
+        secret_name=settings.secret_name,
+        key_name=settings.key_name,
+        region_name=settings.region_name,
+        cache=(
+            ApiKeyCache(path=settings.api_key_cache, ttl=settings.api_key_ttl)
+            if settings.api_key_cache
+            else None
+        ),
+        refresh=settings.refresh_api_key,
     ).execute()
 
-    documentlist: DocumentListResponseType2 = GetDocumentListFromEdiNetApi(
-        type="2", api_key=apikey, yyyymmdd=yyyymmdd
-    ).execute()
 
-    documentlist: DocumentListResponseType2 = GetItemsFromDocumentListReaponse(
-        document_list_response=documentlist
-    ).execute()
+async def ingest(
+    settings: Settings,
+    session: Session,
+    client: EdinetClient,
+    documentlist: DocumentListResponseType2,
+    rate_limiter: AdaptiveRateLimiter,
+    manifest: IngestionManifest,
+    catalog: DocumentCatalog,
+    index: IngestedIndex | None = None,
+    limit: int | None = None,
+    pipeline_options: dict | None = None,
+    facts_executor: ProcessPoolExecutor | None = None,
+) -> tuple[list[DbItem], set[str]]:
+    """
+    フィルタ済みの書類一覧をダウンロード→S3アップロード→DynamoDB登録する。
+    各ステージはパイプラインで繋がっており、書類ごとに準備ができ次第次のステージへ進む。
+    最後にCSV/XBRLからファクトを取り出し、日付ごとのファイルに保存する。
+    indexを渡すと、取り込み済みの書類をダウンロードの前に除き、登録した書類を索引に加えて保存する。
+    pipeline_optionsでステージごとのワーカー数などを上書きできる。
+    facts_executorを渡すと、ファクトの取り出しにそのプロセスプールを使う(日付をまたいで使い回す)。
+    登録まで終わった書類と、途中で失敗した書類のdocIDを返す。
+    """
+    from db.main.lib.facts import FactsStore
+    from db.main.strategy.pipeline import IngestDocumentsByPipeline
+    from db.main.strategy.strategy import (
+        BatchInsertItemsToDynamoDb,
+        DownloadDocumentFromEdiNetApi,
+        DropIngestedDocuments,
+        ExtractFactsFromDocuments,
+        UploadToAwsS3,
+    )
 
-    db_items: list[DbItem] = await DownloadDocumentFromEdiNetApi(
-        api_key=apikey, documentlist=documentlist, work_dir=work_dir
-    ).execute()
+    inserter = BatchInsertItemsToDynamoDb(
+        aws_session=session,
+        items=[],
+        target_table=settings.target_table,
+        catalog=catalog,
+        index=index,
+    )
+    if index is not None:
+        documentlist = DropIngestedDocuments(
+            document_list_response=documentlist, index=index, inserter=inserter
+        ).execute()
 
-    db_items: list[DbItem] = await UploadToAwsS3(
-        aws_session=session, db_items=db_items, region_name=region_name
-    ).execute()
+    pipeline = IngestDocumentsByPipeline(
+        downloader=DownloadDocumentFromEdiNetApi(
+            client=client,
+            documentlist=documentlist,
+            work_dir=settings.work_dir,
+            limit=limit,
+            rate_limiter=rate_limiter,
+            manifest=manifest,
+            policy=download_policy(settings),
+        ),
+        uploader=UploadToAwsS3(
+            aws_session=session,
+            db_items=[],
+            region_name=settings.region_name,
+            manifest=manifest,
+        ),
+        inserter=inserter,
+        **(pipeline_options or {}),
+    )
+    db_items = await pipeline.execute()
+    if index is not None:
+        save_ingested_index(settings, session, index)
 
-    InsertItemsToDynamoDb(
-        aws_session=session, items=db_items, target_table=target_table
+    await ExtractFactsFromDocuments(
+        db_items=db_items,
+        store=FactsStore(facts_dir=settings.facts_dir),
+        yyyymmdd=documentlist.metadata.parameter.date,
+        executor=facts_executor,
     ).execute()
+    return db_items, pipeline.failed_doc_ids
+
+
+def download_policy(settings: Settings) -> DownloadPolicy:
+    from db.main.lib.download_scheduler import DownloadPolicy
+
+    return DownloadPolicy(
+        watched_edinet_codes=settings.watched_edinet_codes,
+        deadline=settings.download_deadline,
+    )
+
+
+def load_ingested_index(settings: Settings, session: Session) -> IngestedIndex:
+    """取り込み済みの索引を読み込む。共有する設定ならS3に保存された分も取り込む"""
+    from db.main.lib.ingested_index import IngestedIndex
+    from db.main.strategy.strategy import GetIngestedIndexFromAwsS3
+
+    index = IngestedIndex.load(settings.ingested_index_path)
+    if settings.share_ingested_index:
+        GetIngestedIndexFromAwsS3(aws_session=session, index=index).execute()
+    return index
+
+
+def save_ingested_index(settings: Settings, session: Session, index: IngestedIndex):
+    from db.main.strategy.strategy import PutIngestedIndexToAwsS3
+
+    index.save()
+    if settings.share_ingested_index:
+        PutIngestedIndexToAwsS3(aws_session=session, index=index).execute()
+
+
+def write_metrics(settings: Settings, started_at: float):
+    """
+    実行ごとのメトリクスをJSONで保存し、時間のかかったメソッドをログに出す。
+    latest.jsonはバックエンドの/metricsが読む。
+    """
+    metrics_dir = settings.metrics_dir
+    stamp = datetime.fromtimestamp(started_at).strftime("%Y%m%dT%H%M%S")
+    path = f"{metrics_dir}/run-{stamp}.json"
+    summary = METRICS.write_summary(path, started_at=started_at)
+    shutil.copyfile(path, f"{metrics_dir}/latest.json.tmp")
+    os.replace(f"{metrics_dir}/latest.json.tmp", f"{metrics_dir}/latest.json")
+
+    for timing in summary["timings"][:5]:
+        logger.info(
+            f"[METRICS] {timing['strategy']}.{timing['method']} "
+            f"calls={timing['calls']} total={timing['total_seconds']}s "
+            f"p50={timing['p50_seconds']:.3f}s p99={timing['p99_seconds']:.3f}s"
+        )
+    logger.info(f"[DONE] write metrics to {path}")
+
+
+async def run(
+    yyyymmdd: str | None = None,
+    session: Session | None = None,
+    client: EdinetClient | None = None,
+    limit: int | None = None,
+    rate_limiter: AdaptiveRateLimiter | None = None,
+    pipeline_options: dict | None = None,
+    settings: Settings = Settings(),
+) -> list:
+    """
+    1日分(既定は日本時間の今日)の書類を取り込む。
+    session/clientを渡した場合はAWSの認証とAPIキーの取得を省く(ベンチマークでスタブに差し替える)。
+    """
+    from common.main.lib.rate_limiter import AdaptiveRateLimiter
+    from db.main.lib.catalog import DocumentCatalog
+    from db.main.lib.edinet_client import EdinetClient
+    from db.main.lib.manifest import IngestionManifest
+    from db.main.lib.response_cache import DocumentListCache
+    from db.main.strategy.strategy import (
+        GetDocumentListFromEdiNetApi,
+        GetItemsFromDocumentListReaponse,
+    )
+
+    yyyymmdd = yyyymmdd or Utils.today()
+    if session is None:
+        session = create_session(settings)
+
+    if client is None:
+        client = EdinetClient(api_key=get_api_key(settings, session))
+
+    async with client:
+        documentlist: DocumentListResponseType2 = await GetDocumentListFromEdiNetApi(
+            type="2",
+            client=client,
+            yyyymmdd=yyyymmdd,
+            cache=DocumentListCache(cache_dir=settings.cache_dir),
+        ).execute()
+
+        documentlist: DocumentListResponseType2 = GetItemsFromDocumentListReaponse(
+            document_list_response=documentlist
+        ).execute()
+
+        db_items, _ = await ingest(
+            settings=settings,
+            session=session,
+            client=client,
+            documentlist=documentlist,
+            rate_limiter=rate_limiter or AdaptiveRateLimiter(),
+            manifest=IngestionManifest.load(settings.manifest_path),
+            catalog=DocumentCatalog(path=settings.catalog_path),
+            index=load_ingested_index(settings, session),
+            limit=limit,
+            pipeline_options=pipeline_options,
+        )
+        return db_items
+
+
+async def backfill(
+    start: str,
+    end: str,
+    concurrency: int = 4,
+    limit: int | None = None,
+    settings: Settings = Settings(),
+):
+    """
+    start〜endの書類を日付順に取り込む。
+    日付ごとにチェックポイントを記録するため、途中で落ちても完了済みの日付は再実行されない。
+    失敗した書類があった日付は完了にしないため、次回の実行でその書類だけを取り込み直す。
+    """
+    from common.main.lib.rate_limiter import AdaptiveRateLimiter
+    from db.main.lib.catalog import DocumentCatalog
+    from db.main.lib.checkpoint import BackfillCheckpoint
+    from db.main.lib.edinet_client import EdinetClient
+    from db.main.lib.manifest import IngestionManifest
+    from db.main.lib.response_cache import DocumentListCache
+    from db.main.strategy.strategy import (
+        DropDuplicateDocuments,
+        ExtractFactsFromDocuments,
+        GetDocumentListsFromEdiNetApi,
+        GetItemsFromDocumentListReaponse,
+    )
+
+    checkpoint = BackfillCheckpoint.load(settings.checkpoint_path)
+    dates = [
+        yyyymmdd
+        for yyyymmdd in Utils.date_range(start, end)
+        if not checkpoint.is_completed(yyyymmdd)
+    ]
+
+    session = create_session(settings)
+    apikey = get_api_key(settings, session)
+
+    # 日付をまたいで同じリミッタを使い、EDINETへの流量を全体で制御する
+    rate_limiter = AdaptiveRateLimiter()
+    manifest = IngestionManifest.load(settings.manifest_path)
+    catalog = DocumentCatalog(path=settings.catalog_path)
+    index = load_ingested_index(settings, session)
+
+    # ファクトの取り出しのプロセスプールは、日付ごとに起動し直さず実行全体で使い回す
+    facts_executor = ExtractFactsFromDocuments.create_executor()
+    try:
+        # 書類一覧と書類本体の取得で同じコネクションプールを使う
+        async with EdinetClient(api_key=apikey) as client:
+            documentlists = GetDocumentListsFromEdiNetApi(
+                type="2",
+                client=client,
+                dates=dates,
+                concurrency=concurrency,
+                cache=DocumentListCache(cache_dir=settings.cache_dir),
+            ).execute()
+
+            async for yyyymmdd, documentlist in documentlists:
+                documentlist: DocumentListResponseType2 = (
+                    GetItemsFromDocumentListReaponse(
+                        document_list_response=documentlist
+                    ).execute()
+                )
+
+                documentlist: DocumentListResponseType2 = DropDuplicateDocuments(
+                    document_list_response=documentlist,
+                    seen_doc_ids=checkpoint.seen_doc_ids,
+                ).execute()
+
+                db_items, failed_doc_ids = await ingest(
+                    settings=settings,
+                    session=session,
+                    client=client,
+                    documentlist=documentlist,
+                    rate_limiter=rate_limiter,
+                    manifest=manifest,
+                    catalog=catalog,
+                    index=index,
+                    limit=limit,
+                    facts_executor=facts_executor,
+                )
+
+                # 失敗した書類があれば日付を完了にせず、次回の実行で取り込み直す
+                checkpoint.mark_completed(
+                    yyyymmdd,
+                    doc_ids=[db_item.docID for db_item in db_items],
+                    failed_doc_ids=failed_doc_ids,
+                )
+    finally:
+        facts_executor.shutdown()
+
+
+async def watch(interval: float = 60.0, settings: Settings = Settings()):
+    """
+    当日の書類一覧を定期的に監視し、新しく提出された書類だけを取り込む。
+    軽量なtype=1の件数が変わったときだけtype=2の一覧を取得する。
+    """
+    from common.main.lib.rate_limiter import AdaptiveRateLimiter
+    from db.main.lib.catalog import DocumentCatalog
+    from db.main.lib.checkpoint import BackfillCheckpoint
+    from db.main.lib.edinet_client import EdinetClient
+    from db.main.lib.manifest import IngestionManifest
+    from db.main.strategy.strategy import (
+        DropDuplicateDocuments,
+        ExtractFactsFromDocuments,
+        GetDocumentListFromEdiNetApi,
+        GetDocumentListMetadataFromEdiNetApi,
+        GetItemsFromDocumentListReaponse,
+    )
+
+    session = create_session(settings)
+    apikey = get_api_key(settings, session)
+
+    checkpoint = BackfillCheckpoint.load(settings.checkpoint_path)
+    rate_limiter = AdaptiveRateLimiter()
+    manifest = IngestionManifest.load(settings.manifest_path)
+    catalog = DocumentCatalog(path=settings.catalog_path)
+    index = load_ingested_index(settings, session)
+    last_counts: dict[str, int] = {}
+    started_at = time.time()
+
+    # 新しい書類が見つかるたびにワーカーを起動し直さないよう、監視の間プロセスプールを保つ
+    facts_executor = ExtractFactsFromDocuments.create_executor()
+    try:
+        async with EdinetClient(api_key=apikey) as client:
+            while True:
+                yyyymmdd = Utils.today()
+                try:
+                    metadata = await GetDocumentListMetadataFromEdiNetApi(
+                        client=client, yyyymmdd=yyyymmdd
+                    ).execute()
+                    count = metadata.metadata.resultset.count
+
+                    if count != last_counts.get(yyyymmdd):
+                        documentlist: DocumentListResponseType2 = (
+                            await GetDocumentListFromEdiNetApi(
+                                type="2", client=client, yyyymmdd=yyyymmdd
+                            ).execute()
+                        )
+
+                        documentlist: DocumentListResponseType2 = (
+                            GetItemsFromDocumentListReaponse(
+                                document_list_response=documentlist
+                            ).execute()
+                        )
+
+                        documentlist: DocumentListResponseType2 = (
+                            DropDuplicateDocuments(
+                                document_list_response=documentlist,
+                                seen_doc_ids=checkpoint.seen_doc_ids,
+                            ).execute()
+                        )
+
+                        failed_doc_ids: set[str] = set()
+                        if documentlist.results:
+                            db_items, failed_doc_ids = await ingest(
+                                settings=settings,
+                                session=session,
+                                client=client,
+                                documentlist=documentlist,
+                                rate_limiter=rate_limiter,
+                                manifest=manifest,
+                                catalog=catalog,
+                                index=index,
+                                facts_executor=facts_executor,
+                            )
+                            checkpoint.mark_ingested(
+                                doc_ids=[db_item.docID for db_item in db_items]
+                            )
+                            # 監視を始めてからの累計を取り込みのたびに書き出す
+                            write_metrics(settings, started_at)
+
+                        # 日付が変わったら前日分の件数は不要。
+                        # 失敗した書類があれば、件数が変わらなくても次の確認で取り込み直す
+                        last_counts = {} if failed_doc_ids else {yyyymmdd: count}
+                except Exception as e:
+                    # 一時的な失敗で監視を止めない
+                    logger.error(f"[WATCH] {yyyymmdd} failed: {e}")
+
+                await asyncio.sleep(interval)
+    finally:
+        facts_executor.shutdown()
+
+
+async def enqueue(
+    start: str, end: str, concurrency: int = 4, settings: Settings = Settings()
+) -> int:
+    """
+    分散モードのコーディネータ。start〜endの書類一覧を(書類, 種類)ごとの作業に分けてキューに登録する。
+    取り込み済みの書類は登録しない。作業はworkサブコマンドのワーカー(別プロセス・別ホストでよい)が行う。
+    """
+    from db.main.lib.edinet_client import EdinetClient
+    from db.main.lib.response_cache import DocumentListCache
+    from db.main.lib.work_queue import open_work_queue
+    from db.main.strategy.distributed import EnqueueDocumentFiles
+    from db.main.strategy.strategy import (
+        BatchInsertItemsToDynamoDb,
+        DropIngestedDocuments,
+        GetDocumentListsFromEdiNetApi,
+        GetItemsFromDocumentListReaponse,
+    )
+
+    session = create_session(settings)
+    apikey = get_api_key(settings, session)
+    queue = open_work_queue(settings.work_queue_spec, aws_session=session)
+    index = load_ingested_index(settings, session)
+    # 索引に「あるかもしれない」書類の確認にだけ使う
+    inserter = BatchInsertItemsToDynamoDb(
+        aws_session=session, items=[], target_table=settings.target_table
+    )
+
+    count = 0
+    async with EdinetClient(api_key=apikey) as client:
+        documentlists = GetDocumentListsFromEdiNetApi(
+            type="2",
+            client=client,
+            dates=Utils.date_range(start, end),
+            concurrency=concurrency,
+            cache=DocumentListCache(cache_dir=settings.cache_dir),
+        ).execute()
+
+        async for yyyymmdd, documentlist in documentlists:
+            documentlist: DocumentListResponseType2 = GetItemsFromDocumentListReaponse(
+                document_list_response=documentlist
+            ).execute()
+
+            documentlist: DocumentListResponseType2 = DropIngestedDocuments(
+                document_list_response=documentlist, index=index, inserter=inserter
+            ).execute()
+
+            count += EnqueueDocumentFiles(
+                document_list_response=documentlist,
+                queue=queue,
+                policy=download_policy(settings),
+            ).execute()
+    return count
+
+
+async def work(
+    workers: int = 8,
+    visibility_timeout: float = 300.0,
+    idle_timeout: float | None = 30.0,
+    settings: Settings = Settings(),
+):
+    """
+    分散モードのワーカー。キューの作業をリースしてダウンロード→S3アップロード→DynamoDB登録を行う。
+    同じキューに対していくつ起動してもよい。
+    """
+    from common.main.lib.rate_limiter import AdaptiveRateLimiter
+    from db.main.lib.catalog import DocumentCatalog
+    from db.main.lib.edinet_client import EdinetClient
+    from db.main.lib.manifest import IngestionManifest
+    from db.main.lib.work_queue import open_work_queue
+    from db.main.strategy.distributed import ProcessWorkUnits
+    from db.main.strategy.strategy import (
+        DownloadDocumentFromEdiNetApi,
+        MergeFileInfoToDynamoDb,
+        UploadToAwsS3,
+    )
+
+    session = create_session(settings)
+    apikey = get_api_key(settings, session)
+    queue = open_work_queue(settings.work_queue_spec, aws_session=session)
+    manifest = IngestionManifest.load(settings.manifest_path)
+    index = load_ingested_index(settings, session)
+
+    async with EdinetClient(api_key=apikey) as client:
+        try:
+            return await ProcessWorkUnits(
+                queue=queue,
+                downloader=DownloadDocumentFromEdiNetApi(
+                    client=client,
+                    documentlist=None,  # 作業ごとに書類を受け取るため一覧は使わない
+                    work_dir=settings.work_dir,
+                    rate_limiter=AdaptiveRateLimiter(),
+                    manifest=manifest,
+                    policy=download_policy(settings),
+                ),
+                uploader=UploadToAwsS3(
+                    aws_session=session,
+                    db_items=[],
+                    region_name=settings.region_name,
+                    manifest=manifest,
+                ),
+                merger=MergeFileInfoToDynamoDb(
+                    aws_session=session,
+                    target_table=settings.target_table,
+                    catalog=DocumentCatalog(path=settings.catalog_path),
+                    index=index,
+                ),
+                workers=workers,
+                visibility_timeout=visibility_timeout,
+                heartbeat_interval=visibility_timeout / 5,
+                idle_timeout=idle_timeout,
+            ).execute()
+        finally:
+            save_ingested_index(settings, session, index)
+
+
+def rebuild_catalog(
+    dynamodb_export: str | None = None, settings: Settings = Settings()
+):
+    """
+    ローカルカタログと、カタログから取り込み済みの索引を作り直す。
+    索引は保存済みの分と混ぜずに置き換え、カタログにない古いキーを消す(共有する設定ならS3上の分も)。
+    """
+    from db.main.lib.catalog import DocumentCatalog
+    from db.main.lib.ingested_index import IngestedIndex
+    from db.main.strategy.strategy import PutIngestedIndexToAwsS3
+
+    catalog = DocumentCatalog(path=settings.catalog_path)
+    if dynamodb_export:
+        catalog.rebuild_from_dynamodb_export(dynamodb_export)
+    else:
+        catalog.rebuild_from_work_dir(settings.work_dir, cache_dir=settings.cache_dir)
+
+    index = IngestedIndex.create(settings.ingested_index_path)
+    added = index.add_all(catalog.keys())
+    index.save(merge=False)
+    if settings.share_ingested_index:
+        PutIngestedIndexToAwsS3(
+            aws_session=create_session(settings), index=index, merge=False
+        ).execute()
+    logger.info(f"[DONE] rebuild ingested index {index.path}: {added} documents")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="EDINETの書類を取り込む")
+    defaults = Settings()
+    parser.add_argument(
+        "--profile",
+        default=defaults.profile,
+        help="AWSのプロファイル(空文字なら環境変数・ロールなどの既定の認証情報)",
+    )
+    parser.add_argument("--region", default=defaults.region_name)
+    parser.add_argument(
+        "--secret-name",
+        default=defaults.secret_name,
+        help="APIキーを保存しているSecrets Managerのシークレット",
+    )
+    parser.add_argument("--work-dir", default=defaults.work_dir)
+    parser.add_argument("--table", default=defaults.target_table)
+    parser.add_argument(
+        "--api-key-cache",
+        default=defaults.api_key_cache,
+        help="APIキーをキャッシュするファイル(空文字ならキャッシュしない)",
+    )
+    parser.add_argument(
+        "--api-key-ttl",
+        type=float,
+        default=defaults.api_key_ttl,
+        help="APIキーのキャッシュの有効期間(秒)",
+    )
+    parser.add_argument(
+        "--refresh-api-key",
+        action="store_true",
+        help="キャッシュを使わずにSecrets ManagerからAPIキーを取得し直す",
+    )
+    parser.add_argument(
+        "--share-ingested-index",
+        action="store_true",
+        help="取り込み済みの索引をS3にも保存し、他のマシンと共有する",
+    )
+    parser.add_argument(
+        "--queue",
+        help="分散モードの作業キュー(sqlite:PATH または sqs:QUEUE_URL, 既定はwork_dirのSQLite)",
+    )
+    parser.add_argument(
+        "--log-mode",
+        choices=("queue", "sync"),
+        default="queue",
+        help="queue: ログの書き込みを別スレッドで行う / sync: 呼び出し元で書き込む(デバッグ用)",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    # 取り込みを行うサブコマンドに共通の引数
+    ingestion = argparse.ArgumentParser(add_help=False)
+    ingestion.add_argument(
+        "--watched-companies",
+        default="",
+        help="最優先でダウンロードする企業のEDINETコード(カンマ区切り)",
+    )
+    ingestion.add_argument(
+        "--download-deadline",
+        type=float,
+        help="開始からこの秒数を過ぎたら、添付・英文の未取得分を諦める",
+    )
+
+    run_parser = commands.add_parser(
+        "run", parents=[ingestion], help="1日分の書類を取り込む"
+    )
+    run_parser.add_argument("--date", help="取り込む日付(YYYY-MM-DD, 既定は今日)")
+    run_parser.add_argument("--limit", type=int, help="取り込む書類の上限(確認用)")
+
+    backfill_parser = commands.add_parser(
+        "backfill", parents=[ingestion], help="期間の書類を日付順に取り込む"
+    )
+    backfill_parser.add_argument(
+        "--start", required=True, help="バックフィル開始日(YYYY-MM-DD)"
+    )
+    backfill_parser.add_argument(
+        "--end", required=True, help="バックフィル終了日(YYYY-MM-DD)"
+    )
+    backfill_parser.add_argument(
+        "--concurrency", type=int, default=4, help="書類一覧を先読みする日数"
+    )
+    backfill_parser.add_argument("--limit", type=int, help="1日あたりの書類の上限")
+
+    watch_parser = commands.add_parser(
+        "watch", parents=[ingestion], help="当日の新しい書類を監視して取り込む"
+    )
+    watch_parser.add_argument(
+        "--interval", type=float, default=60.0, help="ポーリング間隔(秒)"
+    )
+
+    enqueue_parser = commands.add_parser(
+        "enqueue",
+        parents=[ingestion],
+        help="分散モード: 期間の書類を(書類, 種類)ごとの作業にしてキューに登録する",
+    )
+    enqueue_parser.add_argument("--start", required=True, help="開始日(YYYY-MM-DD)")
+    enqueue_parser.add_argument("--end", required=True, help="終了日(YYYY-MM-DD)")
+    enqueue_parser.add_argument(
+        "--concurrency", type=int, default=4, help="書類一覧を先読みする日数"
+    )
+
+    work_parser = commands.add_parser(
+        "work",
+        parents=[ingestion],
+        help="分散モード: キューの作業を取り出して取り込む(複数起動してよい)",
+    )
+    work_parser.add_argument(
+        "--workers", type=int, default=8, help="同時に処理する作業の数"
+    )
+    work_parser.add_argument(
+        "--visibility-timeout",
+        type=float,
+        default=300.0,
+        help="作業のリースの期間(秒)。この間に延長されない作業は他のワーカーが取り直す",
+    )
+    work_parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=30.0,
+        help="キューが空のままこの秒数が経ったら終わる",
+    )
+    work_parser.add_argument(
+        "--keep-running", action="store_true", help="キューが空になっても終わらない"
+    )
+
+    catalog_parser = commands.add_parser(
+        "rebuild-catalog",
+        help="work_dirと書類一覧のキャッシュからローカルカタログを作り直す",
+    )
+    catalog_parser.add_argument(
+        "--dynamodb-export",
+        help="DynamoDBのエクスポート(DYNAMODB_JSON)から作り直す",
+    )
+    return parser.parse_args(argv)
+
+
+def settings_of(args: argparse.Namespace) -> Settings:
+    return replace(
+        Settings(),
+        profile=args.profile or None,
+        region_name=args.region,
+        secret_name=args.secret_name,
+        work_dir=args.work_dir,
+        target_table=args.table,
+        api_key_cache=args.api_key_cache or None,
+        api_key_ttl=args.api_key_ttl,
+        refresh_api_key=args.refresh_api_key,
+        share_ingested_index=args.share_ingested_index,
+        work_queue=args.queue,
+        watched_edinet_codes=frozenset(
+            filter(None, getattr(args, "watched_companies", "").split(","))
+        ),
+        download_deadline=getattr(args, "download_deadline", None),
+    )
+
+
+def main(argv: list[str] | None = None):
+    """コマンドラインの引数から設定を作り、サブコマンドを実行する"""
+    args = parse_args(argv)
+    if args.log_mode == "queue":
+        use_queue_logging()
+    settings = settings_of(args)
+
+    if args.command == "rebuild-catalog":
+        rebuild_catalog(dynamodb_export=args.dynamodb_export, settings=settings)
+    elif args.command == "watch":
+        asyncio.run(watch(interval=args.interval, settings=settings))
+    else:
+        started_at = time.time()
+        try:
+            if args.command == "backfill":
+                asyncio.run(
+                    backfill(
+                        start=args.start,
+                        end=args.end,
+                        concurrency=args.concurrency,
+                        limit=args.limit,
+                        settings=settings,
+                    )
+                )
+            elif args.command == "enqueue":
+                asyncio.run(
+                    enqueue(
+                        start=args.start,
+                        end=args.end,
+                        concurrency=args.concurrency,
+                        settings=settings,
+                    )
+                )
+            elif args.command == "work":
+                asyncio.run(
+                    work(
+                        workers=args.workers,
+                        visibility_timeout=args.visibility_timeout,
+                        idle_timeout=None if args.keep_running else args.idle_timeout,
+                        settings=settings,
+                    )
+                )
+            else:
+                asyncio.run(
+                    run(yyyymmdd=args.date, limit=args.limit, settings=settings)
+                )
+        finally:
+            # 失敗した実行でも、どこまで進んでどこで時間を使ったかを残す
+            write_metrics(settings, started_at)
 
 
 if __name__ == "__main__":
-    asyncio.run(run())
+    main()
@@ -0,0 +1,172 @@
+from dataclasses import dataclass
+import json
+import logging
+import re
+import sys
+from typing import Optional
+
+from db.main.model.edinet.document_item import Results
+from db.main.model.edinet.edinet_enums import RegalStatus
+
+
+@dataclass(slots=True)
+class CompactResults:
+    """
+    Resultsと同じ項目を__slots__で保持する省メモリ版。
+    インスタンスごとの__dict__を持たず、各種フラグはboolで保持する。
+    日付はResultsと同じ形式(YYYYMMDD / YYYYMMDDThhmm)に正規化済み。
+    """
+
+    JCN: Optional[str]
+    currentReportReason: Optional[str]
+    disclosureStatus: str
+    docID: str
+    docInfoEditStatus: str
+    docTypeCode: Optional[str]
+    docDescription: str
+    edinetCode: str
+    fundCode: Optional[str]
+    filerName: str
+    formCode: Optional[str]
+    issuerEdinetCode: Optional[str]
+    legalStatus: str
+    ordinanceCode: Optional[str]
+    opeDateTime: str
+    periodStart: Optional[str]
+    periodEnd: Optional[str]
+    parentDocID: Optional[str]
+    seqNumber: int
+    secCode: Optional[str]
+    submitDateTime: str
+    subjectEdinetCode: Optional[str]
+    subsidiaryEdinetCode: Optional[str]
+    withdrawalStatus: str
+    attachDocFlag: bool
+    csvFlag: bool
+    englishDocFlag: bool
+    pdfFlag: bool
+    xbrlFlag: bool
+
+    def is_viewable(self) -> bool:
+        # Results.is_viewable と同じ判定
+        return RegalStatus.from_string(self.legalStatus) == RegalStatus.ON_VIEW
+
+    def has_edinetcode(self) -> bool:
+        return bool(self.edinetCode)
+
+    def has_anyitem(self) -> bool:
+        return (
+            self.xbrlFlag
+            or self.pdfFlag
+            or self.attachDocFlag
+            or self.englishDocFlag
+            or self.csvFlag
+        )
+
+    def to_results(self) -> Results:
+        """既存のストラテジに渡すためResultsに戻す"""
+        # asdictは値を再帰的にコピーするため、項目を直接読む
+        item = {name: getattr(self, name) for name in self.__slots__}
+        for name in DocumentListDecoder.FLAG_FIELDS:
+            item[name] = "1" if item[name] else "0"
+        return Results(**item)
+
+
+class DocumentListDecoder:
+    """
+    documents.json(type=2)のペイロードをCompactResultsのリストに一括で変換する。
+    日付はstrptime/strftimeを使わず、事前にコンパイルした正規表現と変換表で正規化する。
+    企業名やコード類は同じ値が何度も現れるため、internして文字列を共有する。
+    """
+
+    logger = logging.getLogger(__name__)
+
+    FLAG_FIELDS = ("attachDocFlag", "csvFlag", "englishDocFlag", "pdfFlag", "xbrlFlag")
+    # Utils.broad_enableと同じ判定
+    TRUE_VALUES = frozenset({"true", "True", "on", "yes", "1", True})
+
+    # "YYYY-MM-DD hh:mm" -> "YYYYMMDDThhmm", "YYYY-MM-DD" -> "YYYYMMDD"
+    DATETIME_IN = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}")
+    DATETIME_OUT = re.compile(r"\d{8}T\d{4}")
+    DATETIME_TABLE = str.maketrans({"-": None, ":": None, " ": "T"})
+    DATE_IN = re.compile(r"\d{4}-\d{2}-\d{2}")
+    DATE_OUT = re.compile(r"\d{8}")
+    DATE_TABLE = str.maketrans({"-": None})
+
+    @classmethod
+    def decode(cls, payload: bytes | str | dict) -> list[CompactResults]:
+        if not isinstance(payload, dict):
+            payload = json.loads(payload)
+        return cls.decode_results(payload["results"])
+
+    @classmethod
+    def decode_results(cls, rows: list[dict]) -> list[CompactResults]:
+        intern = cls.intern
+        flag = cls.TRUE_VALUES.__contains__
+        datetime_ = cls.normalize_datetime
+        date_ = cls.normalize_date
+
+        items = []
+        append = items.append
+        for row in rows:
+            get = row.get
+            append(
+                CompactResults(
+                    intern(get("JCN")),
+                    get("currentReportReason"),
+                    intern(get("disclosureStatus")),
+                    get("docID"),
+                    intern(get("docInfoEditStatus")),
+                    intern(get("docTypeCode")),
+                    intern(get("docDescription")),
+                    intern(get("edinetCode")),
+                    intern(get("fundCode")),
+                    intern(get("filerName")),
+                    intern(get("formCode")),
+                    intern(get("issuerEdinetCode")),
+                    intern(get("legalStatus")),
+                    intern(get("ordinanceCode")),
+                    datetime_(get("opeDateTime")),
+                    date_(get("periodStart")),
+                    date_(get("periodEnd")),
+                    get("parentDocID"),
+                    get("seqNumber"),
+                    intern(get("secCode")),
+                    datetime_(get("submitDateTime")),
+                    intern(get("subjectEdinetCode")),
+                    intern(get("subsidiaryEdinetCode")),
+                    intern(get("withdrawalStatus")),
+                    flag(get("attachDocFlag")),
+                    flag(get("csvFlag")),
+                    flag(get("englishDocFlag")),
+                    flag(get("pdfFlag")),
+                    flag(get("xbrlFlag")),
+                )
+            )
+        return items
+
+    @staticmethod
+    def intern(value: Optional[str]) -> Optional[str]:
+        return sys.intern(value) if value else value
+
+    @classmethod
+    def normalize_datetime(cls, value: Optional[str]) -> Optional[str]:
+        if not value:
+            return value
+        if cls.DATETIME_IN.fullmatch(value):
+            return value.translate(cls.DATETIME_TABLE)
+        if cls.DATETIME_OUT.fullmatch(value):
+            return value
+        cls.logger.error(f"Error parsing date string: {value}")
+        return None
+
+    @classmethod
+    def normalize_date(cls, value: Optional[str]) -> Optional[str]:
+        if not value:
+            return value
+        if cls.DATE_IN.fullmatch(value):
+            return value.translate(cls.DATE_TABLE)
+        if cls.DATE_OUT.fullmatch(value):
+            return value
+        cls.logger.error(f"Error parsing date string: {value}")
+        return None
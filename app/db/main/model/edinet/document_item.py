@@ -1,10 +1,11 @@
 from dataclasses import dataclass
 from datetime import datetime
 import logging
+import re
 from typing import Optional
 
 from common.main.lib.utils import Utils
-from db.main.model.edinet.edinet_enums import DisclosureStatus, RegalStatus
+from db.main.model.edinet.edinet_enums import DisclosureStatus, DocType, RegalStatus
 
 
 @dataclass
@@ -41,8 +42,18 @@ class Results:
 
     logger = logging.getLogger(__name__)
 
+    NORMALIZED_FORMATS = {
+        "%Y%m%dT%H%M": re.compile(r"\d{8}T\d{4}"),
+        "%Y%m%d": re.compile(r"\d{8}"),
+    }
+    # 提出日時がない書類には取得日を埋める(preprocess)ため、日付だけの提出日時もある
+    DATE_ONLY = re.compile(r"\d{4}-?\d{2}-?\d{2}")
+
     def __post_init__(self):
         def refmt_dt(dtstr: str, in_fmt, out_fmt):
+            # 正規化済み(CompactResultsから戻した場合など)ならstrptimeを呼ばない
+            if self.NORMALIZED_FORMATS[out_fmt].fullmatch(dtstr):
+                return dtstr
             try:
                 dt_obj = datetime.strptime(dtstr, out_fmt)
                 return dtstr
@@ -56,7 +67,9 @@ class Results:
                 self.logger.error(f"Error parsing date string: {e}")
 
         try:
-            if self.submitDateTime:
+            if self.submitDateTime and self.DATE_ONLY.fullmatch(self.submitDateTime):
+                self.submitDateTime = self.submitDateTime.replace("-", "")
+            elif self.submitDateTime:
                 self.submitDateTime = refmt_dt(
                     dtstr=self.submitDateTime,
                     in_fmt="%Y-%m-%d %H:%M",
@@ -101,8 +114,6 @@ class Results:
     def is_viewable(self) -> RegalStatus:
         status = RegalStatus.from_string(self.legalStatus)
         is_viewable = status in [RegalStatus.ON_VIEW or RegalStatus.EXTENDED]
-        if not is_viewable:
-            self.logger.info(f"[SKIP] {self.docID} is not viewable.")
         return is_viewable
 
     def has_anyitem(self) -> RegalStatus:
@@ -115,14 +126,10 @@ class Results:
                 self.has_englishdoc(),
             ]
         )
-        if not has_anyitem:
-            self.logger.info(f"[SKIP] {self.docID} does'nt have enough information.")
         return has_anyitem
 
     def has_edinetcode(self) -> RegalStatus:
         has_edinetcode = bool(self.edinetCode)
-        if not has_edinetcode:
-            self.logger.info(f"[SKIP] {self.docID} does'nt have edinet-code.")
         return has_edinetcode
 
     def get_disclosurestatus(self) -> DisclosureStatus:
@@ -137,7 +144,8 @@ class Results:
     def __embed_date_if_not_exist(self, yyyymmdd: str):
         """submitDateTimeが存在しないなら、受け取った日付(APIリクエスト日を想定)を埋めて返す"""
         if not bool(self.submitDateTime):
-            self.submitDateTime = yyyymmdd
+            # 他の日付と同じYYYYMMDD形式にそろえる(リクエスト日はYYYY-MM-DD)
+            self.submitDateTime = yyyymmdd.replace("-", "")
 
     def __embed_edinetcode_if_not_exist(self, text: str = "NOT_SPECIFIED"):
         """submitDateTimeが存在しないなら、受け取った日付(APIリクエスト日を想定)を埋めて返す"""
@@ -159,6 +167,37 @@ class DbItem(Results):
     english_info: FileInfo = None  # "4"
     csv_info: FileInfo = None  # "5"
 
+    INFO_ATTRIBUTES = {
+        DocType.XBRL: "xbrl_info",
+        DocType.PDF: "pdf_info",
+        DocType.ATTACH: "attach_info",
+        DocType.ENGLISH: "english_info",
+        DocType.CSV: "csv_info",
+    }
+
+    def has_doctype(self, doc_type: DocType) -> bool:
+        return {
+            DocType.XBRL: self.has_xbrl,
+            DocType.PDF: self.has_pdf,
+            DocType.ATTACH: self.has_attachdoc,
+            DocType.ENGLISH: self.has_englishdoc,
+            DocType.CSV: self.has_csv,
+        }[doc_type]()
+
+    def get_info(self, doc_type: DocType) -> Optional[FileInfo]:
+        return getattr(self, self.INFO_ATTRIBUTES[doc_type])
+
+    def set_info(self, doc_type: DocType, info: FileInfo):
+        setattr(self, self.INFO_ATTRIBUTES[doc_type], info)
+
+    def get_infoitems(self) -> list[tuple[DocType, FileInfo]]:
+        """(書類種別, ファイル情報)の組を、ファイルが存在するものだけ返す"""
+        return [
+            (doc_type, self.get_info(doc_type))
+            for doc_type in DocType
+            if self.get_info(doc_type) is not None
+        ]
+
     def get_infolist(self):
 
         target = [
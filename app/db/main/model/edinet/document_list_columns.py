@@ -0,0 +1,218 @@
+from dataclasses import dataclass, field
+import json
+import logging
+from typing import Optional
+
+import numpy as np
+
+from db.main.model.edinet.compact_document_item import DocumentListDecoder
+from db.main.model.edinet.document_item import Results
+from db.main.model.edinet.edinet_enums import RegalStatus
+
+
+@dataclass
+class DocumentListColumns:
+    """
+    書類一覧を列ごとの配列で保持するコンテナ。1行ごとのPythonオブジェクトを作らない。
+    - コード・日付などの短い文字列: 固定長のnumpy文字列配列(欠損は"")
+    - 企業名・書類名などの長い文字列: 辞書符号化(int32のコード + 値のリスト, 欠損は-1)
+    - ステータス: int8(欠損は-1) / 各種フラグ: bool
+    複数日分をconcatでまとめて保持できる。
+    """
+
+    columns: dict[str, np.ndarray] = field(default_factory=dict)
+    dictionaries: dict[str, list[str]] = field(default_factory=dict)
+
+    logger = logging.getLogger(__name__)
+
+    CODE_FIELDS = (
+        "JCN",
+        "docID",
+        "docTypeCode",
+        "edinetCode",
+        "fundCode",
+        "formCode",
+        "issuerEdinetCode",
+        "ordinanceCode",
+        "parentDocID",
+        "secCode",
+        "subjectEdinetCode",
+        "requestDate",  # 一覧を取得した日付(YYYY-MM-DD)
+    )
+    DATETIME_FIELDS = ("opeDateTime", "submitDateTime")
+    DATE_FIELDS = ("periodStart", "periodEnd")
+    TEXT_FIELDS = (
+        "currentReportReason",
+        "docDescription",
+        "filerName",
+        "subsidiaryEdinetCode",
+    )
+    STATUS_FIELDS = (
+        "disclosureStatus",
+        "docInfoEditStatus",
+        "legalStatus",
+        "withdrawalStatus",
+    )
+    FLAG_FIELDS = DocumentListDecoder.FLAG_FIELDS
+
+    # Results.is_viewable と同じ判定
+    VIEWABLE_STATUSES = (int(RegalStatus.ON_VIEW.value),)
+
+    def __len__(self) -> int:
+        return len(self.columns["docID"]) if self.columns else 0
+
+    @classmethod
+    def from_payload(cls, payload: bytes | str | dict) -> "DocumentListColumns":
+        """documents.json(type=2)のペイロードから作る"""
+        if not isinstance(payload, dict):
+            payload = json.loads(payload)
+        return cls.from_rows(
+            payload["results"], request_date=payload["metadata"]["parameter"]["date"]
+        )
+
+    @classmethod
+    def from_rows(cls, rows: list[dict], request_date: str) -> "DocumentListColumns":
+        table = cls()
+        rows = [row | {"requestDate": request_date} for row in rows]
+
+        for name in cls.CODE_FIELDS:
+            table.columns[name] = np.array(
+                [row.get(name) or "" for row in rows], dtype=str
+            )
+        for name in cls.DATETIME_FIELDS:
+            normalize = DocumentListDecoder.normalize_datetime
+            table.columns[name] = np.array(
+                [normalize(row.get(name)) or "" for row in rows], dtype=str
+            )
+        for name in cls.DATE_FIELDS:
+            normalize = DocumentListDecoder.normalize_date
+            table.columns[name] = np.array(
+                [normalize(row.get(name)) or "" for row in rows], dtype=str
+            )
+        for name in cls.TEXT_FIELDS:
+            codes, values = cls.encode([row.get(name) for row in rows])
+            table.columns[name] = codes
+            table.dictionaries[name] = values
+        for name in cls.STATUS_FIELDS:
+            table.columns[name] = np.array(
+                [int(row.get(name) or -1) for row in rows], dtype=np.int8
+            )
+        for name in cls.FLAG_FIELDS:
+            table.columns[name] = np.array(
+                [row.get(name) in DocumentListDecoder.TRUE_VALUES for row in rows],
+                dtype=bool,
+            )
+        table.columns["seqNumber"] = np.array(
+            [row.get("seqNumber") or 0 for row in rows], dtype=np.int32
+        )
+        return table
+
+    @classmethod
+    def concat(cls, tables: list["DocumentListColumns"]) -> "DocumentListColumns":
+        """複数日分の一覧を1つにまとめる。辞書符号化した列は辞書を統合して符号を振り直す"""
+        tables = [table for table in tables if len(table)]
+        if not tables:
+            return cls()
+
+        merged = cls()
+        for name in tables[0].columns:
+            if name in cls.TEXT_FIELDS:
+                continue
+            merged.columns[name] = np.concatenate(
+                [table.columns[name] for table in tables]
+            )
+
+        for name in cls.TEXT_FIELDS:
+            index: dict[str, int] = {}
+            parts = []
+            for table in tables:
+                remap = np.array(
+                    [
+                        index.setdefault(value, len(index))
+                        for value in table.dictionaries[name]
+                    ],
+                    dtype=np.int32,
+                )
+                codes = table.columns[name]
+                parts.append(
+                    np.where(codes >= 0, remap[np.maximum(codes, 0)], -1)
+                    if len(remap)
+                    else codes
+                )
+            merged.columns[name] = np.concatenate(parts).astype(np.int32)
+            merged.dictionaries[name] = list(index)
+        return merged
+
+    @staticmethod
+    def encode(values: list[Optional[str]]) -> tuple[np.ndarray, list[str]]:
+        index: dict[str, int] = {}
+        codes = np.array(
+            [index.setdefault(value, len(index)) if value else -1 for value in values],
+            dtype=np.int32,
+        )
+        return codes, list(index)
+
+    def text(self, name: str) -> np.ndarray:
+        """辞書符号化した列を文字列(object)配列に戻す。欠損はNone"""
+        values = np.array(self.dictionaries[name] + [None], dtype=object)
+        return values[self.columns[name]]  # -1は末尾のNoneを指す
+
+    def take(self, selector: np.ndarray) -> "DocumentListColumns":
+        """真偽値マスクまたは行番号で行を選ぶ"""
+        return DocumentListColumns(
+            columns={name: column[selector] for name, column in self.columns.items()},
+            dictionaries=self.dictionaries,
+        )
+
+    def valid_mask(self) -> np.ndarray:
+        """
+        DocumentListResponseType2.filter_valid_result_items と同じ条件を1回の演算で求める。
+        縦覧中 かつ EDINETコードあり かつ いずれかの書類がある
+        """
+        viewable = np.isin(self.columns["legalStatus"], self.VIEWABLE_STATUSES)
+        has_edinetcode = self.columns["edinetCode"] != ""
+        has_anyitem = np.logical_or.reduce(
+            [self.columns[name] for name in self.FLAG_FIELDS]
+        )
+        mask = viewable & has_edinetcode & has_anyitem
+
+        # 行ごとのログの代わりに理由ごとの件数を出す
+        self.logger.info(
+            f"[SKIP] not viewable={int((~viewable).sum())} "
+            f"no edinet-code={int((viewable & ~has_edinetcode).sum())} "
+            f"no item={int((viewable & has_edinetcode & ~has_anyitem).sum())}"
+        )
+        return mask
+
+    def filter_valid_result_items(self) -> "DocumentListColumns":
+        """有効な行だけを残し、DynamoDB登録用の整形(Results.preprocess相当)を行う"""
+        table = self.take(self.valid_mask())
+        submit = table.columns["submitDateTime"]
+        table.columns["submitDateTime"] = np.where(
+            submit == "", np.char.replace(table.columns["requestDate"], "-", ""), submit
+        )
+        return table
+
+    def to_results(self) -> list[Results]:
+        """既存のストラテジに渡すため、(フィルタ後の)行をResultsに戻す"""
+        names = [name for name in self.columns if name != "requestDate"]
+        values = {
+            name: (
+                self.text(name)
+                if name in self.TEXT_FIELDS
+                else self.columns[name].tolist()
+            )
+            for name in names
+        }
+        results = []
+        for i in range(len(self)):
+            item = {name: values[name][i] for name in names}
+            for name in self.CODE_FIELDS + self.DATETIME_FIELDS + self.DATE_FIELDS:
+                if item.get(name) == "":
+                    item[name] = None
+            for name in self.STATUS_FIELDS:
+                item[name] = None if item[name] < 0 else str(item[name])
+            for name in self.FLAG_FIELDS:
+                item[name] = "1" if item[name] else "0"
+            results.append(Results(**item))
+        return results
@@ -1,7 +1,5 @@
 from dataclasses import dataclass
 
-import requests
-
 from db.main.model.edinet.metadata import Metadata
 
 
@@ -12,12 +10,18 @@ from db.main.model.edinet.metadata import Metadata
 class DocumentListResponseType1:
     metadata: Metadata
 
+    def __post_init__(self):
+        if isinstance(self.metadata, dict):
+            self.metadata = Metadata(**self.metadata)
+
 
 if __name__ == "__main__":
+    import requests
+
     resp = requests.get(
         "https://api.edinet-fsa.go.jp/api/v2/documents.json?date=2023-08-28&type=1&Subscription-Key=b96412004635453b95a2490d0cfb2e73"
     )
 
-    metadata = DocumentListResponseType1(resp.json())
+    metadata = DocumentListResponseType1(**resp.json())
 
     print(metadata)
@@ -1,8 +1,12 @@
 from dataclasses import dataclass
+import logging
 from typing import List
 
-import requests
-
+from common.main.lib.log_utils import SkipCounter
+from db.main.model.edinet.compact_document_item import (
+    CompactResults,
+    DocumentListDecoder,
+)
 from db.main.model.edinet.document_item import Results
 from db.main.model.edinet.metadata import Metadata
 
@@ -12,40 +16,56 @@ from db.main.model.edinet.metadata import Metadata
 
 @dataclass
 class DocumentListResponseType2:
+    """
+    resultsは、取得した直後はCompactResults(一括でデコードした省メモリ版)で、
+    filter_valid_result_items()で残した書類だけをResultsに変換する。
+    """
+
     metadata: Metadata
-    results: List[Results]
+    results: List[Results | CompactResults]
+
+    logger = logging.getLogger(__name__)
 
     def __post_init__(self):
         # metadataとresultsが辞書または辞書のリストの場合、dataclassに変換する
         if isinstance(self.metadata, dict):
             self.metadata = Metadata(**self.metadata)
-        if isinstance(self.results, list):
-            self.results = [
-                Results(**item) if isinstance(item, dict) else item
-                for item in self.results
-            ]
+        # 1件ずつResults(**item)を作らず、日付の正規化もまとめて行う
+        if isinstance(self.results, list) and all(
+            isinstance(item, dict) for item in self.results
+        ):
+            self.results = DocumentListDecoder.decode_results(self.results)
 
     def filter_valid_result_items(self) -> list[Results]:
+        """
+        縦覧中 かつ EDINETコードあり かつ いずれかの書類がある書類だけを残し、DynamoDB登録用に整形する。
+        除外した書類は行ごとではなく理由ごとの件数をログに出す。
+        残した書類は既存のストラテジに渡すためResultsに戻す。
+        """
         try:
             yyyymmdd = self.metadata.parameter.date
-            self.results = list(
-                filter(lambda result: result.is_viewable(), self.results)
-            )
-            self.results = list(
-                filter(lambda result: result.has_edinetcode(), self.results)
-            )
-            self.results = list(
-                filter(lambda result: result.has_anyitem(), self.results)
-            )
-            self.results = [
-                result.preprocess(yyyymmdd=yyyymmdd) for result in self.results
-            ]
+            skips = SkipCounter(logger=self.logger)
+            results = []
+            for result in self.results:
+                if not result.is_viewable():
+                    skips.skip("not_viewable", result.docID)
+                elif not result.has_edinetcode():
+                    skips.skip("no_edinetcode", result.docID)
+                elif not result.has_anyitem():
+                    skips.skip("no_item", result.docID)
+                else:
+                    if isinstance(result, CompactResults):
+                        result = result.to_results()
+                    results.append(result.preprocess(yyyymmdd=yyyymmdd))
+            self.results = results
+            skips.report(prefix=f"{yyyymmdd} ")
         except Exception as e:
             print(f"{e}")
             raise
 
 
 if __name__ == "__main__":
+    import requests
 
     resp = requests.get(
         "https://api.edinet-fsa.go.jp/api/v2/documents.json?date=2023-08-28&type=2&Subscription-Key=b96412004635453b95a2490d0cfb2e73"
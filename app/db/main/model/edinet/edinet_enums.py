@@ -8,6 +8,20 @@ class DocType(Enum):
     ENGLISH = "ENGLISH"
     CSV = "CSV"
 
+    @property
+    def api_type(self) -> str:
+        """書類取得APIのtypeパラメータ"""
+        return _DOC_TYPE_API_TYPES[self]
+
+
+_DOC_TYPE_API_TYPES = {
+    DocType.XBRL: "1",  # 提出本文書及び監査報告書
+    DocType.PDF: "2",
+    DocType.ATTACH: "3",  # 代替書面・添付文書
+    DocType.ENGLISH: "4",
+    DocType.CSV: "5",
+}
+
 
 class RegalStatus(Enum):
     """
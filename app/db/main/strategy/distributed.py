@@ -0,0 +1,173 @@
+import asyncio
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+import time
+from typing import Optional, override
+
+from common.main.lib.metrics import METRICS
+from common.main.lib.utils import Utils
+from db.main.lib.download_scheduler import DownloadPolicy
+from db.main.lib.work_queue import Lease, WorkQueue, WorkUnit
+from db.main.model.edinet.document_item import DbItem
+from db.main.model.edinet.document_list_response_type2 import DocumentListResponseType2
+from db.main.model.edinet.edinet_enums import DocType
+from db.main.strategy.strategy import (
+    DownloadDocumentFromEdiNetApi,
+    MergeFileInfoToDynamoDb,
+    Strategy,
+    UploadToAwsS3,
+)
+
+
+@dataclass
+class EnqueueDocumentFiles(Strategy):
+    """
+    分散モードのコーディネータ。書類一覧を(書類, 種類)ごとの作業に分けてキューに登録する。
+    キューが優先度を持たないため、DownloadPolicyの優先度順に並べてから登録する。
+    """
+
+    document_list_response: DocumentListResponseType2
+    queue: WorkQueue
+    policy: DownloadPolicy = field(default_factory=DownloadPolicy)
+
+    @override
+    @Utils.log_exception
+    def execute(self) -> int:
+        units = []
+        for result in self.document_list_response.results:
+            db_item = DbItem(**asdict(result))
+            for doc_type in DocType:
+                if db_item.has_doctype(doc_type):
+                    units.append(
+                        (
+                            self.policy.priority_of(db_item, doc_type),
+                            WorkUnit(
+                                doc_id=db_item.docID,
+                                doc_type=doc_type.name,
+                                document=asdict(result),
+                            ),
+                        )
+                    )
+        units.sort(key=lambda unit: unit[0])
+        count = self.queue.put(unit for _, unit in units)
+        self.logger.info(
+            f"[DONE] enqueue {count} work units "
+            f"for {len(self.document_list_response.results)} documents"
+        )
+        return count
+
+
+@dataclass
+class ProcessWorkUnits(Strategy):
+    """
+    分散モードのワーカー。キューから作業をリースし、既存のストラテジで
+    ダウンロード→S3アップロード→DynamoDB登録(種類ごとのファイル情報をマージ)を行う。
+    - 処理中はheartbeat_interval秒ごとにリースを延長する。ワーカーが落ちると期限切れ後に他のワーカーが取り直す
+    - 失敗した作業は、試行回数に応じて間隔を空けてキューに戻す
+    - キューが空(pending()が0)のままidle_timeout秒経ったら終わる(Noneなら待ち続ける)。
+      間隔を空けて戻した作業や、リースの期限切れを待つ作業が残っている間は終わらない
+    """
+
+    queue: WorkQueue
+    downloader: DownloadDocumentFromEdiNetApi
+    uploader: UploadToAwsS3
+    merger: MergeFileInfoToDynamoDb
+    workers: int = 8  # 同時に処理する作業の数
+    visibility_timeout: float = 300.0
+    heartbeat_interval: float = 60.0
+    poll_interval: float = 1.0
+    idle_timeout: Optional[float] = 30.0
+    retry_delay: float = (
+        5.0  # 失敗した作業を戻すまでの間隔(試行ごとに倍、最大はvisibility_timeout)
+    )
+
+    processed: Counter = field(default_factory=Counter, init=False)
+    idle_since: float = field(default=0.0, init=False)  # キューが最後に空でなかった時刻
+
+    @override
+    @Utils.log_exception
+    async def execute(self) -> Counter:
+        await asyncio.gather(*(self.work() for _ in range(self.workers)))
+        self.logger.info(f"[DONE] work units {dict(self.processed)}")
+        # 最後のワーカーが終わった後に投入された作業など、残っていれば次のワーカーに任せる
+        leftover = await asyncio.to_thread(self.queue.pending)
+        if leftover:
+            self.logger.warning(f"[LEFT] {leftover} work units remain in the queue")
+        return self.processed
+
+    async def work(self):
+        idle_since = time.monotonic()
+        while True:
+            leases = await asyncio.to_thread(
+                self.queue.claim, 1, self.visibility_timeout
+            )
+            if not leases:
+                if await self.idle(idle_since):
+                    return
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            for lease in leases:
+                await self.process(lease)
+            idle_since = time.monotonic()
+
+    async def idle(self, idle_since: float) -> bool:
+        """
+        終わってよいか。見えない作業(処理中・遅延中)が残っていれば、
+        空になるまで待ち続ける(空になってからidle_timeout秒は待つ)
+        """
+        if self.idle_timeout is None:
+            return False
+        if await asyncio.to_thread(self.queue.pending):
+            self.idle_since = time.monotonic()
+            return False
+        return time.monotonic() - max(idle_since, self.idle_since) >= self.idle_timeout
+
+    async def process(self, lease: Lease):
+        unit = lease.unit
+        heartbeat = asyncio.create_task(self.heartbeat(lease))
+        try:
+            await self.ingest(unit)
+        except Exception as e:
+            delay = min(
+                self.retry_delay * 2 ** (lease.attempts - 1), self.visibility_timeout
+            )
+            self.count("failed")
+            self.logger.error(
+                f"[FAIL] {unit.doc_id} {unit.doc_type} (attempt {lease.attempts}, "
+                f"retry in {delay:.0f}s): {e}"
+            )
+            await asyncio.to_thread(self.queue.release, lease, delay)
+            return
+        finally:
+            heartbeat.cancel()
+
+        if await asyncio.to_thread(self.queue.complete, lease):
+            self.count("done")
+        else:
+            # リースの期限が切れて他のワーカーにも渡った(結果は同じなので問題はない)
+            self.count("lost")
+            self.logger.warning(f"[LEASE] {unit.doc_id} {unit.doc_type} lease expired")
+
+    async def ingest(self, unit: WorkUnit):
+        db_item = DbItem(**unit.document)
+        doc_type = DocType[unit.doc_type]
+        await self.downloader.download_one(db_item, doc_type)
+        await self.uploader.upload(db_item)
+        await asyncio.to_thread(self.merger.merge, db_item, doc_type)
+
+    async def heartbeat(self, lease: Lease):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            extended = await asyncio.to_thread(
+                self.queue.extend, lease, self.visibility_timeout
+            )
+            if not extended:
+                self.logger.warning(
+                    f"[LEASE] failed to extend {lease.unit.doc_id} {lease.unit.doc_type}"
+                )
+                return
+
+    def count(self, outcome: str):
+        self.processed[outcome] += 1
+        METRICS.inc("work_units_total", outcome=outcome)
@@ -0,0 +1,196 @@
+import asyncio
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional, override
+
+from common.main.lib.metrics import METRICS
+from common.main.lib.utils import Utils
+from db.main.lib.download_scheduler import DownloadScheduler
+from db.main.model.edinet.document_item import DbItem
+from db.main.strategy.strategy import (
+    BatchInsertItemsToDynamoDb,
+    DownloadDocumentFromEdiNetApi,
+    InsertItemsToDynamoDb,
+    Strategy,
+    UploadToAwsS3,
+)
+
+
+@dataclass
+class IngestDocumentsByPipeline(Strategy):
+    """
+    ダウンロード→S3アップロード→DynamoDB登録を、書類単位で流れるパイプラインとして実行する。
+    ダウンロードは(書類, 種類)ごとに優先度順で行い、ファイルが揃った書類から順に次のステージへ進む。
+    各ステージは有界のキューで繋がっており、後段のキューが詰まると前段のputが待たされるため、
+    ディスクやメモリの使用量も上限を持つ。
+    戻り値は登録まで終わった書類で、途中のステージで失敗した書類のdocIDはfailed_doc_idsに残る。
+    """
+
+    downloader: DownloadDocumentFromEdiNetApi
+    uploader: UploadToAwsS3
+    inserter: InsertItemsToDynamoDb | BatchInsertItemsToDynamoDb
+    download_workers: int = 8  # 同時にダウンロードするファイル数
+    download_window: int = 32  # ダウンロードの優先度順を決めるために先読みする書類の数
+    upload_workers: int = 4
+    index_workers: int = 2
+    index_batch_size: int = 25  # DynamoDBへはキューに溜まった分をまとめて登録する
+    queue_size: int = 64
+    report_interval: Optional[float] = 10.0  # キューの深さをログに出す間隔(秒)
+
+    queues: dict[str, asyncio.Queue] = field(default_factory=dict, init=False)
+    processed: Counter = field(default_factory=Counter, init=False)
+    failed: Counter = field(default_factory=Counter, init=False)
+    failed_doc_ids: set[str] = field(default_factory=set, init=False)
+
+    def queue_depths(self) -> dict[str, int]:
+        """ステージごとの入力待ち件数。値が大きいステージがボトルネック"""
+        depths = {name: queue.qsize() for name, queue in self.queues.items()}
+        for name, depth in depths.items():
+            METRICS.set("pipeline_queue_depth", depth, stage=name)
+        return depths
+
+    @override
+    @Utils.log_exception
+    async def execute(self) -> list[DbItem]:
+        scheduler = DownloadScheduler(
+            policy=self.downloader.policy, window=self.download_window
+        )
+        self.queues = {
+            "download": scheduler.queue,
+            "upload": asyncio.Queue(maxsize=self.queue_size),
+            "index": asyncio.Queue(maxsize=self.queue_size),
+        }
+        completed: list[DbItem] = []
+
+        async def index(items: list[DbItem]) -> list[DbItem]:
+            return await asyncio.to_thread(self.inserter.insert_items, items)
+
+        async def downloaded(db_item: DbItem, ok: bool):
+            if not ok:
+                self.failed["download"] += 1
+                self.failed_doc_ids.add(db_item.docID)
+                METRICS.inc("pipeline_items_total", stage="download", outcome="failed")
+                return
+            self.processed["download"] += 1
+            METRICS.inc("pipeline_items_total", stage="download", outcome="processed")
+            await self.queues["upload"].put(db_item)
+
+        download = asyncio.create_task(
+            self.downloader.download_all(
+                self.downloader.documentlist.results[: self.downloader.limit],
+                scheduler=scheduler,
+                on_done=downloaded,
+                workers=self.download_workers,
+            )
+        )
+        stages = [
+            self.start_stage(
+                "upload",
+                self.upload_workers,
+                lambda: self.work("upload", self.uploader.upload, "index"),
+            ),
+            self.start_stage(
+                "index",
+                self.index_workers,
+                lambda: self.work_batch(
+                    "index", index, completed, self.index_batch_size
+                ),
+            ),
+        ]
+        reporter = asyncio.create_task(self.report()) if self.report_interval else None
+
+        try:
+            await download
+
+            # 前段の全ワーカーが終わってから後段に終了を伝える
+            for name, workers in stages:
+                for _ in workers:
+                    await self.queues[name].put(None)
+                await asyncio.gather(*workers)
+        finally:
+            download.cancel()
+            for _, workers in stages:
+                for worker in workers:
+                    worker.cancel()
+            if reporter:
+                reporter.cancel()
+
+        self.logger.info(
+            f"[DONE] pipeline processed={dict(self.processed)} failed={dict(self.failed)}"
+        )
+        return completed
+
+    def start_stage(
+        self, name: str, workers: int, worker: Callable[[], Awaitable[None]]
+    ) -> tuple[str, list[asyncio.Task]]:
+        return name, [asyncio.create_task(worker()) for _ in range(workers)]
+
+    async def work(
+        self,
+        name: str,
+        func: Callable[[object], Awaitable[object]],
+        outbox: str,
+    ):
+        """1件ずつ処理して次のステージのキューに渡す"""
+        inbox = self.queues[name]
+        while (item := await inbox.get()) is not None:
+            try:
+                result = await func(item)
+            except Exception as e:
+                # 1件の失敗でパイプライン全体を止めない
+                self.failed[name] += 1
+                self.failed_doc_ids.add(item.docID)
+                METRICS.inc("pipeline_items_total", stage=name, outcome="failed")
+                self.logger.error(f"[FAIL] {name} {item.docID}: {e}")
+                continue
+
+            self.processed[name] += 1
+            METRICS.inc("pipeline_items_total", stage=name, outcome="processed")
+            await self.queues[outbox].put(result)
+
+    async def work_batch(
+        self,
+        name: str,
+        func: Callable[[list], Awaitable[list]],
+        outbox: list,
+        batch_size: int,
+    ):
+        """キューに溜まっている分を最大batch_size件まとめて処理する"""
+        inbox = self.queues[name]
+        finished = False
+        while not finished:
+            batch = []
+            item = await inbox.get()
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= batch_size or inbox.empty():
+                    break
+                item = inbox.get_nowait()
+            finished = item is None
+            if not batch:
+                continue
+
+            try:
+                results = await func(batch)
+            except Exception as e:
+                self.failed[name] += len(batch)
+                self.failed_doc_ids.update(db_item.docID for db_item in batch)
+                METRICS.inc(
+                    "pipeline_items_total", len(batch), stage=name, outcome="failed"
+                )
+                self.logger.error(f"[FAIL] {name} {len(batch)} items: {e}")
+                continue
+
+            self.processed[name] += len(results)
+            METRICS.inc(
+                "pipeline_items_total", len(results), stage=name, outcome="processed"
+            )
+            outbox.extend(results)
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.logger.info(
+                f"[PIPELINE] queue_depths={self.queue_depths()} "
+                f"processed={dict(self.processed)}"
+            )
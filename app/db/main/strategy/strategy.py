@@ -1,20 +1,40 @@
 from abc import abstractmethod
-from dataclasses import asdict, dataclass
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
 import json
 import logging
+import multiprocessing
 import os
-from typing import override
+import time
+from typing import Awaitable, Callable, Optional, override
 import boto3
 from botocore.exceptions import ClientError
 import asyncio
 import aiohttp
 import aiofiles
-import requests
-from tenacity import retry, stop_after_attempt, wait_fixed
 from boto3.session import Session
 
+from common.main.lib.log_utils import SampledLog, SkipCounter
+from common.main.lib.metrics import METRICS
+from common.main.lib.rate_limiter import AdaptiveRateLimiter
+from common.main.lib.retry_policy import DecorrelatedJitter, retry_policy
 from common.main.lib.utils import Utils
+from db.main.lib.catalog import DocumentCatalog
+from db.main.lib.credential_cache import ApiKeyCache
+from db.main.lib.download_scheduler import (
+    DownloadPolicy,
+    DownloadScheduler,
+    FileTask,
+)
+from db.main.lib.edinet_client import EdinetClient
+from db.main.lib.facts import FactsStore, extract_document_facts
+from db.main.lib.ingested_index import IngestedIndex
+from db.main.lib.manifest import IngestionManifest
+from db.main.lib.partial_download import PartialDownload
+from db.main.lib.response_cache import DocumentListCache
 from db.main.model.edinet.document_item import DbItem, FileInfo, Results
+from db.main.model.edinet.document_list_response_type1 import DocumentListResponseType1
 from db.main.model.edinet.document_list_response_type2 import DocumentListResponseType2
 from db.main.model.edinet.edinet_enums import DocType
 
@@ -34,7 +54,7 @@ class CreateAwsSession(Strategy):
 
     @override
     @Utils.log_exception
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(1))
+    @retry_policy()
     def execute(self):
         return boto3.Session(profile_name=self.profile_name)
 
@@ -45,22 +65,31 @@ class GetApiKeyFromAws(Strategy):
     secret_name: str
     key_name: str
     region_name: str
+    cache: Optional[ApiKeyCache] = None
+    refresh: bool = False  # キャッシュを使わずに取得し直す
     client = None
 
-    def __post_init__(self):
-        self.client = self.aws_session.client(
-            service_name="secretsmanager", region_name=self.region_name
-        )
-
     @override
     @Utils.log_exception
     def execute(self):
-        secret = self.get_secret()
-        return json.loads(secret)[self.key_name]
+        if self.cache is not None and not self.refresh:
+            apikey = self.cache.get(self.secret_name)
+            if apikey:
+                return apikey
+
+        apikey = json.loads(self.get_secret())[self.key_name]
+        if self.cache is not None:
+            self.cache.put(self.secret_name, apikey)
+        return apikey
 
     @Utils.exception
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(1))
+    @retry_policy("secretsmanager")
     def get_secret(self):
+        # キャッシュが有効な間はクライアントを作らない
+        if self.client is None:
+            self.client = self.aws_session.client(
+                service_name="secretsmanager", region_name=self.region_name
+            )
         get_secret_value_response = self.client.get_secret_value(
             SecretId=self.secret_name
         )
@@ -70,22 +99,106 @@ class GetApiKeyFromAws(Strategy):
 @dataclass
 class GetDocumentListFromEdiNetApi(Strategy):
     type: str
-    api_key: str
+    client: EdinetClient
     yyyymmdd: str  # yyyy-mm-dd
-    endpoint: str = "https://api.edinet-fsa.go.jp/api/v2/documents.json"
+    cache: Optional[DocumentListCache] = None
+    revalidate: bool = True  # 期限切れのキャッシュをtype=1の件数で再検証する
 
     @override
     @Utils.log_exception
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(1))
-    def execute(self):
-        params = {
-            "date": self.yyyymmdd,
-            "type": self.type,
-            "Subscription-Key": self.api_key,
-        }
-        res = requests.get(self.endpoint, params=params)
-        res.raise_for_status()
-        return DocumentListResponseType2(**res.json())
+    async def execute(self):
+        if self.cache is None:
+            return DocumentListResponseType2(**await self.request(self.type))
+
+        # 数MBのJSONを読み書きするため、イベントループを塞がないようスレッドで行う
+        payload = await asyncio.to_thread(self.cache.get, self.yyyymmdd, self.type)
+        if payload is None and self.revalidate:
+            payload = await self.revalidate_cache()
+        if payload is None:
+            payload = await self.request(self.type)
+            await asyncio.to_thread(self.cache.put, self.yyyymmdd, self.type, payload)
+        return DocumentListResponseType2(**payload)
+
+    async def revalidate_cache(self) -> Optional[dict]:
+        """
+        期限切れのキャッシュを、メタデータのみのtype=1で再検証する。
+        件数が変わっていなければキャッシュの期限を延ばして使い回す。
+        """
+        stale = await asyncio.to_thread(self.cache.get_stale, self.yyyymmdd, self.type)
+        if stale is None:
+            return None
+
+        metadata = DocumentListResponseType1(**await self.request("1")).metadata
+        if metadata.resultset.count != stale["metadata"]["resultset"]["count"]:
+            return None
+
+        self.logger.info(f"[HIT] {self.yyyymmdd} is not modified.")
+        self.cache.touch(self.yyyymmdd, self.type)
+        return stale
+
+    @Utils.exception
+    @retry_policy("edinet")
+    async def request(self, type: str) -> dict:
+        return await self.client.get_document_list(self.yyyymmdd, type=type)
+
+
+@dataclass
+class GetDocumentListMetadataFromEdiNetApi(Strategy):
+    """書類一覧APIをtype=1で呼び、件数などのメタデータのみを取得する"""
+
+    client: EdinetClient
+    yyyymmdd: str  # yyyy-mm-dd
+
+    @override
+    @Utils.exception
+    async def execute(self) -> DocumentListResponseType1:
+        strategy = GetDocumentListFromEdiNetApi(
+            type="1", client=self.client, yyyymmdd=self.yyyymmdd
+        )
+        return DocumentListResponseType1(**await strategy.request("1"))
+
+
+@dataclass
+class GetDocumentListsFromEdiNetApi(Strategy):
+    """
+    複数日の書類一覧を、同時実行数を制限しながら先読みして日付順に返す。
+    先読みは concurrency 日分までに抑え、処理待ちの一覧がメモリに溜まり続けないようにする。
+    """
+
+    type: str
+    client: EdinetClient
+    dates: list[str]  # yyyy-mm-dd
+    concurrency: int = 4
+    cache: Optional[DocumentListCache] = None
+
+    @override
+    async def execute(self):
+        dates = iter(self.dates)
+        pending: deque[tuple[str, asyncio.Task]] = deque()
+
+        def schedule_next():
+            yyyymmdd = next(dates, None)
+            if yyyymmdd is not None:
+                pending.append((yyyymmdd, asyncio.create_task(self.fetch(yyyymmdd))))
+
+        for _ in range(self.concurrency):
+            schedule_next()
+
+        try:
+            while pending:
+                yyyymmdd, task = pending.popleft()
+                schedule_next()
+                yield yyyymmdd, await task
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    @Utils.exception
+    async def fetch(self, yyyymmdd: str) -> DocumentListResponseType2:
+        strategy = GetDocumentListFromEdiNetApi(
+            type=self.type, client=self.client, yyyymmdd=yyyymmdd, cache=self.cache
+        )
+        return await strategy.execute()
 
 
 @dataclass
@@ -94,101 +207,263 @@ class GetItemsFromDocumentListReaponse(Strategy):
 
     @override
     @Utils.log_exception
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(1))
     def execute(self) -> list[Results]:
         self.document_list_response.filter_valid_result_items()
         return self.document_list_response
 
 
 @dataclass
-class DownloadDocumentFromEdiNetApi(Strategy):
-    api_key: str
-    documentlist: DocumentListResponseType2
-    work_dir: str
-    endpoint: str = "https://api.edinet-fsa.go.jp/api/v2/documents/"
+class DropDuplicateDocuments(Strategy):
+    """
+    既に他の日付で取り込んだdocIDを書類一覧から除外する。
+    書類が修正されると修正日の一覧にも同じdocIDが現れるため、二重にダウンロードしないようにする。
+    """
+
+    document_list_response: DocumentListResponseType2
+    seen_doc_ids: set[str]
 
     @override
     @Utils.log_exception
-    async def execute(self):
-        async with aiohttp.ClientSession() as session:
-            tasks = [
-                self.download(session, result)
-                for result in self.documentlist.results[:10]
-            ]
-            db_items: list[DbItem] = await asyncio.gather(*tasks)
-            return db_items
+    def execute(self) -> DocumentListResponseType2:
+        skips = SkipCounter(logger=self.logger)
+        results = []
+        for result in self.document_list_response.results:
+            if result.docID in self.seen_doc_ids:
+                skips.skip("already_ingested", result.docID)
+                continue
+            results.append(result)
+        self.document_list_response.results = results
+        skips.report()
+        return self.document_list_response
 
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(1))
-    async def download(self, session: aiohttp.ClientSession, results: Results):
 
-        db_item = DbItem(**asdict(results))
+@dataclass
+class DropIngestedDocuments(Strategy):
+    """
+    取り込み済みの索引(ブルームフィルタ)にある書類を、ダウンロードの前に書類一覧から除く。
+    索引には偽陽性があるため、「あるかもしれない」書類だけをDynamoDBで確かめ、未登録だった書類は残す。
+    索引に「ない」書類はDynamoDBに問い合わせない。
+    """
 
-        url = f"{self.endpoint}/{db_item.docID}"
+    document_list_response: DocumentListResponseType2
+    index: IngestedIndex
+    inserter: "BatchInsertItemsToDynamoDb"  # 登録済みかの確認(BatchGetItem)に使う
 
-        param = {
-            "Subscription-Key": self.api_key,
-        }
+    @override
+    @Utils.log_exception
+    def execute(self) -> DocumentListResponseType2:
+        results = self.document_list_response.results
+        candidates = [
+            (result.docID, result.submitDateTime)
+            for result in results
+            if self.index.might_contain(result.docID, result.submitDateTime)
+        ]
+        existing = self.inserter.existing_keys(candidates) if candidates else set()
+        METRICS.inc(
+            "ingested_index_lookups_total",
+            len(results) - len(candidates),
+            result="absent",
+        )
+        METRICS.inc("ingested_index_lookups_total", len(existing), result="present")
+        METRICS.inc(
+            "ingested_index_lookups_total",
+            len(candidates) - len(existing),
+            result="false_positive",
+        )
 
-        save_dir = f"{self.work_dir}/{db_item.edinetCode}/{db_item.submitDateTime}/{db_item.docID}"
-        os.makedirs(save_dir, exist_ok=True)
+        skips = SkipCounter(logger=self.logger)
+        kept = []
+        for result in results:
+            if (result.docID, result.submitDateTime) in existing:
+                skips.skip("already_ingested", result.docID)
+                continue
+            kept.append(result)
+        self.document_list_response.results = kept
+        skips.report()
+        return self.document_list_response
 
-        if db_item.has_xbrl():
-            filepath: str = f"{save_dir}/{DocType.XBRL.name}.zip"
-            is_success = await self.save(
-                session=session, url=url, param=param | {"type": "1"}, filepath=filepath
-            )
-            if is_success:
-                db_item.xbrl_info = FileInfo(filepath=filepath)
 
-        if db_item.has_pdf():
-            filepath: str = f"{save_dir}/{DocType.PDF.name}.zip"
-            is_success = await self.save(
-                session=session, url=url, param=param | {"type": "2"}, filepath=filepath
-            )
-            if is_success:
-                db_item.pdf_info = FileInfo(filepath=filepath)
+@dataclass
+class DownloadDocumentFromEdiNetApi(Strategy):
+    client: EdinetClient
+    documentlist: DocumentListResponseType2
+    work_dir: str
+    limit: Optional[int] = None  # 指定した件数だけダウンロードする(動作確認用)
+    # 全てのリクエストが通過するリミッタ。複数日を処理する場合は同じインスタンスを渡す
+    rate_limiter: AdaptiveRateLimiter = field(default_factory=AdaptiveRateLimiter)
+    manifest: Optional[IngestionManifest] = None  # 指定すると取得済みのファイルを飛ばす
+    policy: DownloadPolicy = field(default_factory=DownloadPolicy)
+    workers: int = 8  # 同時にダウンロードするファイル数
+    # Trueなら一時ファイルに書き込んで検証してから置き換える(途中で切れた場合は続きから取得する)
+    atomic: bool = True
 
-        if db_item.has_attachdoc():
-            filepath: str = f"{save_dir}/{DocType.ATTACH.name}.zip"
-            is_success = await self.save(
-                session=session, url=url, param=param | {"type": "4"}, filepath=filepath
-            )
-            if is_success:
-                db_item.english_info = FileInfo(filepath=filepath)
+    partials: dict[str, PartialDownload] = field(default_factory=dict, init=False)
 
-        if db_item.has_englishdoc():
-            filepath: str = f"{save_dir}/{DocType.ENGLISH.name}.zip"
-            is_success = await self.save(
-                session=session, url=url, param=param | {"type": "4"}, filepath=filepath
-            )
-            if is_success:
-                db_item.english_info = FileInfo(filepath=filepath)
+    # ファイルごとのログは間引いて出す
+    done_log = SampledLog(logger=Strategy.logger)
+    skip_log = SampledLog(logger=Strategy.logger)
+
+    @override
+    @Utils.log_exception
+    async def execute(self) -> list[DbItem]:
+        db_items: list[DbItem] = []
 
-        if db_item.has_csv():
-            filepath: str = f"{save_dir}/{DocType.CSV.name}.zip"
-            is_success = await self.save(
-                session=session, url=url, param=param | {"type": "5"}, filepath=filepath
+        async def collect(db_item: DbItem, ok: bool):
+            if ok:
+                db_items.append(db_item)
+
+        await self.download_all(
+            self.documentlist.results[: self.limit],
+            scheduler=DownloadScheduler(policy=self.policy),
+            on_done=collect,
+        )
+        return db_items
+
+    async def download_all(
+        self,
+        results: list[Results],
+        scheduler: DownloadScheduler,
+        on_done: Callable[[DbItem, bool], Awaitable[None]],
+        workers: Optional[int] = None,
+    ):
+        """
+        書類を(書類, 種類)ごとのダウンロードに分けてスケジューラに登録し、優先度順に取得する。
+        書類はスケジューラのwindow件ずつ先読みして登録する。
+        取得するファイルがない(全て取得済みの)書類はすぐにon_doneに渡す。
+        """
+        await scheduler.run(
+            results,
+            plan=self.plan,
+            fetch=self.fetch,
+            on_done=on_done,
+            workers=workers or self.workers,
+        )
+
+    def plan(self, results: Results) -> tuple[DbItem, list[tuple[DocType, str]]]:
+        """書類の保存先を用意し、取得が必要なファイル(種類, 保存先)を返す"""
+        db_item = DbItem(**asdict(results))
+        files = []
+        for doc_type in DocType:
+            if not db_item.has_doctype(doc_type):
+                continue
+            filepath = self.prepare(db_item, doc_type)
+            if filepath:
+                files.append((doc_type, filepath))
+        return db_item, files
+
+    def prepare(self, db_item: DbItem, doc_type: DocType) -> Optional[str]:
+        """保存先を用意して返す。取得済みのファイルはファイル情報だけ設定してNoneを返す"""
+        save_dir = f"{self.work_dir}/{db_item.edinetCode}/{db_item.submitDateTime}/{db_item.docID}"
+        os.makedirs(save_dir, exist_ok=True)
+
+        filepath: str = f"{save_dir}/{doc_type.name}.zip"
+        if self.manifest and self.manifest.is_downloaded(
+            doc_id=db_item.docID, doc_type=doc_type.name, filepath=filepath
+        ):
+            self.skip_log(f"[SKIP] {filepath} is already downloaded.")
+            db_item.set_info(doc_type, FileInfo(filepath=filepath))
+            return None
+        return filepath
+
+    async def download_one(self, db_item: DbItem, doc_type: DocType):
+        """1ファイルだけ取得する(分散モードのワーカーが作業ごとに呼ぶ)"""
+        filepath = self.prepare(db_item, doc_type)
+        if filepath:
+            await self.fetch(
+                FileTask(
+                    priority=self.policy.priority_of(db_item, doc_type),
+                    seq=0,
+                    db_item=db_item,
+                    doc_type=doc_type,
+                    filepath=filepath,
+                )
             )
-            if is_success:
-                db_item.csv_info = FileInfo(filepath=filepath)
 
-        return db_item
+    async def fetch(self, task: FileTask):
+        is_success = await self.save(
+            doc_id=task.db_item.docID,
+            type=task.doc_type.api_type,
+            filepath=task.filepath,
+        )
+        if is_success:
+            task.db_item.set_info(task.doc_type, FileInfo(filepath=task.filepath))
+            if self.manifest:
+                await asyncio.to_thread(
+                    self.manifest.record_download,
+                    doc_id=task.db_item.docID,
+                    doc_type=task.doc_type.name,
+                    filepath=task.filepath,
+                )
 
     @Utils.exception
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(1))
-    async def save(
-        self, session: aiohttp.ClientSession, url: str, param: dict, filepath: str
-    ) -> bool:
-        async with session.get(url, params=param) as response:
-            response.raise_for_status()
-            async with aiofiles.open(f"{filepath}", "wb") as f:
-                async for chunk in response.content.iter_chunked(8192):
-                    await f.write(chunk)
-
-        self.logger.info(f"[DONE] download [{filepath}]")
+    @retry_policy("edinet")
+    async def save(self, doc_id: str, type: str, filepath: str) -> bool:
+        if self.atomic:
+            await self.save_atomic(doc_id=doc_id, type=type, filepath=filepath)
+        else:
+            async with self.rate_limiter.slot() as ticket:
+                async with self.client.get_document(doc_id, type=type) as response:
+                    ticket.observe(
+                        status=response.status,
+                        retry_after=self.parse_retry_after(response),
+                    )
+                    response.raise_for_status()
+                    async with aiofiles.open(f"{filepath}", "wb") as f:
+                        await self.write_body(response, f, type=type)
+
+        self.done_log(f"[DONE] download [{filepath}]")
 
         return True
 
+    async def save_atomic(self, doc_id: str, type: str, filepath: str):
+        """
+        一時ファイル({filepath}.part)に書き込み、zipとして完全なことを確かめてから置き換える。
+        再試行(retry_policyによる呼び直し)では、受信済みの分をRangeで飛ばして続きから取得する。
+        """
+        partial = self.partials.get(filepath)
+        if partial is None:
+            # 前回の実行で残った一時ファイルは、内容が同じか確かめられないので捨てる
+            partial = self.partials[filepath] = PartialDownload(filepath=filepath)
+            partial.reset()
+
+        async with self.rate_limiter.slot() as ticket:
+            async with self.client.get_document(
+                doc_id, type=type, headers=partial.request_headers()
+            ) as response:
+                ticket.observe(
+                    status=response.status,
+                    retry_after=self.parse_retry_after(response),
+                )
+                if response.status == 416:
+                    partial.reset()
+                    raise aiohttp.ClientPayloadError(f"range of {filepath} is stale")
+                response.raise_for_status()
+
+                mode, offset = partial.start(response)
+                if offset:
+                    METRICS.inc("download_resumed_total", type=type)
+                    METRICS.inc("download_resumed_bytes_total", offset, type=type)
+                async with aiofiles.open(partial.part_path, mode) as f:
+                    await self.write_body(response, f, type=type)
+
+        await asyncio.to_thread(partial.complete)
+        del self.partials[filepath]
+
+    @staticmethod
+    async def write_body(response: aiohttp.ClientResponse, f, type: str):
+        async for chunk in response.content.iter_chunked(8192):
+            await f.write(chunk)
+            METRICS.inc("download_bytes_total", len(chunk), type=type)
+
+    @staticmethod
+    def parse_retry_after(response: aiohttp.ClientResponse) -> Optional[float]:
+        """Retry-Afterヘッダ(秒数指定のみ対応)を読み取る"""
+        value = response.headers.get("Retry-After")
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None
+
 
 @dataclass
 class UploadToAwsS3(Strategy):
@@ -196,6 +471,13 @@ class UploadToAwsS3(Strategy):
     db_items: list[DbItem]
     region_name: str
     buclet = None
+    manifest: Optional[IngestionManifest] = (
+        None  # 指定するとアップロード済みのファイルを飛ばす
+    )
+
+    # ファイルごとのログは間引いて出す
+    done_log = SampledLog(logger=Strategy.logger)
+    skip_log = SampledLog(logger=Strategy.logger)
 
     def __post_init__(self):
         resource = self.aws_session.resource("s3")
@@ -211,22 +493,52 @@ class UploadToAwsS3(Strategy):
     @Utils.exception
     async def upload(self, item: DbItem):
 
-        for info in item.get_infolist():
-            if info.filepath:
-                await self.save(info=info)
+        for doc_type, info in item.get_infoitems():
+            if not info.filepath:
+                continue
+
+            # 取得済みの判定(ファイルのサイズの確認)と記録はファイルI/Oなので、イベントループの外で行う
+            if self.manifest and await asyncio.to_thread(
+                self.manifest.is_uploaded,
+                doc_id=item.docID,
+                doc_type=doc_type.name,
+                filepath=info.filepath,
+            ):
+                self.skip_log(f"[SKIP] {info.filepath} is already uploaded.")
+                info.cloudpath = self.cloudpath_of(info.filepath)
+                continue
+
+            etag = await self.save(info=info)
+            if self.manifest:
+                await asyncio.to_thread(
+                    self.manifest.record_upload,
+                    doc_id=item.docID,
+                    doc_type=doc_type.name,
+                    etag=etag,
+                    cloudpath=info.cloudpath,
+                )
         return item
 
     @override
     @Utils.exception
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(1))
-    async def save(self, info: FileInfo):
-        async with aiofiles.open(info.filepath, "rb") as f:
-            file_content = await f.read()
-        await asyncio.to_thread(
-            self.bucket.put_object, Key=info.filepath, Body=file_content
-        )
-        self.logger.info(f"[DONE] upload [{info.filepath}]")
-        info.cloudpath = f"s3://{self.bucket.name}.s3.{self.region_name}.amazonaws.com/{info.filepath}"
+    @retry_policy("s3")
+    async def save(self, info: FileInfo) -> str:
+        def put_object():
+            # ファイル全体をメモリに読み込まず、ファイルオブジェクトから送る
+            with open(info.filepath, "rb") as f:
+                response = self.bucket.meta.client.put_object(
+                    Bucket=self.bucket.name, Key=info.filepath, Body=f
+                )
+                return response, os.fstat(f.fileno()).st_size
+
+        response, size = await asyncio.to_thread(put_object)
+        METRICS.inc("upload_bytes_total", size)
+        self.done_log(f"[DONE] upload [{info.filepath}]")
+        info.cloudpath = self.cloudpath_of(info.filepath)
+        return response["ETag"]
+
+    def cloudpath_of(self, filepath: str) -> str:
+        return f"s3://{self.bucket.name}.s3.{self.region_name}.amazonaws.com/{filepath}"
 
 
 @dataclass
@@ -234,6 +546,9 @@ class InsertItemsToDynamoDb(Strategy):
     aws_session: Session
     items: list[DbItem]
     target_table: str
+    catalog: Optional[DocumentCatalog] = None  # 指定するとローカルカタログにも書き込む
+
+    skip_log = SampledLog(logger=Strategy.logger)  # 書類ごとのログは間引いて出す
 
     def __post_init__(self):
         resource = self.aws_session.resource("dynamodb")
@@ -242,16 +557,26 @@ class InsertItemsToDynamoDb(Strategy):
     @override
     @Utils.log_exception
     def execute(self):
-        for item in self.items:
-            if not self.doc_id_exists(
-                doc_id=item.docID, submit_date_time=item.submitDateTime
-            ):
-                self.insert(asdict(item))
-            else:
-                self.logger.info(f"[SKIP]{item.docID} is already exists.")
+        self.insert_items(self.items)
+
+    def insert_items(self, items: list[DbItem]) -> list[DbItem]:
+        items = [self.insert_item(item) for item in items]
+        if self.catalog:
+            self.catalog.upsert(items)
+        return items
+
+    def insert_item(self, item: DbItem) -> DbItem:
+        """未登録の書類であれば1件登録する"""
+        if not self.doc_id_exists(
+            doc_id=item.docID, submit_date_time=item.submitDateTime
+        ):
+            self.insert(asdict(item))
+        else:
+            self.skip_log(f"[SKIP]{item.docID} is already exists.")
+        return item
 
     @Utils.exception
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(1))
+    @retry_policy("dynamodb")
     def doc_id_exists(self, doc_id, submit_date_time):
         """
         指定されたdocIDがGSIに存在するかを確認する。
@@ -267,6 +592,335 @@ class InsertItemsToDynamoDb(Strategy):
             return False
 
     @Utils.exception
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(1))
+    @retry_policy("dynamodb", idempotent=False)
     def insert(self, item):
         self.table.put_item(Item=item)
+
+
+@dataclass
+class BatchInsertItemsToDynamoDb(Strategy):
+    """
+    DynamoDBへまとめて登録する。
+    - 既定: BatchGetItem(100件ずつ)で存在確認し、未登録分をBatchWriteItem(25件ずつ)で登録する
+    - conditional_put=True: 読み込みを行わず、attribute_not_exists付きのput_itemで登録する
+    未処理(Unprocessed)で返ってきた分はDecorrelated Jitterで間隔を散らして再送する。
+    """
+
+    aws_session: Session
+    items: list[DbItem]
+    target_table: str
+    conditional_put: bool = False
+    endpoint_url: Optional[str] = None  # DynamoDB Local等に接続する場合に指定
+    catalog: Optional[DocumentCatalog] = None  # 指定するとローカルカタログにも書き込む
+    index: Optional[IngestedIndex] = (
+        None  # 指定すると登録した書類を取り込み済みの索引に加える
+    )
+    max_attempts: int = 5
+    base_delay: float = 0.05
+    max_delay: float = 5.0
+
+    skip_log = SampledLog(logger=Strategy.logger)  # 書類ごとのログは間引いて出す
+
+    GET_CHUNK_SIZE = 100
+    WRITE_CHUNK_SIZE = 25
+    KEYS = ("docID", "submitDateTime")
+
+    def __post_init__(self):
+        self.resource = self.aws_session.resource(
+            "dynamodb", endpoint_url=self.endpoint_url
+        )
+        self.table = self.resource.Table(self.target_table)
+
+    @override
+    @Utils.log_exception
+    def execute(self) -> list[DbItem]:
+        return self.insert_items(self.items)
+
+    def insert_items(self, items: list[DbItem]) -> list[DbItem]:
+        """未登録の書類のみ登録し、渡された書類をそのまま返す"""
+        # 同じキーを1リクエストに含めるとValidationExceptionになるため先に除く
+        unique = list({self.key_of(item): item for item in items}.values())
+
+        if self.conditional_put:
+            for item in unique:
+                self.put_if_not_exists(item)
+        else:
+            existing = self.existing_keys([self.key_of(item) for item in unique])
+            new_items = [item for item in unique if self.key_of(item) not in existing]
+            skips = SkipCounter(logger=self.logger)
+            for item in unique:
+                if self.key_of(item) in existing:
+                    skips.skip("already_exists", item.docID)
+            skips.report()
+
+            for start in range(0, len(new_items), self.WRITE_CHUNK_SIZE):
+                self.write(new_items[start : start + self.WRITE_CHUNK_SIZE])
+
+        if self.catalog:
+            self.catalog.upsert(unique)
+        if self.index:
+            self.index.add_all(self.key_of(item) for item in unique)
+        return items
+
+    @classmethod
+    def key_of(cls, item: DbItem) -> tuple[str, str]:
+        return item.docID, item.submitDateTime
+
+    @Utils.exception
+    def existing_keys(self, keys: list[tuple[str, str]]) -> set[tuple[str, str]]:
+        """BatchGetItemで登録済みのキーを返す"""
+        existing = set()
+        for start in range(0, len(keys), self.GET_CHUNK_SIZE):
+            request = {
+                self.target_table: {
+                    "Keys": [
+                        dict(zip(self.KEYS, key))
+                        for key in keys[start : start + self.GET_CHUNK_SIZE]
+                    ],
+                    "ProjectionExpression": ", ".join(self.KEYS),
+                }
+            }
+            jitter = DecorrelatedJitter(base=self.base_delay, cap=self.max_delay)
+            for attempt in range(self.max_attempts):
+                response = self.batch_get_item(request)
+                for found in response["Responses"].get(self.target_table, []):
+                    existing.add(tuple(found[key] for key in self.KEYS))
+                request = response.get("UnprocessedKeys")
+                if not request:
+                    break
+                self.backoff(jitter)
+            else:
+                raise RuntimeError(
+                    f"BatchGetItem left unprocessed keys after {self.max_attempts} attempts."
+                )
+        return existing
+
+    @Utils.exception
+    def write(self, items: list[DbItem]):
+        """BatchWriteItem(最大25件)で登録する"""
+        request = {
+            self.target_table: [
+                {"PutRequest": {"Item": asdict(item)}} for item in items
+            ]
+        }
+        jitter = DecorrelatedJitter(base=self.base_delay, cap=self.max_delay)
+        for attempt in range(self.max_attempts):
+            response = self.batch_write_item(request)
+            request = response.get("UnprocessedItems")
+            if not request:
+                self.logger.info(f"[DONE] insert {len(items)} items.")
+                return
+            self.backoff(jitter)
+        raise RuntimeError(
+            f"BatchWriteItem left unprocessed items after {self.max_attempts} attempts."
+        )
+
+    # 条件付き書き込みなので、再送しても既存の項目を上書きしない
+    @Utils.exception
+    @retry_policy("dynamodb")
+    def put_if_not_exists(self, item: DbItem):
+        try:
+            self.table.put_item(
+                Item=asdict(item),
+                ConditionExpression="attribute_not_exists(docID)",
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            self.skip_log(f"[SKIP]{item.docID} is already exists.")
+
+    @retry_policy("dynamodb")
+    def batch_get_item(self, request: dict) -> dict:
+        return self.resource.batch_get_item(RequestItems=request)
+
+    @retry_policy("dynamodb")
+    def batch_write_item(self, request: dict) -> dict:
+        # 未処理分は応答で返されるため、同じ要求の再送で重複登録にはならない
+        return self.resource.batch_write_item(RequestItems=request)
+
+    def backoff(self, jitter: DecorrelatedJitter):
+        time.sleep(jitter.next())
+
+
+@dataclass
+class MergeFileInfoToDynamoDb(Strategy):
+    """
+    (書類, 種類)ごとにDynamoDBへ登録する(分散モード用)。
+    同じ書類の別の種類は別のワーカーが並行して登録するため、項目を丸ごと置き換えるputではなく、
+    update_itemで書類の属性とその種類のファイル情報だけを書き込む(何度書き込んでも同じ結果になる)。
+    """
+
+    aws_session: Session
+    target_table: str
+    items: list[tuple[DbItem, DocType]] = field(default_factory=list)
+    endpoint_url: Optional[str] = None  # DynamoDB Local等に接続する場合に指定
+    catalog: Optional[DocumentCatalog] = None  # 指定するとローカルカタログにも書き込む
+    index: Optional[IngestedIndex] = (
+        None  # 指定すると登録した書類を取り込み済みの索引に加える
+    )
+
+    KEYS = BatchInsertItemsToDynamoDb.KEYS
+
+    def __post_init__(self):
+        self.resource = self.aws_session.resource(
+            "dynamodb", endpoint_url=self.endpoint_url
+        )
+        self.table = self.resource.Table(self.target_table)
+
+    @override
+    @Utils.log_exception
+    def execute(self) -> list[DbItem]:
+        return [self.merge(db_item, doc_type) for db_item, doc_type in self.items]
+
+    @Utils.exception
+    def merge(self, db_item: DbItem, doc_type: DocType) -> DbItem:
+        self.update_item(db_item, doc_type)
+        if self.catalog:
+            self.catalog.upsert([db_item])
+        if self.index:
+            self.index.add_all([(db_item.docID, db_item.submitDateTime)])
+        return db_item
+
+    @retry_policy("dynamodb")
+    def update_item(self, db_item: DbItem, doc_type: DocType):
+        infos = set(DbItem.INFO_ATTRIBUTES.values())
+        attributes = {
+            name: value
+            for name, value in asdict(db_item).items()
+            if name not in self.KEYS and name not in infos
+        }
+        info = db_item.get_info(doc_type)
+        if info is not None:
+            attributes[DbItem.INFO_ATTRIBUTES[doc_type]] = asdict(info)
+
+        self.table.update_item(
+            Key={key: getattr(db_item, key) for key in self.KEYS},
+            UpdateExpression="SET "
+            + ", ".join(f"#a{i} = :v{i}" for i in range(len(attributes))),
+            ExpressionAttributeNames={
+                f"#a{i}": name for i, name in enumerate(attributes)
+            },
+            ExpressionAttributeValues={
+                f":v{i}": value for i, value in enumerate(attributes.values())
+            },
+        )
+
+
+@dataclass
+class GetIngestedIndexFromAwsS3(Strategy):
+    """S3に共有された取り込み済みの索引を、手元の索引に取り込む(なければ何もしない)"""
+
+    aws_session: Session
+    index: IngestedIndex
+
+    def __post_init__(self):
+        self.bucket = self.aws_session.resource("s3").Bucket("irir-project")
+
+    @override
+    @Utils.log_exception
+    @retry_policy("s3")
+    def execute(self) -> bool:
+        try:
+            response = self.bucket.meta.client.get_object(
+                Bucket=self.bucket.name, Key=self.index.path
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                raise
+            return False
+        self.index.merge(response["Body"].read())
+        return True
+
+
+@dataclass
+class PutIngestedIndexToAwsS3(Strategy):
+    """
+    取り込み済みの索引をS3に保存する。
+    他のマシンが先に保存した分を失わないよう、S3上の索引を取り込んでから上書きする。
+    merge=Falseなら取り込まずに上書きする(カタログから作り直した場合)。
+    """
+
+    aws_session: Session
+    index: IngestedIndex
+    merge: bool = True
+
+    def __post_init__(self):
+        self.bucket = self.aws_session.resource("s3").Bucket("irir-project")
+
+    @override
+    @Utils.log_exception
+    @retry_policy("s3")
+    def execute(self):
+        if self.merge:
+            GetIngestedIndexFromAwsS3(
+                aws_session=self.aws_session, index=self.index
+            ).execute()
+        self.bucket.meta.client.put_object(
+            Bucket=self.bucket.name, Key=self.index.path, Body=self.index.to_bytes()
+        )
+
+
+@dataclass
+class ExtractFactsFromDocuments(Strategy):
+    """
+    ダウンロード済みのCSV.zip/XBRL.zipからファクトを取り出し、日付ごとの列指向ファイルに保存する。
+    zipの展開とUTF-16のCSVのパースはCPU負荷が高いため、プロセスプールで並列に行う。
+    spawnのワーカーは起動のたびにpyarrowなどを読み込み直すため、backfill/watchでは
+    create_executor()で作ったプールを実行全体で使い回す(executorに渡す)。
+    対象がinline_threshold件以下なら、プールを使わずこのプロセスで取り出す。
+    """
+
+    db_items: list[DbItem]
+    store: FactsStore
+    yyyymmdd: str
+    executor: Optional[ProcessPoolExecutor] = None  # Noneなら必要なときだけ一時的に作る
+    max_workers: Optional[int] = None  # Noneなら全コアを使う
+    chunksize: int = 4
+    inline_threshold: int = 4
+
+    @staticmethod
+    def create_executor(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+        # 呼び出し側のスレッドを引き継がないようspawnでワーカーを起動する
+        return ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    @override
+    @Utils.log_exception
+    async def execute(self) -> int:
+        targets = [
+            (
+                item.docID,
+                self.filepath_of(item, DocType.CSV),
+                self.filepath_of(item, DocType.XBRL),
+            )
+            for item in self.db_items
+            if item.get_info(DocType.CSV) or item.get_info(DocType.XBRL)
+        ]
+        if not targets:
+            return 0
+
+        tables = await asyncio.to_thread(self.extract, targets)
+        count = await asyncio.to_thread(self.store.write, self.yyyymmdd, tables)
+        self.logger.info(f"[DONE] extract {count} facts from {len(targets)} documents")
+        return count
+
+    def extract(self, targets: list[tuple]) -> list:
+        if len(targets) <= self.inline_threshold:
+            return [extract_document_facts(*target) for target in targets]
+        if self.executor is not None:
+            return self.map(self.executor, targets)
+        with self.create_executor(self.max_workers) as executor:
+            return self.map(executor, targets)
+
+    def map(self, executor: ProcessPoolExecutor, targets: list[tuple]) -> list:
+        return list(
+            executor.map(
+                extract_document_facts, *zip(*targets), chunksize=self.chunksize
+            )
+        )
+
+    @staticmethod
+    def filepath_of(item: DbItem, doc_type: DocType) -> Optional[str]:
+        info = item.get_info(doc_type)
+        return info.filepath if info else None
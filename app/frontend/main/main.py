@@ -1,3 +1,305 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+import os
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+import requests
+from requests.adapters import HTTPAdapter
 import streamlit as st
+from urllib3.util.retry import Retry
+
+# 書類の検索はバックエンド(FastAPI)に任せ、画面には1ページ分だけを取得する
+backend_url = os.environ.get("IRIR_BACKEND_URL", "http://localhost:8000")
+page_size = 50
+cache_ttl = 300  # 秒。取り込みで書類が増えても、この時間が経てば画面に反映される
+request_timeout = 10.0
+
+# 取得可能な形式(DocTypeの値)と表示名
+FORMATS = {
+    "XBRL": "XBRL",
+    "CSV": "CSV",
+    "PDF": "PDF",
+    "ATTACHED": "添付文書",
+    "ENGLISH": "英文",
+}
+FORMAT_FLAGS = {
+    "XBRL": "xbrlFlag",
+    "CSV": "csvFlag",
+    "PDF": "pdfFlag",
+    "ATTACHED": "attachDocFlag",
+    "ENGLISH": "englishDocFlag",
+}
+# /documents/{doc_id} の、取り込んだファイルの情報(DbItemの*_info)
+FORMAT_INFOS = {
+    "XBRL": "xbrl_info",
+    "CSV": "csv_info",
+    "PDF": "pdf_info",
+    "ATTACHED": "attach_info",
+    "ENGLISH": "english_info",
+}
+DOC_TYPE_CODES = {
+    "": "すべて",
+    "120": "有価証券報告書",
+    "130": "訂正有価証券報告書",
+    "140": "四半期報告書",
+    "160": "半期報告書",
+    "030": "有価証券届出書",
+    "180": "臨時報告書",
+    "220": "自己株券買付状況報告書",
+    "350": "大量保有報告書",
+    "360": "訂正大量保有報告書",
+}
+COLUMNS = {
+    "submitted": "提出日時",
+    "filerName": "提出者",
+    "secCode": "証券コード",
+    "edinetCode": "EDINETコード",
+    "docDescription": "書類名",
+    "formats": "形式",
+    "docID": "docID",
+}
+
+
+@dataclass(frozen=True)
+class Filters:
+    submitted_from: Optional[date] = None
+    submitted_to: Optional[date] = None
+    company: str = ""  # EDINETコード(E+5桁)または証券コード(4〜5桁)
+    doc_type_code: str = ""
+    formats: tuple[str, ...] = ()
+
+    def to_params(self) -> tuple[tuple[str, str], ...]:
+        """バックエンドのクエリパラメータ。キャッシュのキーにするためタプルで返す"""
+        params = []
+        if self.submitted_from:
+            params.append(("submitted_from", self.submitted_from.strftime("%Y%m%d")))
+        if self.submitted_to:
+            params.append(("submitted_to", self.submitted_to.strftime("%Y%m%d")))
+        company = self.company.strip().upper()
+        if company.startswith("E"):
+            params.append(("edinet_code", company))
+        elif company:
+            params.append(("sec_code", company))
+        if self.doc_type_code:
+            params.append(("doc_type_code", self.doc_type_code))
+        params.extend(("has", value) for value in self.formats)
+        return tuple(params)
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """
+    バックエンドへの接続。スクリプトは操作のたびに先頭から実行し直されるため、
+    プロセスで1つだけ作り、コネクションを使い回す。
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=("GET",),
+    )
+    session.mount("http://", HTTPAdapter(pool_maxsize=8, max_retries=retry))
+    session.mount("https://", HTTPAdapter(pool_maxsize=8, max_retries=retry))
+    return session
+
+
+def get_json(path: str, params: tuple[tuple[str, str], ...] = ()) -> dict:
+    response = get_session().get(
+        f"{backend_url}{path}", params=list(params), timeout=request_timeout
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+# ページはフィルタと前ページ末尾のカーソルで決まるため、同じページを開き直しても再取得しない
+@st.cache_data(ttl=cache_ttl, max_entries=512, show_spinner=False)
+def fetch_page(params: tuple[tuple[str, str], ...], cursor: Optional[str]) -> dict:
+    page_params = params + (("limit", str(page_size)),)
+    if cursor:
+        page_params += (("cursor", cursor),)
+    return get_json("/documents", page_params)
+
+
+@st.cache_data(ttl=cache_ttl, max_entries=256, show_spinner=False)
+def fetch_text_search(query: str) -> dict:
+    return get_json("/documents/search", (("q", query), ("limit", str(page_size))))
+
+
+@st.cache_data(ttl=cache_ttl, max_entries=1024, show_spinner=False)
+def fetch_document(doc_id: str) -> dict:
+    return get_json(f"/documents/{doc_id}")
+
+
+def clear_caches():
+    fetch_page.clear()
+    fetch_text_search.clear()
+    fetch_document.clear()
+
+
+def formats_of(item: dict) -> list[str]:
+    return [
+        value
+        for value, flag in FORMAT_FLAGS.items()
+        if str(item.get(flag)) in ("1", "true", "True")
+    ]
+
+
+def stored_formats_of(item: dict) -> list[str]:
+    """実際に取り込まれた形式(締め切りで諦めた形式などは含まない)"""
+    return [value for value, info in FORMAT_INFOS.items() if item.get(info)]
+
+
+def to_row(item: dict) -> dict:
+    submitted = item.get("submitDateTime") or ""
+    # YYYYMMDDThhmm → YYYY-MM-DD hh:mm (提出日時がなく取得日を埋めた書類はYYYYMMDD → YYYY-MM-DD)
+    if len(submitted) >= 13:
+        submitted = f"{submitted[:4]}-{submitted[4:6]}-{submitted[6:8]} {submitted[9:11]}:{submitted[11:13]}"
+    elif len(submitted) == 8:
+        submitted = f"{submitted[:4]}-{submitted[4:6]}-{submitted[6:8]}"
+    return {
+        "submitted": submitted,
+        "filerName": item.get("filerName"),
+        "secCode": item.get("secCode"),
+        "edinetCode": item.get("edinetCode"),
+        "docDescription": item.get("docDescription"),
+        "formats": " / ".join(FORMATS[value] for value in formats_of(item)),
+        "docID": item.get("docID"),
+    }
+
+
+def sidebar_filters() -> tuple[Filters, str]:
+    with st.sidebar:
+        st.header("絞り込み")
+        query = st.text_input(
+            "企業名・書類名で検索", help="入力すると下の条件は使わない"
+        )
+        # 取り込みと同じく日本時間の今日を基準にする
+        today = datetime.now(ZoneInfo("Asia/Tokyo")).date()
+        period = st.date_input(
+            "提出日", value=(today - timedelta(days=7), today), max_value=today
+        )
+        company = st.text_input(
+            "EDINETコード / 証券コード", placeholder="E00001 / 7203"
+        )
+        doc_type_code = st.selectbox(
+            "書類種別",
+            options=list(DOC_TYPE_CODES),
+            format_func=lambda code: DOC_TYPE_CODES[code],
+        )
+        formats = st.multiselect(
+            "取得可能な形式",
+            options=list(FORMATS),
+            format_func=lambda value: FORMATS[value],
+        )
+        if st.button(
+            "最新の状態に更新", help="キャッシュを捨ててバックエンドから取り直す"
+        ):
+            clear_caches()
+
+    # 日付の範囲は片側だけ選ばれている間は1要素のタプルになる
+    submitted_from, submitted_to = (tuple(period) + (None, None))[:2]
+    filters = Filters(
+        submitted_from=submitted_from,
+        submitted_to=submitted_to,
+        company=company,
+        doc_type_code=doc_type_code,
+        formats=tuple(formats),
+    )
+    return filters, query.strip()
+
+
+def pager(params: tuple[tuple[str, str], ...]) -> Optional[str]:
+    """
+    キーセットページングのカーソルを、表示したページの分だけsession_stateに積む。
+    条件が変わったら1ページ目に戻す。
+    (Filtersはスクリプトの再実行ごとに別のクラスになり比較できないため、パラメータで比べる)
+    """
+    state = st.session_state
+    if state.get("params") != params:
+        state.params = params
+        state.cursors = [None]
+    return state.cursors[-1]
+
+
+def show_page(filters: Filters):
+    params = filters.to_params()
+    cursor = pager(params)
+    try:
+        page = fetch_page(params, cursor)
+    except requests.RequestException as e:
+        st.error(f"書類を取得できませんでした: {e}")
+        st.stop()
+
+    cursors = st.session_state.cursors
+    st.caption(f"{len(cursors)}ページ目 ({page['count']}件)")
+    show_table(page["results"])
+
+    previous, following = st.columns(2)
+    if previous.button("前のページ", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if following.button("次のページ", disabled=not page["next_cursor"]):
+        cursors.append(page["next_cursor"])
+        st.rerun()
+
+
+def show_text_search(query: str):
+    try:
+        found = fetch_text_search(query)
+    except requests.RequestException as e:
+        st.error(f"検索できませんでした: {e}")
+        st.stop()
+    # 一致が多すぎる場合、バックエンドは新しい方の一致だけを順位付けする
+    order = "関連度順" if found.get("complete", True) else "新しい一致の中で関連度順"
+    st.caption(f"「{query}」の検索結果 ({found['count']}件、{order})")
+    show_table(found["results"])
+
+
+def show_table(items: list[dict]):
+    if not items:
+        st.info("条件に合う書類はありません。")
+        return
+    selection = st.dataframe(
+        [to_row(item) for item in items],
+        column_config=COLUMNS,
+        hide_index=True,
+        on_select="rerun",
+        selection_mode="single-row",
+    )
+    rows = selection.selection.rows
+    if rows:
+        show_document(items[rows[0]]["docID"])
+
+
+def show_document(doc_id: str):
+    try:
+        item = fetch_document(doc_id)
+    except requests.RequestException as e:
+        st.error(f"{doc_id}を取得できませんでした: {e}")
+        return
+
+    st.subheader(item.get("docDescription") or doc_id)
+    st.write(
+        f"{item.get('filerName')} / 提出 {item.get('submitDateTime')} / "
+        f"期間 {item.get('periodStart') or '-'}〜{item.get('periodEnd') or '-'}"
+    )
+    links = st.columns(len(FORMATS))
+    for column, value in zip(links, FORMATS):
+        column.link_button(
+            FORMATS[value],
+            f"{backend_url}/documents/{doc_id}/files/{value}",
+            disabled=value not in stored_formats_of(item),
+        )
+    with st.expander("すべての項目"):
+        st.json(item)
+
 
-st.write("Hello world")
+st.set_page_config(page_title="EDINET書類", layout="wide")
+st.title("EDINET書類")
+filters, query = sidebar_filters()
+if query:
+    show_text_search(query)
+else:
+    show_page(filters)